@@ -1,7 +1,11 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks
+import time
+# 记录导入开始时间，用于启动耗时报告
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.requests import Request
 import uvicorn
 import os
@@ -9,20 +13,53 @@ import json
 import uuid
 import asyncio
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 import aiofiles
 from pathlib import Path
+from urllib.parse import quote
 
 # 导入业务逻辑模块
 from modules.qa_generator import QAGenerator
 from modules.agent_tester import AgentTester
-from modules.similarity_scorer import SimilarityScorer
-from modules.task_manager import TaskManager
-from modules.file_manager import FileManager
+from modules.similarity_scorer import SimilarityScorer, prewarm_scoring
+from modules.task_manager import TaskManager, QueueFullError
+from modules.file_manager import FileManager, UploadTooLargeError
 from modules.database import Database
+from modules.analysis_cache import AnalysisCache
+from modules.executor import executor, loop_monitor
+from modules.rate_limiter import governor
+from modules.progress import ProgressBroker, ProgressRelay, TaskProgress, TERMINAL_STATUSES
+from modules.maintenance import MaintenanceService
+from modules.health_checker import AgentHealthChecker
+from modules.metrics import metrics
+from modules.profiler import TaskProfiler
+from modules.tracing import tracer, read_slowest_spans
+from modules.usage import token_usage
+from modules.adaptive import AdaptiveEvaluation, DEFAULT_CONFIDENCE, DEFAULT_MIN_SAMPLES
+
+# pandas/sklearn 等重量级依赖在首次使用时导入（分析模块）或在启动后后台预热（评分模块），不计入导入耗时
+startup_report: Dict[str, Any] = {"import_seconds": round(time.perf_counter() - _import_started, 3)}
+prewarm_task: Optional[asyncio.Task] = None
 
 app = FastAPI(title="智能体评估系统", description="智能体API导入、问答对生成、相似度评分系统")
 
+class InFlightMiddleware:
+    """统计正在处理的HTTP请求数（ASGI中间件，不包装响应体，SSE不受影响）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metrics.http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.http_in_flight.dec()
+
+app.add_middleware(InFlightMiddleware)
+
 # 静态文件和模板
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -35,20 +72,219 @@ os.makedirs("templates", exist_ok=True)
 
 # 初始化组件
 db = Database()
-task_manager = TaskManager()
+progress_broker = ProgressBroker()
+task_manager = TaskManager(
+    db,
+    max_workers=4,
+    type_limits={
+        "qa_generation": 2,
+        "dify_test": 2,
+        "similarity_calculation": 2,
+        "full_pipeline": 2
+    },
+    max_queue_depth=100,
+    broker=progress_broker
+)
+# 多个工作进程之间经数据库转发进度事件
+progress_relay = ProgressRelay(progress_broker, db, task_manager.worker_id)
 file_manager = FileManager()
+analysis_cache = AnalysisCache()
+maintenance = MaintenanceService(db, file_manager, analysis_cache)
+
+async def get_agents_config() -> Dict[str, Any]:
+    """读取智能体配置（保存在数据库中，所有工作进程共用）"""
+    return await db.get_setting("agents_config", {})
 
-# 全局变量存储智能体配置
-agents_config = {}
+# 智能体后台健康检查（每 60 秒并发探测一次）
+health_checker = AgentHealthChecker(get_agents_config, interval=60)
+
+async def prewarm_dependencies():
+    """后台预热评分依赖，避免首个评分任务在事件循环中加载 jieba 词典和 sklearn"""
+    try:
+        startup_report["prewarm"] = await executor.run_blocking(prewarm_scoring)
+        print(f"评分依赖预热完成: {startup_report['prewarm']}")
+    except Exception as e:
+        startup_report["prewarm"] = {"error": str(e)}
+        print(f"评分依赖预热失败: {e}")
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库"""
+    global prewarm_task
+    started = time.perf_counter()
+    prewarm_task = asyncio.create_task(prewarm_dependencies())
     try:
         await db.init_db()
         print("数据库初始化成功")
     except Exception as e:
         print(f"数据库初始化失败: {e}")
+    
+    try:
+        # 启动时与输出目录对账一次，之后由任务写入/删除时维护
+        known = await db.get_artifact_stamps()
+        artifacts = await asyncio.to_thread(file_manager.scan_output_files, known)
+        await db.sync_artifacts(artifacts)
+        print(f"产物目录同步完成，共 {len(artifacts)} 个文件")
+    except Exception as e:
+        print(f"产物目录同步失败: {e}")
+    
+    # 启动后台存储清理和事件循环阻塞监控
+    maintenance.start()
+    loop_monitor.start()
+    await progress_relay.start()
+    health_checker.start()
+    
+    # 注册任务执行函数并启动任务队列
+    task_manager.register("qa_generation", instrumented("qa_generation", execute_qa_generation))
+    task_manager.register("dify_test", instrumented("dify_test", execute_dify_test))
+    task_manager.register("similarity_calculation", instrumented("similarity_calculation", execute_similarity_calculation))
+    task_manager.register("full_pipeline", instrumented("full_pipeline", execute_full_pipeline))
+    await task_manager.start()
+    
+    startup_report["init_seconds"] = round(time.perf_counter() - started, 3)
+    startup_report["ready_seconds"] = round(time.perf_counter() - _import_started, 3)
+    startup_report["ready_at"] = datetime.now().isoformat()
+    print(f"启动完成: 导入 {startup_report['import_seconds']}s，初始化 {startup_report['init_seconds']}s，"
+          f"共 {startup_report['ready_seconds']}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台服务"""
+    await task_manager.stop()
+    await progress_relay.stop()
+    await health_checker.stop()
+    await maintenance.stop()
+    await loop_monitor.stop()
+    executor.shutdown()
+    await db.close()
+
+async def register_artifacts(task_id: str, file_paths: List[str]):
+    """将任务生成的输出文件登记到产物目录"""
+    for file_path in file_paths:
+        if os.path.isfile(file_path):
+            await db.upsert_artifact(file_manager.get_artifact_info(file_path, task_id))
+
+async def check_queue_capacity():
+    """队列已满时在保存上传文件之前直接拒绝请求"""
+    depth = await db.count_tasks_by_status("pending")
+    if depth >= task_manager.max_queue_depth:
+        raise HTTPException(
+            status_code=429,
+            detail=str(QueueFullError(depth, task_manager.max_queue_depth)),
+            headers={"Retry-After": "30"}
+        )
+
+async def enqueue_task(task_id: str, task_type: str, parameters: Dict, payload: Dict, priority: int,
+                       profile: bool = False, token_budget: int = 0) -> Dict[str, Any]:
+    """提交任务到队列，profile 为真时在执行期间采样分析，token_budget 大于0时限制任务的令牌用量"""
+    if profile:
+        parameters["profile"] = True
+        payload["profile"] = True
+    if token_budget and token_budget > 0:
+        parameters["token_budget"] = token_budget
+        payload["token_budget"] = token_budget
+    try:
+        await task_manager.create_task(task_type, parameters, payload, priority, task_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"task_id": task_id, "status": "queued"}
+
+def instrumented(task_type: str, handler: Callable) -> Callable:
+    """包装任务执行函数：记录任务追踪和令牌用量；payload 中带 profile 时同时采样分析，未开启时不启动分析器
+
+    payload 中带 token_budget 时，用量达到预算后按取消处理（已完成的部分照常保存），
+    结果中以 stopped_by 标明原因。
+    """
+    async def run(task_id: str, profile: bool = False, token_budget: int = 0, **payload):
+        meter = token_usage.start(
+            task_id, token_budget,
+            lambda: asyncio.ensure_future(task_manager.cancel_task(task_id))
+        )
+        root = tracer.start_trace(
+            task_id, f"task {task_type}", {"task.id": task_id, "task.type": task_type},
+            {"service.instance.id": task_manager.worker_id}
+        )
+        profiler = TaskProfiler(task_id, task_type) if profile else None
+        if profiler:
+            profiler.start()
+        try:
+            if root is None:
+                return await handler(task_id, **payload)
+            with root:
+                result = await handler(task_id, **payload)
+                task = await db.get_task(task_id)
+                root.set_attribute("task.status", task["status"] if task else None)
+                return result
+        finally:
+            await save_usage(task_id, meter)
+            if profiler:
+                profiler.stop()
+                await save_profile(task_id, profiler)
+            if root is not None:
+                await save_trace(task_id)
+    return run
+
+async def save_usage(task_id: str, meter):
+    """把任务的令牌用量报告写入任务结果"""
+    try:
+        fields = {"usage": token_usage.finish(meter)}
+        if meter.exceeded:
+            fields["stopped_by"] = "token_budget"
+        await db.merge_task_result(task_id, fields)
+    except Exception as e:
+        print(f"保存任务 {task_id} 的令牌用量失败: {e}")
+
+async def save_trace(task_id: str):
+    """写完任务的追踪文件，登记为任务产物并写入任务结果"""
+    try:
+        trace_path = await tracer.finish_trace(task_id)
+        if trace_path and os.path.isfile(trace_path):
+            await register_artifacts(task_id, [trace_path])
+            await db.merge_task_result(task_id, {"trace_file": trace_path})
+    except Exception as e:
+        print(f"保存任务 {task_id} 的追踪失败: {e}")
+
+async def save_profile(task_id: str, profiler: TaskProfiler):
+    """保存分析报告和折叠栈文件，登记为任务产物并写入任务结果"""
+    try:
+        files = await executor.run_blocking(profiler.write, "outputs")
+        await register_artifacts(task_id, list(files.values()))
+        await db.merge_task_result(task_id, files)
+        print(f"任务 {task_id} 的性能分析已保存: {files['profile_file']}")
+    except Exception as e:
+        print(f"保存任务 {task_id} 的性能分析失败: {e}")
+
+def track_progress(task_id: str, task_type: str, stage_count: int = 1) -> TaskProgress:
+    """创建任务进度跟踪器，进度同时推送给订阅者和任务管理器"""
+    meter = token_usage.get(task_id)
+    return TaskProgress(
+        progress_broker, task_id, task_type, stage_count,
+        task_manager.update_task_progress, task_manager.get_control(task_id),
+        meter.rates if meter is not None else None
+    )
+
+async def record_cancelled(task_id: str, stage: str, **counts):
+    """记录被取消（用户取消或令牌用量达到预算）的任务，结果中保留取消时所在阶段和已完成部分的数量"""
+    await db.update_task_status(task_id, "cancelled", {"partial": True, "stage": stage, **counts})
+
+async def save_uploads(task_id: str, files: List[UploadFile]) -> List[Dict[str, Any]]:
+    """流式保存上传文件并记录与任务的关联
+
+    全部文件保存成功后才写入数据库；任一文件失败（如超过大小上限）时撤销已保存的文件，
+    不给不会创建的任务留下上传记录和链接。
+    """
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await file_manager.save_upload(file, task_id))
+    except BaseException as e:
+        file_manager.discard_uploads(uploads)
+        if isinstance(e, UploadTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise
+    for upload in uploads:
+        await db.record_upload(task_id, upload)
+    return uploads
 
 # ==================== 页面路由 ====================
 
@@ -115,7 +351,6 @@ async def configure_agents(
     agent3_key: str = Form(None)
 ):
     """配置智能体"""
-    global agents_config
     agents_config = {"count": agent_count}
     
     if agent_count >= 1 and agent1_url and agent1_key:
@@ -124,39 +359,18 @@ async def configure_agents(
         agents_config["agent2"] = {"url": agent2_url, "key": agent2_key}
     if agent_count >= 3 and agent3_url and agent3_key:
         agents_config["agent3"] = {"url": agent3_url, "key": agent3_key}
+    await db.set_setting("agents_config", agents_config)
+    health_checker.trigger()
     
     return {"status": "success", "message": "智能体配置成功"}
 
 @app.get("/api/agents/status")
-async def get_agents_status():
-    """获取智能体状态"""
-    if not agents_config:
-        return {"configured": False, "agents": []}
-    
-    agents_status = []
-    for i in range(1, agents_config["count"] + 1):
-        agent_key = f"agent{i}"
-        if agent_key in agents_config:
-            # 测试连接
-            try:
-                tester = AgentTester()
-                status = await tester.test_connection(
-                    agents_config[agent_key]["url"],
-                    agents_config[agent_key]["key"]
-                )
-                agents_status.append({
-                    "name": f"智能体{i}",
-                    "status": "connected" if status else "failed",
-                    "url": agents_config[agent_key]["url"]
-                })
-            except:
-                agents_status.append({
-                    "name": f"智能体{i}",
-                    "status": "failed",
-                    "url": agents_config[agent_key]["url"]
-                })
-    
-    return {"configured": True, "agents": agents_status}
+async def get_agents_status(refresh: bool = False):
+    """获取智能体状态（来自后台健康检查的缓存快照，refresh=true 时立即重新探测）"""
+    agents_config = await get_agents_config()
+    if refresh or health_checker.is_stale(agents_config):
+        return await health_checker.refresh()
+    return health_checker.get_snapshot()
 
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats():
@@ -166,235 +380,384 @@ async def get_dashboard_stats():
 
 @app.post("/api/qa/generate")
 async def generate_qa_pairs(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     max_paragraphs: int = Form(20),
     temperature: float = Form(0.3),
-    api_key: str = Form(...)
+    api_key: str = Form(...),
+    priority: int = Form(0),
+    profile: bool = Form(False),
+    token_budget: int = Form(0)
 ):
     """生成问答对"""
+    await check_queue_capacity()
     task_id = str(uuid.uuid4())
     
     # 保存上传的文件
-    file_paths = []
-    for file in files:
-        file_path = f"uploads/{task_id}_{file.filename}"
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        file_paths.append(file_path)
+    uploads = await save_uploads(task_id, files)
+    file_paths = [u["path"] for u in uploads]
     
-    # 创建任务
-    await db.create_task(task_id, "qa_generation", "pending", {
+    # 提交到任务队列
+    return await enqueue_task(task_id, "qa_generation", {
         "files": file_paths,
+        "file_hashes": [u["hash"] for u in uploads],
         "max_paragraphs": max_paragraphs,
-        "temperature": temperature
-    })
-    
-    # 后台执行任务
-    background_tasks.add_task(
-        execute_qa_generation,
-        task_id, file_paths, max_paragraphs, temperature, api_key
-    )
-    
-    return {"task_id": task_id, "status": "started"}
+        "temperature": temperature,
+        "priority": priority
+    }, {
+        "file_paths": file_paths,
+        "max_paragraphs": max_paragraphs,
+        "temperature": temperature,
+        "api_key": api_key,
+        "content_hashes": {u["path"]: u["hash"] for u in uploads}
+    }, priority, profile, token_budget)
 
-async def execute_qa_generation(task_id: str, file_paths: List[str], max_paragraphs: int, temperature: float, api_key: str):
+async def execute_qa_generation(task_id: str, file_paths: List[str], max_paragraphs: int, temperature: float, api_key: str, content_hashes: Dict[str, str] = None):
     """执行问答对生成任务"""
+    generator = QAGenerator(api_key)
+    control = task_manager.get_control(task_id)
     try:
         await db.update_task_status(task_id, "running")
         
-        generator = QAGenerator(api_key)
         output_path = f"outputs/qa_pairs_{task_id}.xlsx"
+        progress = track_progress(task_id, "qa_generation")
         
-        result = await generator.process_documents(file_paths, output_path, max_paragraphs, temperature)
+        result = await generator.process_documents(
+            file_paths, output_path, max_paragraphs, temperature, content_hashes,
+            progress.callback("生成问答对"), control.wait_if_paused
+        )
+        await register_artifacts(task_id, [output_path])
+        await db.save_golden_items(task_id, result)
         
         await db.update_task_status(task_id, "completed", {
             "output_file": output_path,
             "qa_count": len(result)
         })
         
+    except asyncio.CancelledError:
+        if task_manager.is_cancel_requested(task_id):
+            await db.save_golden_items(task_id, generator.qa_pairs)
+            await record_cancelled(task_id, "生成问答对", qa_count=len(generator.qa_pairs))
+        raise
     except Exception as e:
         await db.update_task_status(task_id, "failed", {"error": str(e)})
 
 @app.post("/api/dify/test")
 async def test_dify_workflow(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     temperature: float = Form(0.3),
-    delay: int = Form(1)
+    delay: int = Form(1),
+    priority: int = Form(0),
+    profile: bool = Form(False),
+    token_budget: int = Form(0)
 ):
     """测试Dify工作流"""
+    agents_config = await get_agents_config()
     if not agents_config:
         raise HTTPException(status_code=400, detail="请先配置智能体")
     
+    await check_queue_capacity()
     task_id = str(uuid.uuid4())
     
     # 保存上传的文件
-    file_paths = []
-    for file in files:
-        file_path = f"uploads/{task_id}_{file.filename}"
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        file_paths.append(file_path)
+    uploads = await save_uploads(task_id, files)
+    file_paths = [u["path"] for u in uploads]
     
-    # 创建任务
-    await db.create_task(task_id, "dify_test", "pending", {
+    # 提交到任务队列（保存当前智能体配置，重启后仍可执行）
+    return await enqueue_task(task_id, "dify_test", {
         "files": file_paths,
+        "file_hashes": [u["hash"] for u in uploads],
         "temperature": temperature,
-        "delay": delay
-    })
-    
-    # 后台执行任务
-    background_tasks.add_task(
-        execute_dify_test,
-        task_id, file_paths, temperature, delay
-    )
-    
-    return {"task_id": task_id, "status": "started"}
+        "delay": delay,
+        "priority": priority
+    }, {
+        "file_paths": file_paths,
+        "temperature": temperature,
+        "delay": delay,
+        "agents": agents_config
+    }, priority, profile, token_budget)
 
-async def execute_dify_test(task_id: str, file_paths: List[str], temperature: float, delay: int):
+async def execute_dify_test(task_id: str, file_paths: List[str], temperature: float, delay: int, agents: Dict = None):
     """执行Dify测试任务"""
+    tester = AgentTester()
+    control = task_manager.get_control(task_id)
     try:
         await db.update_task_status(task_id, "running")
         
-        tester = AgentTester()
         output_path = f"outputs/dify_test_{task_id}.xlsx"
         
-        result = await tester.test_agents(agents_config, file_paths, output_path, delay)
+        progress = track_progress(task_id, "dify_test", stage_count=2)
+        result = await tester.test_agents(
+            agents or await get_agents_config(), file_paths, output_path, delay,
+            progress.callback("生成问答对"), progress.callback("测试智能体"), control.wait_if_paused
+        )
+        await register_artifacts(task_id, [output_path])
+        await db.save_agent_answers(task_id, tester.results)
         
         await db.update_task_status(task_id, "completed", {
             "output_file": output_path,
             "test_count": result
         })
         
+    except asyncio.CancelledError:
+        if task_manager.is_cancel_requested(task_id):
+            await db.save_agent_answers(task_id, tester.results)
+            answered = max((len(rows) for rows in tester.results.values()), default=0)
+            await record_cancelled(task_id, "测试智能体", test_count=answered)
+        raise
     except Exception as e:
         await db.update_task_status(task_id, "failed", {"error": str(e)})
 
 @app.post("/api/similarity/calculate")
 async def calculate_similarity(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    api_key: str = Form(...)
+    api_key: str = Form(...),
+    priority: int = Form(0),
+    profile: bool = Form(False),
+    token_budget: int = Form(0)
 ):
     """计算相似度评分"""
+    await check_queue_capacity()
     task_id = str(uuid.uuid4())
     
     # 保存上传的文件
-    file_path = f"uploads/{task_id}_{file.filename}"
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    uploads = await save_uploads(task_id, [file])
+    file_path = uploads[0]["path"]
     
-    # 创建任务
-    await db.create_task(task_id, "similarity_calculation", "pending", {
-        "input_file": file_path
-    })
-    
-    # 后台执行任务
-    background_tasks.add_task(
-        execute_similarity_calculation,
-        task_id, file_path, api_key
-    )
-    
-    return {"task_id": task_id, "status": "started"}
+    # 提交到任务队列
+    return await enqueue_task(task_id, "similarity_calculation", {
+        "input_file": file_path,
+        "file_hash": uploads[0]["hash"],
+        "priority": priority
+    }, {
+        "file_path": file_path,
+        "api_key": api_key
+    }, priority, profile, token_budget)
 
 async def execute_similarity_calculation(task_id: str, file_path: str, api_key: str):
     """执行相似度计算任务"""
+    scorer = SimilarityScorer(api_key)
+    control = task_manager.get_control(task_id)
     try:
         await db.update_task_status(task_id, "running")
         
-        scorer = SimilarityScorer(api_key)
         output_path = f"outputs/similarity_scores_{task_id}.xlsx"
         
-        result = await scorer.calculate_scores(file_path, output_path)
+        progress = track_progress(task_id, "similarity_calculation")
+        result = await scorer.calculate_scores(
+            file_path, output_path, progress.callback("计算相似度"), control.wait_if_paused
+        )
+        await register_artifacts(task_id, [output_path])
+        await db.save_scores(task_id, scorer.score_rows)
         
         await db.update_task_status(task_id, "completed", {
             "output_file": output_path,
             "scores": result
         })
         
+        # 评分已入库时分析接口直接使用SQL聚合，只有未入库的工作簿需要后台预热分析缓存
+        if not scorer.score_rows:
+            analysis_cache.warm(output_path)
+        
+    except asyncio.CancelledError:
+        if task_manager.is_cancel_requested(task_id):
+            await db.save_scores(task_id, scorer.score_rows)
+            await record_cancelled(task_id, "计算相似度", scored_count=len(scorer.score_rows))
+        raise
     except Exception as e:
         await db.update_task_status(task_id, "failed", {"error": str(e)})
 
 @app.post("/api/pipeline/start")
 async def start_full_pipeline(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     max_paragraphs: int = Form(20),
     temperature: float = Form(0.3),
     delay: int = Form(1),
     qa_api_key: str = Form(...),
-    similarity_api_key: str = Form(...)
+    similarity_api_key: str = Form(...),
+    priority: int = Form(0),
+    profile: bool = Form(False),
+    token_budget: int = Form(0),
+    adaptive: bool = Form(False),
+    confidence: float = Form(DEFAULT_CONFIDENCE),
+    min_samples: int = Form(DEFAULT_MIN_SAMPLES)
 ):
-    """启动完整流水线"""
+    """启动完整流水线，adaptive 为真时测试阶段按名次是否确定提前停止提问"""
+    agents_config = await get_agents_config()
     if not agents_config:
         raise HTTPException(status_code=400, detail="请先配置智能体")
+    if adaptive and not (0.5 <= confidence < 1 and min_samples >= 2):
+        raise HTTPException(status_code=400, detail="confidence 须在 0.5 到 1 之间，min_samples 至少为 2")
+    adaptive_options = {"confidence": confidence, "min_samples": min_samples} if adaptive else None
     
+    await check_queue_capacity()
     task_id = str(uuid.uuid4())
     
     # 保存上传的文件
-    file_paths = []
-    for file in files:
-        file_path = f"uploads/{task_id}_{file.filename}"
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        file_paths.append(file_path)
+    uploads = await save_uploads(task_id, files)
+    file_paths = [u["path"] for u in uploads]
     
-    # 创建任务
-    await db.create_task(task_id, "full_pipeline", "pending", {
+    # 提交到任务队列（保存当前智能体配置，重启后仍可执行）
+    return await enqueue_task(task_id, "full_pipeline", {
         "files": file_paths,
+        "file_hashes": [u["hash"] for u in uploads],
         "max_paragraphs": max_paragraphs,
         "temperature": temperature,
-        "delay": delay
-    })
-    
-    # 后台执行任务
-    background_tasks.add_task(
-        execute_full_pipeline,
-        task_id, file_paths, max_paragraphs, temperature, delay, qa_api_key, similarity_api_key
-    )
-    
-    return {"task_id": task_id, "status": "started"}
+        "delay": delay,
+        "priority": priority,
+        "adaptive": adaptive_options
+    }, {
+        "file_paths": file_paths,
+        "max_paragraphs": max_paragraphs,
+        "temperature": temperature,
+        "delay": delay,
+        "qa_api_key": qa_api_key,
+        "similarity_api_key": similarity_api_key,
+        "content_hashes": {u["path"]: u["hash"] for u in uploads},
+        "agents": agents_config,
+        "adaptive": adaptive_options
+    }, priority, profile, token_budget)
 
-async def execute_full_pipeline(task_id: str, file_paths: List[str], max_paragraphs: int, temperature: float, delay: int, qa_api_key: str, similarity_api_key: str):
-    """执行完整流水线任务"""
+async def execute_full_pipeline(task_id: str, file_paths: List[str], max_paragraphs: int, temperature: float, delay: int, qa_api_key: str, similarity_api_key: str, content_hashes: Dict[str, str] = None, agents: Dict = None, adaptive: Dict = None):
+    """执行完整流水线任务，adaptive 为自适应评估参数（confidence、min_samples）"""
+    generator = QAGenerator(qa_api_key)
+    tester = AgentTester()
+    scorer = SimilarityScorer(similarity_api_key)
+    evaluation = AdaptiveEvaluation(scorer, **adaptive) if adaptive else None
+    control = task_manager.get_control(task_id)
+    stage = "生成问答对"
     try:
-        await db.update_task_status(task_id, "running", {"step": "生成问答对"})
+        await db.update_task_status(task_id, "running", {"step": stage})
+        progress = track_progress(task_id, "full_pipeline", stage_count=3)
         
         # 步骤1: 生成问答对
-        generator = QAGenerator(qa_api_key)
         qa_output = f"outputs/qa_pairs_{task_id}.xlsx"
-        qa_result = await generator.process_documents(file_paths, qa_output, max_paragraphs, temperature)
+        qa_result = await generator.process_documents(
+            file_paths, qa_output, max_paragraphs, temperature, content_hashes,
+            progress.callback(stage), control.wait_if_paused
+        )
+        await register_artifacts(task_id, [qa_output])
+        await db.save_golden_items(task_id, qa_result)
         
-        await db.update_task_status(task_id, "running", {"step": "测试智能体"})
+        # 阶段之间同样响应暂停，避免覆盖已暂停的状态
+        await control.wait_if_paused()
+        stage = "测试智能体"
+        await db.update_task_status(task_id, "running", {"step": stage})
         
         # 步骤2: 测试智能体
-        tester = AgentTester()
         test_output = f"outputs/dify_test_{task_id}.xlsx"
-        test_result = await tester.test_agents_with_qa_file(agents_config, qa_output, test_output, delay)
+        test_result = await tester.test_agents_with_qa_file(
+            agents or await get_agents_config(), qa_output, test_output, delay, progress.callback(stage),
+            control.wait_if_paused, evaluation
+        )
+        await register_artifacts(task_id, [test_output])
+        await db.save_agent_answers(task_id, tester.results)
         
-        await db.update_task_status(task_id, "running", {"step": "计算相似度"})
+        await control.wait_if_paused()
+        stage = "计算相似度"
+        await db.update_task_status(task_id, "running", {"step": stage})
         
         # 步骤3: 计算相似度
-        scorer = SimilarityScorer(similarity_api_key)
         similarity_output = f"outputs/similarity_scores_{task_id}.xlsx"
-        similarity_result = await scorer.calculate_scores(test_output, similarity_output)
+        # 自适应评估在测试阶段已算出的评分直接复用
+        similarity_result = await scorer.calculate_scores(
+            test_output, similarity_output, progress.callback(stage), control.wait_if_paused,
+            evaluation.scores if evaluation else None
+        )
+        await register_artifacts(task_id, [similarity_output])
+        await db.save_scores(task_id, scorer.score_rows)
         
-        await db.update_task_status(task_id, "completed", {
+        result = {
             "qa_file": qa_output,
             "test_file": test_output,
             "similarity_file": similarity_output,
             "qa_count": len(qa_result),
             "test_count": test_result,
             "scores": similarity_result
-        })
+        }
+        if evaluation is not None:
+            result["adaptive"] = evaluation.report()
+        await db.update_task_status(task_id, "completed", result)
         
+        # 评分已入库时分析接口直接使用SQL聚合，只有未入库的工作簿需要后台预热分析缓存
+        if not scorer.score_rows:
+            analysis_cache.warm(similarity_output)
+        
+    except asyncio.CancelledError:
+        if task_manager.is_cancel_requested(task_id):
+            # 保存取消时所在阶段已完成的部分（之前阶段的结果已在阶段结束时保存）
+            if stage == "生成问答对":
+                await db.save_golden_items(task_id, generator.qa_pairs)
+            elif stage == "测试智能体":
+                await db.save_agent_answers(task_id, tester.results)
+            else:
+                await db.save_scores(task_id, scorer.score_rows)
+            await record_cancelled(
+                task_id, stage,
+                qa_count=len(generator.qa_pairs),
+                test_count=max((len(rows) for rows in tester.results.values()), default=0),
+                scored_count=len(scorer.score_rows)
+            )
+        raise
     except Exception as e:
         await db.update_task_status(task_id, "failed", {"error": str(e)})
 
+@app.get("/api/queue/status")
+async def get_queue_status():
+    """获取任务队列和工作池状态"""
+    return await task_manager.get_stats()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def progress_stream(request: Request, task_id: str = None, initial: List[Dict] = None):
+    """将进度事件以SSE格式推送给客户端，单任务订阅在任务结束后关闭"""
+    queue = progress_broker.subscribe(task_id)
+    metrics.sse_connections.inc()
+    try:
+        for event in initial or []:
+            yield format_sse(event)
+            if task_id and event.get("status") in TERMINAL_STATUSES:
+                return
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), 15)
+            except asyncio.TimeoutError:
+                # 心跳，防止代理断开空闲连接
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if task_id and event.get("status") in TERMINAL_STATUSES:
+                break
+    finally:
+        metrics.sse_connections.dec()
+        progress_broker.unsubscribe(queue, task_id)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.get("/api/events")
+async def stream_all_progress(request: Request):
+    """订阅全部任务的进度事件（SSE）"""
+    return StreamingResponse(
+        progress_stream(request, None, progress_broker.get_snapshot()),
+        media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+@app.get("/api/tasks/{task_id}/events")
+async def stream_task_progress(task_id: str, request: Request):
+    """订阅单个任务的进度事件（SSE），首条事件为当前状态"""
+    snapshot = progress_broker.get_snapshot(task_id)
+    if snapshot is None:
+        task = await db.get_task(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        snapshot = {"task_id": task_id, "type": task["type"], "status": task["status"]}
+    return StreamingResponse(
+        progress_stream(request, task_id, [snapshot]),
+        media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
 @app.get("/api/tasks")
 async def get_tasks():
     """获取任务列表"""
@@ -409,25 +772,157 @@ async def get_task(task_id: str):
         raise HTTPException(status_code=404, detail="任务不存在")
     return task
 
+async def reject_task_control(task_id: str, action: str):
+    """任务控制操作失败：任务不存在返回404，状态不允许该操作返回409"""
+    task = await db.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    raise HTTPException(status_code=409, detail=f"任务当前状态为 {task['status']}，无法{action}")
+
+@app.post("/api/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    """取消等待中、运行中或已暂停的任务，运行中的任务保留已完成部分的结果"""
+    status = await task_manager.cancel_task(task_id)
+    if status is None:
+        await reject_task_control(task_id, "取消")
+    return {"task_id": task_id, "status": status}
+
+@app.post("/api/tasks/{task_id}/pause")
+async def pause_task(task_id: str):
+    """暂停等待中或运行中的任务，运行中的任务在当前工作项完成后停下并让出工作槽位"""
+    status = await task_manager.pause_task(task_id)
+    if status is None:
+        await reject_task_control(task_id, "暂停")
+    return {"task_id": task_id, "status": status}
+
+@app.post("/api/tasks/{task_id}/resume")
+async def resume_task(task_id: str):
+    """恢复已暂停的任务；没有空闲工作槽位时保持暂停，待槽位释放后自动继续"""
+    status = await task_manager.resume_task(task_id)
+    if status is None:
+        await reject_task_control(task_id, "恢复")
+    return {"task_id": task_id, "status": status}
+
 @app.delete("/api/tasks/{task_id}")
 async def delete_task(task_id: str):
-    """删除任务"""
+    """删除任务（未结束的任务先取消，等待执行结束后再删除）"""
+    status = await task_manager.cancel_and_wait(task_id)
+    if status == "cancel_requested":
+        # 任务由其他工作进程执行，结束前仍会写入结果，此时不能删除
+        raise HTTPException(status_code=409, detail="任务正由其他工作进程执行，已请求取消，请在任务结束后再删除")
     await db.delete_task(task_id)
     return {"status": "success", "message": "任务已删除"}
 
 @app.get("/api/files")
-async def get_files():
-    """获取文件列表"""
-    files = file_manager.get_output_files()
+async def get_files(
+    kind: Optional[str] = None,
+    type: Optional[str] = None,
+    task_id: Optional[str] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0
+):
+    """获取文件列表（从产物目录查询，支持过滤和分页）"""
+    files = await db.list_artifacts(kind, type, task_id, search, limit, max(offset, 0))
     return files
 
+@app.get("/api/files/summary")
+async def get_files_summary():
+    """获取文件数量和磁盘占用统计"""
+    return await db.get_storage_usage()
+
+@app.get("/api/tasks/{task_id}/spans/slowest")
+async def get_slowest_spans(task_id: str, limit: int = 20, name: str = None):
+    """获取任务中耗时最长的 span（可按名称过滤，如 question、agent call、embedding）"""
+    task = await db.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    await tracer.flush(task_id)
+    trace_path = tracer.trace_path(task_id)
+    if not os.path.isfile(trace_path):
+        raise HTTPException(status_code=404, detail="任务没有追踪数据")
+    result = await executor.run_blocking(read_slowest_spans, trace_path, max(1, min(limit, 1000)), name)
+    return {"task_id": task_id, "trace_file": trace_path, **result}
+
+@app.get("/api/tasks/{task_id}/usage")
+async def get_task_usage(task_id: str):
+    """获取任务的令牌用量：运行中的任务返回本进程的实时统计，已结束的任务返回结果中保存的报告"""
+    meter = token_usage.get(task_id)
+    if meter is not None:
+        return {"task_id": task_id, "live": True, **meter.summary()}
+    task = await db.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    usage = (task.get("result") or {}).get("usage")
+    if usage is None:
+        raise HTTPException(status_code=404, detail="任务没有令牌用量数据（未开始执行或正由其他工作进程执行）")
+    return {"task_id": task_id, "live": False, **usage}
+
+@app.get("/api/tasks/{task_id}/bundle")
+async def download_task_bundle(task_id: str):
+    """打包下载任务的全部结果文件"""
+    task = await db.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    # 任务结果中记录的输出文件（output_file、qa_file、test_file、similarity_file 等）
+    output_dir = os.path.realpath("outputs")
+    file_paths = []
+    for key, value in task["result"].items():
+        if not key.endswith("_file") or not isinstance(value, str):
+            continue
+        real_path = os.path.realpath(value)
+        if os.path.dirname(real_path) == output_dir and os.path.isfile(real_path) and real_path not in file_paths:
+            file_paths.append(real_path)
+    
+    if not file_paths:
+        raise HTTPException(status_code=404, detail="任务没有可下载的结果文件")
+    
+    return StreamingResponse(
+        file_manager.iter_zip(file_paths),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="task_{task_id}.zip"'}
+    )
+
 @app.get("/api/files/{filename}")
-async def download_file(filename: str):
-    """下载文件"""
+async def download_file(filename: str, request: Request):
+    """下载文件（支持 Range 断点续传和 ETag 缓存校验）"""
     file_path = f"outputs/{filename}"
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
-    return FileResponse(file_path, filename=filename)
+    
+    await db.touch_artifact(filename)
+    etag = file_manager.get_etag(file_path)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        file_size = os.path.getsize(file_path)
+        try:
+            byte_range = file_manager.parse_range(range_header, file_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+        
+        if byte_range:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                "Content-Length": str(end - start + 1),
+                "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"
+            })
+            return StreamingResponse(
+                file_manager.iter_file_range(file_path, start, end),
+                status_code=206,
+                media_type="application/octet-stream",
+                headers=headers
+            )
+    
+    return FileResponse(file_path, filename=filename, headers=headers)
 
 @app.delete("/api/files/{filename}")
 async def delete_file(filename: str):
@@ -435,12 +930,14 @@ async def delete_file(filename: str):
     file_path = f"outputs/{filename}"
     if os.path.exists(file_path):
         os.remove(file_path)
+    await db.delete_artifact(filename)
+    analysis_cache.invalidate(file_path)
     return {"status": "success", "message": "文件已删除"}
 
 @app.get("/api/analysis/files")
 async def get_analysis_files():
     """获取可分析的文件列表"""
-    files = file_manager.get_similarity_files()
+    files = await db.list_artifacts(kind="similarity")
     return files
 
 @app.get("/api/analysis/{filename}")
@@ -450,12 +947,144 @@ async def get_analysis_data(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    # 解析Excel文件并返回分析数据
-    from modules.analyzer import Analyzer
-    analyzer = Analyzer()
-    analysis_data = await analyzer.analyze_file(file_path)
+    await db.touch_artifact(filename)
+    
+    # 已入库的评分结果直接用SQL聚合，否则解析Excel文件（优先使用缓存）
+    run_id = await db.get_scored_run(filename)
+    if run_id:
+        return await db.get_run_analysis(run_id)
+    analysis_data = await analysis_cache.get_analysis(file_path)
     return analysis_data
 
+@app.get("/api/analysis/{filename}/questions")
+async def get_analysis_questions(
+    filename: str,
+    agent: Optional[str] = None,
+    sort_by: str = "weighted_score",
+    order: str = "desc",
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """分页获取问题级分析结果"""
+    file_path = f"outputs/{filename}"
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order 只能为 asc 或 desc")
+    
+    limit = max(1, min(limit, 500))
+    try:
+        run_id = await db.get_scored_run(filename)
+        if run_id:
+            from modules.analyzer import encode_cursor, decode_cursor
+            page = await db.query_run_questions(
+                run_id, agent, sort_by, order == "desc",
+                min_score, max_score, decode_cursor(cursor) if cursor else None, limit
+            )
+            if page["next_cursor"] is not None:
+                page["next_cursor"] = encode_cursor(page["next_cursor"])
+            return page
+        await analysis_cache.analyzer.load_results_async(file_path)
+        return analysis_cache.analyzer.query_questions(
+            file_path, agent, sort_by, order == "desc",
+            min_score, max_score, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/analysis/{filename}/questions/top")
+async def get_analysis_top_questions(
+    filename: str,
+    k: int = 10,
+    metric: str = "weighted_score",
+    bottom: bool = False,
+    agent: Optional[str] = None
+):
+    """获取指标最高或最低的 k 个问题"""
+    file_path = f"outputs/{filename}"
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    k = max(0, min(k, 500))
+    try:
+        run_id = await db.get_scored_run(filename)
+        if run_id:
+            return await db.top_run_questions(run_id, k, metric, bottom, agent)
+        await analysis_cache.analyzer.load_results_async(file_path)
+        return analysis_cache.analyzer.top_questions(file_path, k, metric, bottom, agent)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/results/history")
+async def get_question_history(question: str, agent: Optional[str] = None, limit: int = 20):
+    """查询同一问题在多次评估中的得分变化"""
+    return await db.get_question_history(question, agent, max(1, min(limit, 500)))
+
+@app.get("/api/results/{task_id}/export")
+async def export_results(task_id: str):
+    """将已入库的评分结果导出为Excel"""
+    rows = await db.get_run_rows(task_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="该任务没有评分结果")
+    
+    from modules.analyzer import build_results_export
+    content = await executor.run_cpu(build_results_export, rows)
+    filename = f"similarity_scores_{task_id}.xlsx"
+    return Response(
+        content=content,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+@app.get("/api/health")
+async def health():
+    """健康检查（不访问数据库和外部接口）"""
+    return {
+        "status": "ok",
+        "worker_id": task_manager.worker_id,
+        "ready": "ready_seconds" in startup_report,
+        "uptime_seconds": round(time.perf_counter() - _import_started, 1)
+    }
+
+@app.get("/api/system/runtime")
+async def get_runtime_stats():
+    """获取执行池、事件循环阻塞和启动耗时统计"""
+    return {
+        "startup": startup_report,
+        "executor": executor.get_stats(),
+        "event_loop": loop_monitor.get_stats(),
+        "progress_relay": progress_relay.get_stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 格式的运行指标（本工作进程）"""
+    stats = await task_manager.get_stats()
+    metrics.queue_depth.set(stats["queue_depth"])
+    metrics.active_tasks.clear()
+    for task_type in task_manager.type_limits:
+        metrics.active_tasks.set(stats["running_by_type"].get(task_type, 0), type=task_type)
+    metrics.worker_info.clear()
+    metrics.worker_info.set(1, worker_id=task_manager.worker_id)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/system/rate-limits")
+async def get_rate_limits():
+    """获取外部接口限流状态（按 API Key 和接口统计用量、排队数和等待时间）"""
+    return governor.get_stats()
+
+@app.get("/api/maintenance/status")
+async def get_maintenance_status():
+    """获取存储清理服务状态"""
+    return maintenance.get_status()
+
+@app.post("/api/maintenance/run")
+async def run_maintenance():
+    """立即执行一次存储清理"""
+    return await maintenance.run_once()
+
 if __name__ == "__main__":
     uvicorn.run(
         "app:app",
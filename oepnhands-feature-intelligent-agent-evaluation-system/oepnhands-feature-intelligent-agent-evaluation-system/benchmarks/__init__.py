@@ -0,0 +1 @@
+"""性能基准：本地模拟外部接口的端到端基准和热点路径微基准"""
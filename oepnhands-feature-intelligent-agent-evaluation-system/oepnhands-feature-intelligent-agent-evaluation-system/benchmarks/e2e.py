@@ -0,0 +1,311 @@
+"""端到端吞吐量基准
+
+在本地启动模拟的 Dify 和硅基流动接口，按 100 / 1k / 10k 个问题驱动完整流水线
+（execute_full_pipeline）、智能体测试（test_agents_with_qa_file）和相似度评分
+（calculate_scores），报告耗时、吞吐量和峰值内存，并与保存的基线比较。
+
+在应用目录下运行：
+    python -m benchmarks.e2e                          # 默认 100 和 1000 个问题
+    python -m benchmarks.e2e --sizes 100,1000,10000   # 包含 10k（需要数分钟）
+    python -m benchmarks.e2e --update-baseline        # 将本次结果保存为基线
+
+每个场景在独立的 Python 进程和临时工作目录中运行（独立的数据库、输出目录和进程池），
+峰值内存为该子进程的最大常驻内存。存在超出容差的回归时退出码为 1。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .mock_servers import MockProfile, MockServerProcess
+from .synthetic import make_paragraphs, make_qa_pairs, make_results
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_e2e.json")
+SCENARIOS = ("pipeline", "agents", "scores")
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def agents_config(base_url: str, count: int) -> Dict[str, Any]:
+    config = {"count": count}
+    for i in range(1, count + 1):
+        config[f"agent{i}"] = {"url": f"{base_url}/chat-messages", "key": f"Bearer bench-agent-{i}"}
+    return config
+
+def write_docx(paragraphs: List[str], path: str):
+    from docx import Document
+    doc = Document()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(path)
+
+async def _run_scenario(scenario: str, size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    import app as application
+    from modules.executor import executor
+    from modules.rate_limiter import governor
+
+    # 默认不限流，测量系统本身的吞吐量；--keep-rate-limits 时按默认限额运行
+    if not options["keep_rate_limits"]:
+        for endpoint in list(governor.limits):
+            governor.configure(endpoint)
+
+    await application.db.init_db()
+    # 预先构建 jieba 词典缓存并导入 sklearn，进程池子进程直接加载缓存（与正式启动后的状态一致）
+    application.prewarm_scoring()
+    agents = agents_config(options["base_url"], options["agents"])
+    task_id = f"bench_{scenario}_{size}"
+
+    # 准备输入（不计入耗时）
+    if scenario == "pipeline":
+        paragraph_count = -(-size // options["qa_per_call"])
+        docx_path = os.path.join("uploads", f"{task_id}.docx")
+        write_docx(make_paragraphs(paragraph_count, options["seed"]), docx_path)
+        await application.db.create_task(task_id, "full_pipeline", "pending", {})
+    elif scenario == "agents":
+        from modules.qa_generator import write_qa_excel
+        qa_path = os.path.join("uploads", f"{task_id}_qa.xlsx")
+        write_qa_excel(make_qa_pairs(size, options["seed"]), qa_path)
+    else:
+        from modules.agent_tester import write_results_workbook
+        results_path = os.path.join("uploads", f"{task_id}_results.xlsx")
+        write_results_workbook(make_results(size, options["agents"], options["seed"]), results_path)
+
+    mock_before = MockServerProcess.fetch_stats(options["stats_url"])
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if scenario == "pipeline":
+            await application.execute_full_pipeline(
+                task_id, [docx_path], paragraph_count, 0.3, 0, "bench-qa-key", "bench-similarity-key",
+                None, agents
+            )
+            task = await application.db.get_task(task_id)
+            outcome = {"status": task["status"], "qa_count": (task.get("result") or {}).get("qa_count")}
+        elif scenario == "agents":
+            tester = application.AgentTester()
+            count = await tester.test_agents_with_qa_file(agents, qa_path, os.path.join("outputs", f"{task_id}.xlsx"), 0)
+            failed = sum(1 for rows in tester.results.values() for row in rows if not row["success"])
+            outcome = {"status": "completed", "questions": count, "failed_calls": failed}
+        else:
+            scorer = application.SimilarityScorer("bench-similarity-key")
+            await scorer.calculate_scores(results_path, os.path.join("outputs", f"{task_id}.xlsx"))
+            outcome = {"status": "completed", "scored_rows": len(scorer.score_rows)}
+    wall = time.perf_counter() - started
+    mock_after = MockServerProcess.fetch_stats(options["stats_url"])
+
+    executor.shutdown()
+    await application.db.close()
+
+    calls = {}
+    for route, counts in mock_after.items():
+        before = mock_before.get(route, {})
+        delta = {k: v - before.get(k, 0) for k, v in counts.items() if v - before.get(k, 0)}
+        if delta:
+            calls[route] = delta
+    return {
+        "scenario": scenario,
+        "size": size,
+        "wall_seconds": round(wall, 3),
+        "throughput": round(size / wall, 2) if wall else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "outcome": outcome,
+        "vendor_calls": calls
+    }
+
+def _scenario_main(scenario: str, size: int, options: Dict[str, Any], result_file: str):
+    """子进程入口：在临时工作目录中导入应用并运行一个场景，结果写入 result_file"""
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        os.chdir(workdir)
+        for directory in ("static", "uploads", "outputs"):
+            os.makedirs(directory, exist_ok=True)
+        os.environ["SILICONFLOW_BASE_URL"] = options["base_url"]
+        sys.path.insert(0, APP_DIR)
+        try:
+            result = asyncio.run(_run_scenario(scenario, size, options))
+        except Exception as e:
+            result = {"scenario": scenario, "size": size, "error": f"{type(e).__name__}: {e}"}
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_scenario(scenario: str, size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """在独立的 Python 进程中运行一个场景（与正式部署一样作为主进程运行，进程池正常退出）"""
+    fd, result_file = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.e2e", "--run-scenario", scenario, "--sizes", str(size),
+             "--scenario-options", json.dumps(options), "--result-file", result_file],
+            cwd=APP_DIR, stdout=subprocess.DEVNULL
+        )
+        with open(result_file, encoding="utf-8") as f:
+            content = f.read()
+        if not content:
+            return {"scenario": scenario, "size": size, "error": f"子进程退出码 {completed.returncode}"}
+        return json.loads(content)
+    finally:
+        os.remove(result_file)
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], conditions: Dict[str, Any], tolerance: float) -> List[str]:
+    """与基线比较，吞吐量下降或峰值内存上升超过容差时视为回归（模拟条件不同时不比较）"""
+    regressions = []
+    if baseline.get("conditions") != conditions:
+        if baseline:
+            print("本次模拟条件与基线不同，跳过基线比较")
+        return regressions
+    for result in results:
+        key = f"{result['scenario']}/{result['size']}"
+        base = baseline.get("results", {}).get(key)
+        if not base or "error" in result:
+            continue
+        result["baseline"] = base
+        if base.get("throughput") and result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{key} 吞吐量 {result['throughput']}/s 低于基线 {base['throughput']}/s")
+        if base.get("peak_rss_mb") and result["peak_rss_mb"] and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{key} 峰值内存 {result['peak_rss_mb']}MB 高于基线 {base['peak_rss_mb']}MB")
+    return regressions
+
+def print_table(results: List[Dict[str, Any]]):
+    print(f"{'场景':<10}{'问题数':>8}{'耗时(s)':>10}{'吞吐量(/s)':>12}{'峰值内存(MB)':>14}{'基线吞吐量':>12}  结果")
+    for r in results:
+        if "error" in r:
+            print(f"{r['scenario']:<10}{r['size']:>8}  失败: {r['error']}")
+            continue
+        base = (r.get("baseline") or {}).get("throughput", "-")
+        print(f"{r['scenario']:<10}{r['size']:>8}{r['wall_seconds']:>10}{r['throughput']:>12}"
+              f"{str(r['peak_rss_mb']):>14}{str(base):>12}  {r['outcome']}")
+
+def environment_info() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端吞吐量基准（本地模拟 Dify 和硅基流动接口）")
+    parser.add_argument("--sizes", default="100,1000", help="问题数量，逗号分隔（默认 100,1000；可加 10000）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="场景：pipeline,agents,scores")
+    parser.add_argument("--agents", type=int, default=3, help="模拟的智能体数量")
+    parser.add_argument("--qa-per-call", type=int, default=10, help="每次问答生成调用返回的问答对数量")
+    parser.add_argument("--embedding-dim", type=int, default=1024, help="模拟向量维度")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="模拟接口平均延迟（毫秒）")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟接口返回 500 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="模拟接口返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-rate-limits", action="store_true", help="保留默认的外部接口限额")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="回归容差（默认 20%%）")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入基线文件")
+    parser.add_argument("--output", help="将结果保存为 JSON 文件")
+    # 以下参数供场景子进程内部使用
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario-options", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        _scenario_main(args.run_scenario, int(args.sizes), json.loads(args.scenario_options), args.result_file)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"未知场景: {scenario}")
+
+    profile = dict(
+        latency_ms=args.latency_ms, distribution=args.latency_dist, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed
+    )
+    mock = MockServerProcess(
+        MockProfile(**profile), MockProfile(**profile), args.qa_per_call, args.embedding_dim
+    )
+    options = {
+        "base_url": mock.base_url,
+        "stats_url": mock.stats_url,
+        "agents": args.agents,
+        "qa_per_call": args.qa_per_call,
+        "seed": args.seed,
+        "keep_rate_limits": args.keep_rate_limits
+    }
+
+    results = []
+    with mock:
+        for size in sizes:
+            for scenario in scenarios:
+                print(f"运行 {scenario} / {size} ...", flush=True)
+                results.append(run_scenario(scenario, size, options))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    # 影响吞吐量的模拟条件，只有与基线一致时才比较
+    conditions = {
+        "mock": mock.config,
+        "agents": args.agents,
+        "keep_rate_limits": args.keep_rate_limits
+    }
+    regressions = compare(results, baseline, conditions, args.tolerance)
+    print_table(results)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "environment": environment_info(),
+        "mock": mock.config,
+        "options": {k: v for k, v in vars(args).items() if k not in ("baseline", "output", "update_baseline")},
+        "results": results,
+        "regressions": regressions
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        merged = dict(baseline.get("results", {})) if baseline.get("conditions") == conditions else {}
+        for result in results:
+            if "error" not in result:
+                merged[f"{result['scenario']}/{result['size']}"] = {
+                    k: result[k] for k in ("wall_seconds", "throughput", "peak_rss_mb")
+                }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "updated_at": report["created_at"],
+                "environment": report["environment"],
+                "conditions": conditions,
+                "results": merged
+            }, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+
+    if regressions:
+        print("发现性能回归：")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    if any("error" in r for r in results):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""热点路径微基准
+
+单独测量 CPU 密集的热点路径，不访问网络：
+- jieba_lcut：jieba.lcut 分词（每个文本一次操作）
+- similarity_scores：SimilarityScorer.calculate_similarity_scores，使用注入的本地向量函数
+- read_results_frame：读取评分文件为长表（analyze_file 在进程池中执行的部分）
+- analyze_file：Analyzer.analyze_file 完整分析（含进程池读取）
+- create_qa_excel：QAGenerator.create_qa_excel 写问答对工作簿
+- write_results：AgentTester.write_results 写各智能体回答工作簿
+
+在应用目录下运行：
+    python -m benchmarks.micro                               # 1k 和 10k 行
+    python -m benchmarks.micro --sizes 1000,10000,100000     # 包含 100k（耗时较长）
+    python -m benchmarks.micro --cases jieba_lcut,similarity_scores --compare benchmarks/results/上次.json
+    python -m benchmarks.micro --sizes 1000,10000,100000 --update-baseline
+
+输入数据由固定种子合成，同样的参数每次生成相同的数据。每个用例重复运行直到累计
+--min-time 秒（最多 --repeat 次），取单次耗时的中位数；之后在 tracemalloc 下再运行
+一次统计内存峰值（--no-memory 跳过）。结果保存为 JSON。
+内存只统计当前进程的 Python 分配，analyze_file 在进程池中读取文件的部分不计入。
+"""
+import os
+import sys
+import gc
+import json
+import zlib
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Any, Callable
+
+from .synthetic import make_qa_pairs, make_results, make_agent_answer, derive_rng
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_micro.json")
+AGENTS = 3
+
+def hashed_embedding(tokenized: str, dim: int = 256) -> List[float]:
+    """按词哈希计数的本地向量（词袋），同样的输入得到同样的向量，相似文本余弦相似度较高"""
+    vector = [0.0] * dim
+    for token in tokenized.split():
+        vector[zlib.crc32(token.encode("utf-8")) % dim] += 1.0
+    return vector
+
+async def _local_embedding(tokenized: str) -> List[float]:
+    return hashed_embedding(tokenized)
+
+def _score_rows(results: Dict[str, List[Dict[str, str]]], seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """为测试结果附加评分列，生成与相似度评分文件相同结构的数据"""
+    scored = {}
+    for agent, rows in results.items():
+        rng = derive_rng(seed, "scores", agent)
+        scored[agent] = []
+        for r in rows:
+            cosine = rng.uniform(0.5, 1.0)
+            jaccard = rng.uniform(0.2, 0.8)
+            scored[agent].append({
+                "question": r["question"], "standard_answer": r["standard_answer"],
+                "generated_answer": r["agent_answer"], "cosine_similarity": cosine,
+                "jaccard_similarity": jaccard, "weighted_score": 0.7 * cosine + 0.3 * jaccard
+            })
+    return scored
+
+def write_scored_workbook(scored: Dict[str, List[Dict[str, Any]]], path: str):
+    """写出相似度评分文件（问题、标准答案、生成答案、三项评分）"""
+    from modules.analyzer import write_results_export
+    rows = [{"agent": agent, **r} for agent, agent_rows in scored.items() for r in agent_rows]
+    with open(path, "wb") as f:
+        write_results_export(rows, f)
+
+# ==================== 用例 ====================
+# 每个用例函数准备输入（不计时），返回被测的运行函数，运行函数返回本次完成的操作数
+
+def case_jieba_lcut(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    import jieba
+    from modules.similarity_scorer import prewarm_scoring
+    prewarm_scoring()
+    texts = [qa["answer"] for qa in make_qa_pairs(rows, seed)]
+
+    def run() -> int:
+        for text in texts:
+            jieba.lcut(text)
+        return len(texts)
+    return run
+
+def case_similarity_scores(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    from modules.similarity_scorer import SimilarityScorer, prewarm_scoring
+    prewarm_scoring()
+    pairs = [(qa["answer"], make_agent_answer(qa["answer"], seed)) for qa in make_qa_pairs(rows, seed)]
+    scorer = SimilarityScorer("", embedding_source=_local_embedding)
+
+    async def score_all():
+        for standard, generated in pairs:
+            await scorer.calculate_similarity_scores(standard, generated)
+
+    def run() -> int:
+        asyncio.run(score_all())
+        return len(pairs)
+    return run
+
+def _scored_file(rows: int, workdir: str, seed: int) -> str:
+    path = os.path.join(workdir, f"scored_{rows}.xlsx")
+    if not os.path.exists(path):
+        per_agent = -(-rows // AGENTS)
+        write_scored_workbook(_score_rows(make_results(per_agent, AGENTS, seed), seed), path)
+    return path
+
+def case_read_results_frame(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    from modules.analyzer import read_results_frame
+    path = _scored_file(rows, workdir, seed)
+
+    def run() -> int:
+        return len(read_results_frame(path))
+    return run
+
+def case_analyze_file(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    from modules.analyzer import Analyzer
+    from modules.executor import executor
+    path = _scored_file(rows, workdir, seed)
+
+    async def analyze() -> int:
+        # 每次使用新的 Analyzer，不命中已解析数据的缓存
+        result = await Analyzer().analyze_file(path)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["overall_stats"]["total_questions"]
+
+    def run() -> int:
+        return asyncio.run(analyze())
+
+    # 预先启动进程池并在子进程中导入 pandas，计时只包含读取和分析
+    run()
+    return run
+
+def case_create_qa_excel(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    from modules.qa_generator import QAGenerator
+    qa_pairs = make_qa_pairs(rows, seed)
+    generator = QAGenerator("")
+    path = os.path.join(workdir, "qa_pairs.xlsx")
+
+    def run() -> int:
+        generator.create_qa_excel(qa_pairs, path)
+        return len(qa_pairs)
+    return run
+
+def case_write_results(rows: int, workdir: str, seed: int) -> Callable[[], int]:
+    from modules.agent_tester import AgentTester
+    results = make_results(-(-rows // AGENTS), AGENTS, seed)
+    tester = AgentTester()
+    path = os.path.join(workdir, "results.xlsx")
+
+    def run() -> int:
+        tester.write_results(results, path)
+        return sum(len(r) for r in results.values())
+    return run
+
+CASES = {
+    "jieba_lcut": case_jieba_lcut,
+    "similarity_scores": case_similarity_scores,
+    "read_results_frame": case_read_results_frame,
+    "analyze_file": case_analyze_file,
+    "create_qa_excel": case_create_qa_excel,
+    "write_results": case_write_results
+}
+
+# ==================== 运行与报告 ====================
+
+def measure(case: str, rows: int, workdir: str, seed: int, memory: bool,
+            min_time: float = 1.0, max_runs: int = 5) -> Dict[str, Any]:
+    """运行用例直到累计耗时达到 min_time 秒（最多 max_runs 次），取单次耗时的中位数"""
+    run = CASES[case](rows, workdir, seed)
+    timings = []
+    while not timings or (sum(timings) < min_time and len(timings) < max_runs):
+        gc.collect()
+        started = time.perf_counter()
+        ops = run()
+        timings.append(time.perf_counter() - started)
+    seconds = statistics.median(timings)
+    result = {
+        "case": case,
+        "rows": rows,
+        "ops": ops,
+        "runs": len(timings),
+        "seconds": round(seconds, 4),
+        "ops_per_sec": round(ops / seconds, 1) if seconds else None
+    }
+    if memory:
+        # tracemalloc 会显著拖慢执行，内存单独统计一次，不影响计时结果
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_bytes"] = peak
+        result["bytes_per_op"] = round(peak / ops, 1) if ops else None
+    return result
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def print_table(results: List[Dict[str, Any]], previous: Dict[str, Dict[str, Any]]):
+    print(f"{'用例':<22}{'行数':>8}{'耗时(s)':>10}{'ops/s':>12}{'字节/op':>12}{'对比上次':>10}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['case']:<22}{r['rows']:>8}  失败: {r['error']}")
+            continue
+        change = "-"
+        before = previous.get(f"{r['case']}/{r['rows']}")
+        if before and before.get("ops_per_sec"):
+            change = f"{(r['ops_per_sec'] / before['ops_per_sec'] - 1) * 100:+.1f}%"
+        print(f"{r['case']:<22}{r['rows']:>8}{r['seconds']:>10}{r['ops_per_sec']:>12}"
+              f"{str(r.get('bytes_per_op', '-')):>12}{change:>10}")
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="评分和工作簿热点路径微基准")
+    parser.add_argument("--sizes", default="1000,10000", help="数据行数，逗号分隔（默认 1000,10000；可加 100000）")
+    parser.add_argument("--cases", default=",".join(CASES), help="用例，逗号分隔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=1.0, help="每个用例至少累计运行的秒数（默认 1）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例最多运行次数（默认 5）")
+    parser.add_argument("--no-memory", action="store_true", help="跳过 tracemalloc 内存统计")
+    parser.add_argument("--output", help="结果 JSON 文件（默认 benchmarks/results/micro-时间戳.json）")
+    parser.add_argument("--compare", default=BASELINE_FILE, help="对比 ops/s 的结果文件（默认 benchmarks/baseline_micro.json）")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入 benchmarks/baseline_micro.json")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    cases = [c for c in args.cases.split(",") if c]
+    for case in cases:
+        if case not in CASES:
+            parser.error(f"未知用例: {case}")
+
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    from modules.executor import executor
+
+    previous = {}
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, encoding="utf-8") as f:
+            previous = {f"{r['case']}/{r['rows']}": r for r in json.load(f)["results"] if "error" not in r}
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="micro_") as workdir:
+        for rows in sizes:
+            for case in cases:
+                print(f"运行 {case} / {rows} ...", flush=True)
+                try:
+                    results.append(measure(
+                        case, rows, workdir, args.seed, not args.no_memory, args.min_time, args.repeat
+                    ))
+                except Exception as e:
+                    results.append({"case": case, "rows": rows, "error": f"{type(e).__name__}: {e}"})
+    executor.shutdown()
+    print_table(results, previous)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "seed": args.seed,
+        "results": results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"micro-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+    if args.update_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {BASELINE_FILE}")
+    return 1 if any("error" in r for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import json
+import math
+import time
+import socket
+import random
+import asyncio
+import hashlib
+import multiprocessing
+import urllib.request
+from typing import Dict, Any, Optional
+from aiohttp import web
+
+from .synthetic import make_sentence, derive_rng
+
+class MockProfile:
+    """模拟接口的行为：延迟分布、错误率（500）和限流率（429）
+
+    distribution 可选 fixed（固定延迟）、uniform（0 ~ 2 倍均值均匀分布）
+    和 lognormal（对数正态分布，sigma 控制长尾，均值为 latency_ms）。
+    """
+
+    def __init__(self, latency_ms: float = 5.0, distribution: str = "lognormal", sigma: float = 0.5,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        if distribution not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self._random = random.Random(seed)
+
+    def delay(self) -> float:
+        """抽样一次响应延迟（秒）"""
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.distribution == "fixed":
+            return self.latency_ms / 1000
+        if self.distribution == "uniform":
+            return self._random.uniform(0, 2 * self.latency_ms) / 1000
+        # 对数正态分布的均值为 exp(mu + sigma^2 / 2)，据此反推 mu
+        mu = math.log(self.latency_ms) - self.sigma ** 2 / 2
+        return self._random.lognormvariate(mu, self.sigma) / 1000
+
+    def outcome(self) -> Optional[int]:
+        """抽样本次请求是否失败，返回 429/500 或 None（成功）"""
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": self.latency_ms, "distribution": self.distribution, "sigma": self.sigma,
+            "error_rate": self.error_rate, "throttle_rate": self.throttle_rate,
+            "retry_after": self.retry_after, "seed": self.seed
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MockProfile":
+        return cls(**data)
+
+class MockVendorServer:
+    """本地模拟的 Dify 和硅基流动接口
+
+    - POST /v1/chat-messages：Dify 阻塞模式对话，回答由问题派生
+    - GET  /v1/parameters：Dify 应用参数（健康检查使用）
+    - POST /v1/chat/completions：硅基流动对话，返回 qa_per_call 个问答对组成的 JSON
+    - POST /v1/embeddings：硅基流动向量，同样的输入总是返回同样的向量
+    - GET  /_stats：各接口的请求数和返回状态统计
+    """
+
+    def __init__(self, dify: MockProfile = None, siliconflow: MockProfile = None,
+                 qa_per_call: int = 10, embedding_dim: int = 1024):
+        self.profiles = {"dify": dify or MockProfile(), "siliconflow": siliconflow or MockProfile()}
+        self.qa_per_call = qa_per_call
+        self.embedding_dim = embedding_dim
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/v1/chat-messages", self.chat_messages)
+        app.router.add_get("/v1/parameters", self.parameters)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        app.router.add_get("/_stats", self.get_stats)
+        return app
+
+    def _count(self, route: str, status: int):
+        route_stats = self.stats.setdefault(route, {"requests": 0})
+        route_stats["requests"] += 1
+        route_stats[str(status)] = route_stats.get(str(status), 0) + 1
+
+    async def _simulate(self, vendor: str, route: str) -> Optional[web.Response]:
+        """按配置等待并决定是否返回错误，成功时返回 None"""
+        profile = self.profiles[vendor]
+        await asyncio.sleep(profile.delay())
+        status = profile.outcome()
+        if status == 429:
+            self._count(route, 429)
+            return web.json_response(
+                {"error": "rate limited"}, status=429,
+                headers={"Retry-After": str(profile.retry_after)}
+            )
+        if status == 500:
+            self._count(route, 500)
+            return web.json_response({"error": "internal error"}, status=500)
+        self._count(route, 200)
+        return None
+
+    async def chat_messages(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._simulate("dify", "dify/chat-messages")
+        if error is not None:
+            return error
+        query = body.get("query", "")
+        rng = derive_rng(0, "dify", query, body.get("user", ""))
+        answer = query + make_sentence(rng, 12, 30)
+        return web.json_response({
+            "answer": answer,
+            "metadata": {"usage": {
+                "prompt_tokens": len(query), "completion_tokens": len(answer),
+                "total_tokens": len(query) + len(answer),
+                "total_price": f"{(len(query) + len(answer)) * 2e-6:.7f}", "currency": "USD"
+            }}
+        })
+
+    async def parameters(self, request: web.Request) -> web.Response:
+        error = await self._simulate("dify", "dify/parameters")
+        return error if error is not None else web.json_response({"user_input_form": []})
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._simulate("siliconflow", "siliconflow/chat")
+        if error is not None:
+            return error
+        prompt = body["messages"][-1]["content"]
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        questions = []
+        for i in range(self.qa_per_call):
+            rng = derive_rng(0, "completion", key, i)
+            questions.append({
+                "question": f"{key}-{i}：{make_sentence(rng, 4, 8).rstrip('。')}是什么？",
+                "answer": make_sentence(rng, 12, 30)
+            })
+        content = json.dumps({"questions": questions}, ensure_ascii=False)
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content),
+                      "total_tokens": len(prompt) + len(content)}
+        })
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._simulate("siliconflow", "siliconflow/embeddings")
+        if error is not None:
+            return error
+        text = body.get("input", "")
+        rng = derive_rng(0, "embedding", text)
+        embedding = [rng.uniform(-1, 1) for _ in range(self.embedding_dim)]
+        return web.json_response({
+            "data": [{"embedding": embedding, "index": 0}],
+            "usage": {"prompt_tokens": len(text), "total_tokens": len(text)}
+        })
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+def free_port() -> int:
+    """获取一个空闲的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _serve(port: int, config: Dict[str, Any]):
+    """子进程入口：运行模拟服务直到进程被终止"""
+    server = MockVendorServer(
+        MockProfile.from_dict(config["dify"]), MockProfile.from_dict(config["siliconflow"]),
+        config["qa_per_call"], config["embedding_dim"]
+    )
+    web.run_app(server.create_app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+class MockServerProcess:
+    """在独立进程中运行模拟服务，避免与被测代码争用事件循环和 CPU"""
+
+    def __init__(self, dify: MockProfile = None, siliconflow: MockProfile = None,
+                 qa_per_call: int = 10, embedding_dim: int = 1024, port: int = None):
+        self.port = port or free_port()
+        self.config = {
+            "dify": (dify or MockProfile()).to_dict(),
+            "siliconflow": (siliconflow or MockProfile()).to_dict(),
+            "qa_per_call": qa_per_call,
+            "embedding_dim": embedding_dim
+        }
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self, timeout: float = 15.0):
+        self._process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(self.port, self.config), daemon=True
+        )
+        self._process.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.get_stats()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError(f"模拟服务在 {timeout} 秒内未启动")
+
+    @property
+    def stats_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/_stats"
+
+    @staticmethod
+    def fetch_stats(stats_url: str) -> Dict[str, Dict[str, int]]:
+        """读取模拟服务的调用统计（可在其他进程中调用）"""
+        with urllib.request.urlopen(stats_url, timeout=5) as response:
+            return json.loads(response.read())
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return self.fetch_stats(self.stats_url)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(5)
+            self._process = None
+
+    def __enter__(self) -> "MockServerProcess":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,72 @@
+import random
+import hashlib
+from typing import Dict, List
+
+# 合成中文文本用的词表（覆盖常见技术文档用语，保证 jieba 分词有代表性）
+VOCABULARY = [
+    "系统", "用户", "数据", "接口", "配置", "服务", "模型", "文档", "问题", "答案",
+    "智能体", "评估", "相似度", "向量", "分词", "任务", "队列", "进度", "结果", "文件",
+    "上传", "下载", "权限", "认证", "密钥", "请求", "响应", "超时", "重试", "限流",
+    "数据库", "索引", "缓存", "日志", "监控", "告警", "部署", "版本", "升级", "回滚",
+    "网络", "延迟", "吞吐量", "并发", "线程", "进程", "内存", "磁盘", "备份", "恢复",
+    "支持", "需要", "可以", "通过", "进行", "提供", "包括", "使用", "完成", "处理",
+    "自动", "手动", "默认", "最大", "最小", "平均", "实时", "异步", "批量", "定期"
+]
+PUNCTUATION = ["，", "，", "，", "。", "；", "、"]
+
+def derive_rng(seed: int, *parts) -> random.Random:
+    """由种子和标识派生独立的随机数生成器，保证同样的输入总是得到同样的数据"""
+    digest = hashlib.sha256(":".join(str(p) for p in (seed,) + parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def make_sentence(rng: random.Random, min_words: int = 6, max_words: int = 18) -> str:
+    """生成一个由词表随机组成的中文句子"""
+    words = []
+    for _ in range(rng.randint(min_words, max_words)):
+        words.append(rng.choice(VOCABULARY))
+        if rng.random() < 0.15:
+            words.append(rng.choice(PUNCTUATION[:-1]))
+    return "".join(words).strip("，；、") + "。"
+
+def make_paragraphs(count: int, seed: int = 0, sentences: int = 4) -> List[str]:
+    """生成 count 个合成段落"""
+    return [
+        "".join(make_sentence(derive_rng(seed, "paragraph", i)) for _ in range(sentences))
+        for i in range(count)
+    ]
+
+def make_qa_pairs(count: int, seed: int = 0) -> List[Dict[str, str]]:
+    """生成 count 个合成问答对（问题互不相同）"""
+    pairs = []
+    for i in range(count):
+        rng = derive_rng(seed, "qa", i)
+        subject = "".join(rng.choice(VOCABULARY) for _ in range(3))
+        pairs.append({
+            "question": f"第{i + 1}项：{subject}如何{rng.choice(VOCABULARY)}？",
+            "answer": make_sentence(rng, 12, 30) + make_sentence(rng, 8, 20)
+        })
+    return pairs
+
+def make_agent_answer(standard_answer: str, seed: int = 0, agent: str = "") -> str:
+    """由标准答案派生一个智能体回答：保留部分原句并替换部分词语，得分分布接近真实评估"""
+    rng = derive_rng(seed, "answer", agent, standard_answer)
+    words = list(standard_answer)
+    for i in range(len(words)):
+        if rng.random() < 0.2:
+            words[i] = rng.choice(VOCABULARY)
+    return "".join(words)
+
+def make_results(count: int, agents: int = 3, seed: int = 0) -> Dict[str, List[Dict[str, str]]]:
+    """生成各智能体的测试结果（与 AgentTester.results 结构相同）"""
+    qa_pairs = make_qa_pairs(count, seed)
+    return {
+        f"智能体{a}": [
+            {
+                "question": qa["question"],
+                "standard_answer": qa["answer"],
+                "agent_answer": make_agent_answer(qa["answer"], seed, f"智能体{a}")
+            }
+            for qa in qa_pairs
+        ]
+        for a in range(1, agents + 1)
+    }
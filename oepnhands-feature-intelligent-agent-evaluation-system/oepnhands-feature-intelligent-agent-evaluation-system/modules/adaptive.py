@@ -0,0 +1,177 @@
+import math
+from statistics import NormalDist
+from typing import Dict, List, Any
+
+# 默认置信度和每个智能体停止前至少评分的回答数
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_SAMPLES = 30
+
+_NORMAL = NormalDist()
+
+class RunningStats:
+    """在线计算均值和样本方差（Welford 算法），每次更新 O(1)"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+class AdaptiveEvaluation:
+    """自适应评估：回答到达后立即评分，排名确定的智能体不再继续提问
+
+    每个智能体维护综合相似度评分的运行均值和方差。两个智能体的均值之差按正态近似
+    （Welch 标准误）检验；某个智能体与其余每个智能体的差异都达到设定置信度，且双方
+    都已评分至少 min_samples 个回答时，它的名次即已确定，之后的问题不再发给它。
+    全部智能体的名次确定后提前结束测试。名次相近的智能体始终无法区分，会一直测试
+    到最后一题，此时与完整评估一致。
+
+    每题之后都要检验，若每次都按固定阈值判断，反复检验会使误判率远高于名义值。
+    因此误判概率 1-confidence 先按智能体对数平均分配（Bonferroni），再分配到各次检验：
+    样本数为 t 时只用其中的 min_samples/(t(t+1))，对所有 t 求和不超过总额，
+    任意时刻停止都保持设定的置信度。调用失败的回答不参与统计。
+    """
+
+    def __init__(self, scorer, confidence: float = DEFAULT_CONFIDENCE, min_samples: int = DEFAULT_MIN_SAMPLES):
+        self.scorer = scorer
+        self.confidence = confidence
+        self.min_samples = max(2, min_samples)
+        self.agents: List[str] = []
+        self.stats: Dict[str, RunningStats] = {}
+        self.calls: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+        self.settled_at: Dict[str, int] = {}
+        # 已计算的评分 {智能体: {行号: 评分}}，评分阶段直接复用
+        self.scores: Dict[str, Dict[int, Dict[str, float]]] = {}
+        self.total_questions = 0
+        self.questions_asked = 0
+
+    def start(self, agents: List[str], total_questions: int):
+        self.agents = list(agents)
+        self.stats = {agent: RunningStats() for agent in self.agents}
+        self.calls = {agent: 0 for agent in self.agents}
+        self.failed = {agent: 0 for agent in self.agents}
+        self.scores = {agent: {} for agent in self.agents}
+        self.settled_at = {}
+        self.total_questions = total_questions
+        self.questions_asked = 0
+
+    def _pairs(self) -> int:
+        return max(1, len(self.agents) * (len(self.agents) - 1) // 2)
+
+    def active(self) -> List[str]:
+        """仍需继续提问的智能体"""
+        return [agent for agent in self.agents if agent not in self.settled_at]
+
+    def finished(self) -> bool:
+        return len(self.agents) > 1 and not self.active()
+
+    async def score(self, row_index: int, standard_answer: str, calls: Dict[str, Dict[str, Any]]):
+        """为本题各智能体的回答评分并计入统计，calls 为 {智能体: 调用结果}"""
+        self.questions_asked += 1
+        answered = []
+        for agent, call in calls.items():
+            self.calls[agent] += 1
+            if call["success"] and call["answer"]:
+                answered.append((agent, call["answer"]))
+            else:
+                self.failed[agent] += 1
+        if not answered:
+            return
+        similarities = await self.scorer.score_answers(standard_answer, [answer for _, answer in answered])
+        for (agent, _), similarity in zip(answered, similarities):
+            self.scores[agent][row_index] = similarity
+            self.stats[agent].add(similarity["weighted_score"])
+
+    def _spending(self, a: str, b: str) -> float:
+        """该对比较在本次检验可用的误判概率份额（样本数为两者中较多的一方）"""
+        t = max(self.stats[a].n, self.stats[b].n, self.min_samples)
+        return self.min_samples / (t * (t + 1)) / self._pairs()
+
+    def _difference_z(self, a: str, b: str) -> float:
+        sa, sb = self.stats[a], self.stats[b]
+        if sa.n < 2 or sb.n < 2:
+            return 0.0
+        diff = abs(sa.mean - sb.mean)
+        se = math.sqrt(sa.variance / sa.n + sb.variance / sb.n)
+        if se == 0:
+            return math.inf if diff > 0 else 0.0
+        return diff / se
+
+    def _pair_confidence(self, a: str, b: str) -> float:
+        """两个智能体的先后次序已达到的置信度（已按比较对数和检验次数校正）"""
+        z = self._difference_z(a, b)
+        if z == math.inf:
+            return 1.0
+        p = 2 * (1 - _NORMAL.cdf(z))
+        return max(0.0, 1 - p / self._spending(a, b))
+
+    def update(self, question_number: int) -> List[str]:
+        """检验各智能体的名次是否已确定，返回本次新确定的智能体"""
+        if len(self.agents) < 2:
+            return []
+        newly = []
+        for agent in self.active():
+            if self.stats[agent].n < self.min_samples:
+                continue
+            if all(self.stats[other].n >= self.min_samples and self._pair_confidence(agent, other) >= self.confidence
+                   for other in self.agents if other != agent):
+                newly.append(agent)
+        for agent in newly:
+            self.settled_at[agent] = question_number
+        return newly
+
+    def interval(self, agent: str) -> tuple:
+        """均值在设定置信度下的置信区间"""
+        stats = self.stats[agent]
+        if stats.n < 2:
+            return None, None
+        half = _NORMAL.inv_cdf(0.5 + self.confidence / 2) * math.sqrt(stats.variance / stats.n)
+        return stats.mean - half, stats.mean + half
+
+    def report(self) -> Dict[str, Any]:
+        """评估报告：排名、置信区间、达到的置信度和节省的调用数"""
+        calls_made = sum(self.calls.values())
+        calls_full = self.total_questions * len(self.agents)
+        ordered = sorted(self.agents, key=lambda agent: self.stats[agent].mean, reverse=True)
+        ranking = []
+        for rank, agent in enumerate(ordered, 1):
+            low, high = self.interval(agent)
+            others = [self._pair_confidence(agent, other) for other in self.agents if other != agent]
+            ranking.append({
+                "agent": agent,
+                "rank": rank,
+                "mean_score": round(self.stats[agent].mean, 4),
+                "ci_low": round(low, 4) if low is not None else None,
+                "ci_high": round(high, 4) if high is not None else None,
+                "scored": self.stats[agent].n,
+                "calls": self.calls[agent],
+                "failed_calls": self.failed[agent],
+                "settled": agent in self.settled_at,
+                "settled_at_question": self.settled_at.get(agent),
+                "confidence_reached": round(min(others), 4) if others else None
+            })
+        pair_confidences = [self._pair_confidence(a, b) for i, a in enumerate(ordered) for b in ordered[i + 1:]]
+        return {
+            "confidence": self.confidence,
+            "min_samples": self.min_samples,
+            "questions": self.total_questions,
+            "questions_asked": self.questions_asked,
+            "calls_made": calls_made,
+            "calls_full": calls_full,
+            "calls_saved": calls_full - calls_made,
+            "saved_ratio": round((calls_full - calls_made) / calls_full, 4) if calls_full else 0.0,
+            "all_settled": self.finished(),
+            # 整个排名同时成立的置信度（各对比较中最低的一个）
+            "confidence_reached": round(min(pair_confidences), 4) if pair_confidences else None,
+            "ranking": ranking
+        }
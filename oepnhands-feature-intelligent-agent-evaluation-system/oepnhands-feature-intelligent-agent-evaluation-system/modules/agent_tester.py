@@ -1,13 +1,65 @@
 import aiohttp
 import asyncio
 import os
-from openpyxl import Workbook, load_workbook
-from typing import Dict, List, Any
+import time
+from typing import Dict, List, Any, Callable, Awaitable
 import json
+from .executor import executor
+from .rate_limiter import governor, estimate_tokens, retry_after_seconds
+from .usage import token_usage
+from .metrics import metrics
+from .tracing import tracer, SPAN_KIND_CLIENT
+
+def read_questions(file_path: str) -> List[Dict]:
+    """从Excel文件读取问答对（可在进程池中执行）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path)
+    ws = wb.active
+    questions = []
+    
+    for row in ws.iter_rows(min_row=2, values_only=True):
+        if row[0] and row[1]:  # 确保问题和答案都存在
+            questions.append({
+                "question": str(row[0]),
+                "answer": str(row[1])
+            })
+    
+    return questions
+
+def write_results_workbook(results_dict: Dict[str, List[Dict]], output_path: str):
+    """将各智能体的回答写入Excel文件（可在进程池中执行）"""
+    from openpyxl import Workbook
+    wb = Workbook()
+    # 删除默认sheet
+    wb.remove(wb.active)
+
+    for agent_name, rows in results_dict.items():
+        ws = wb.create_sheet(title=agent_name)
+        ws.append(["问题", "标准答案", f"{agent_name} 生成的答案"])
+        
+        for r in rows:
+            ws.append([r["question"], r["standard_answer"], r["agent_answer"]])
+            
+        # 自动调整列宽
+        for col in ws.columns:
+            max_length = 0
+            column = col[0].column_letter
+            for cell in col:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(cell.value)
+                except:
+                    pass
+            adjusted_width = min((max_length + 2), 50)
+            ws.column_dimensions[column].width = adjusted_width
+    
+    wb.save(output_path)
+    print(f"结果已保存至 {output_path}")
 
 class AgentTester:
     def __init__(self):
-        pass
+        # 最近一次测试的逐题结果（含调用耗时），供结果入库使用
+        self.results: Dict[str, List[Dict]] = {}
 
     async def test_connection(self, url: str, key: str) -> bool:
         """测试智能体连接"""
@@ -29,6 +81,36 @@ class AgentTester:
         except:
             return False
 
+    async def check_health(self, url: str, key: str, timeout: float = 10) -> Dict[str, Any]:
+        """轻量健康检查：请求应用参数接口（GET .../parameters），不触发模型调用
+
+        接口不存在（非Dify应用）时退回发送测试问题。返回是否可用、HTTP状态、耗时和错误信息。
+        """
+        headers = {"Authorization": key}
+        parameters_url = url.rsplit("/", 1)[0] + "/parameters"
+        start = time.perf_counter()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(parameters_url, headers=headers, timeout=timeout) as response:
+                    status = response.status
+            if status in (404, 405):
+                ok = await self.test_connection(url, key)
+                status = 200 if ok else status
+            return {
+                "ok": status == 200,
+                "http_status": status,
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "error": None if status == 200 else f"HTTP {status}"
+            }
+        except Exception as e:
+            return {
+                "ok": False,
+                "http_status": None,
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "error": str(e) or type(e).__name__
+            }
+
+    @tracer.traced("agent call", SPAN_KIND_CLIENT)
     async def call_dify(self, agent_name: str, agent_config: Dict, question: str, user_id: str = "eval_user") -> str:
         """调用Dify智能体"""
         payload = {
@@ -42,60 +124,55 @@ class AgentTester:
             "Content-Type": "application/json"
         }
         
+        # Dify接口默认不限额，只统计调用量；需要时可用 governor.configure(url, rpm, tpm) 设置
+        estimated = estimate_tokens(question)
+        span = tracer.current_span()
+        span.set_attributes({"agent.name": agent_name, "http.url": agent_config["url"], "retry.count": 0})
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(agent_config["url"], json=payload, headers=headers, timeout=60) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    return result.get("answer", "")
+            await governor.acquire(agent_config["key"], agent_config["url"], estimated)
+            with metrics.outbound("dify", agent_name) as call:
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(agent_config["url"], json=payload, headers=headers, timeout=60) as response:
+                        call.status = response.status
+                        span.set_attribute("http.response.status_code", response.status)
+                        if response.status == 429:
+                            governor.penalize(agent_config["key"], agent_config["url"], retry_after_seconds(response.headers))
+                        response.raise_for_status()
+                        span.set_attribute("http.response.body.size", len(await response.read()))
+                        result = await response.json()
+                        usage = (result.get("metadata") or {}).get("usage") or {}
+                        prompt_tokens, completion_tokens = token_usage.record("dify", agent_name, usage, estimated)
+                        span.set_attributes({"tokens.prompt": prompt_tokens, "tokens.completion": completion_tokens,
+                                             "tokens.total": prompt_tokens + completion_tokens})
+                        governor.settle(agent_config["key"], agent_config["url"], estimated, prompt_tokens + completion_tokens)
+                        return result.get("answer", "")
         except Exception as e:
+            token_usage.record_error("dify", agent_name)
+            span.set_error(e)
             return f"Error calling {agent_name}: {e}"
 
+    async def _timed_call(self, agent_name: str, agent_config: Dict, question: str, user_id: str) -> Dict[str, Any]:
+        """调用智能体并记录耗时"""
+        start = time.perf_counter()
+        answer = await self.call_dify(agent_name, agent_config, question, user_id)
+        return {
+            "answer": answer,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "success": not answer.startswith(f"Error calling {agent_name}:")
+        }
+
     def read_questions_from_excel(self, file_path: str) -> List[Dict]:
         """从Excel文件读取问答对"""
-        wb = load_workbook(file_path)
-        ws = wb.active
-        questions = []
-        
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] and row[1]:  # 确保问题和答案都存在
-                questions.append({
-                    "question": str(row[0]),
-                    "answer": str(row[1])
-                })
-        
-        return questions
+        return read_questions(file_path)
 
     def write_results(self, results_dict: Dict[str, List[Dict]], output_path: str):
         """将结果写入Excel文件"""
-        wb = Workbook()
-        # 删除默认sheet
-        wb.remove(wb.active)
+        write_results_workbook(results_dict, output_path)
 
-        for agent_name, rows in results_dict.items():
-            ws = wb.create_sheet(title=agent_name)
-            ws.append(["问题", "标准答案", f"{agent_name} 生成的答案"])
-            
-            for r in rows:
-                ws.append([r["question"], r["standard_answer"], r["agent_answer"]])
-                
-            # 自动调整列宽
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(cell.value)
-                    except:
-                        pass
-                adjusted_width = min((max_length + 2), 50)
-                ws.column_dimensions[column].width = adjusted_width
-        
-        wb.save(output_path)
-        print(f"结果已保存至 {output_path}")
-
-    async def test_agents(self, agents_config: Dict, file_paths: List[str], output_path: str, delay: int = 1) -> int:
+    async def test_agents(self, agents_config: Dict, file_paths: List[str], output_path: str, delay: int = 1,
+                          qa_progress_callback: Callable[[int, int], None] = None,
+                          progress_callback: Callable[[int, int], None] = None,
+                          wait_if_paused: Callable[[], Awaitable[None]] = None) -> int:
         """测试智能体（从DOCX文件生成问答对）"""
         # 首先需要生成问答对
         from .qa_generator import QAGenerator
@@ -105,14 +182,27 @@ class AgentTester:
         qa_generator = QAGenerator("sk-elnmwevbokezmyjvyafilsfsvdgwqbgsrjvlrnfhzsodtakc")
         temp_qa_file = f"temp_qa_{os.path.basename(output_path)}"
         
-        questions = await qa_generator.process_documents(file_paths, temp_qa_file)
+        questions = await qa_generator.process_documents(file_paths, temp_qa_file, progress_callback=qa_progress_callback,
+                                                          wait_if_paused=wait_if_paused)
         
         # 然后测试智能体
-        return await self.test_agents_with_qa_file(agents_config, temp_qa_file, output_path, delay)
+        return await self.test_agents_with_qa_file(agents_config, temp_qa_file, output_path, delay, progress_callback, wait_if_paused)
+
+    @tracer.traced("stage testing")
+    @token_usage.stage("testing")
+    async def test_agents_with_qa_file(self, agents_config: Dict, qa_file_path: str, output_path: str, delay: int = 1, progress_callback: Callable[[int, int], None] = None,
+                                       wait_if_paused: Callable[[], Awaitable[None]] = None, adaptive=None) -> int:
+        """使用已有的问答对文件测试智能体，progress_callback(已完成问题数, 问题总数) 用于报告进度
 
-    async def test_agents_with_qa_file(self, agents_config: Dict, qa_file_path: str, output_path: str, delay: int = 1) -> int:
-        """使用已有的问答对文件测试智能体"""
-        questions = self.read_questions_from_excel(qa_file_path)
+        wait_if_paused 在每个问题之前调用，任务暂停时在此等待；已完成的回答
+        实时保存在 self.results 中，任务被取消时可据此记录部分结果。
+        传入 adaptive（AdaptiveEvaluation）时每题的回答立即评分，名次已确定的智能体
+        不再提问，全部确定后提前结束；返回实际提问的问题数。
+        """
+        started = time.perf_counter()
+        with tracer.span("workbook read", {"file.path": qa_file_path}) as span:
+            questions = await executor.run_cpu(read_questions, qa_file_path)
+            span.set_attribute("rows", len(questions))
         
         if not questions:
             raise Exception("没有找到有效的问答对")
@@ -125,30 +215,64 @@ class AgentTester:
                 active_agents[f"智能体{i}"] = agents_config[agent_key]
 
         results = {agent_name: [] for agent_name in active_agents.keys()}
+        self.results = results
+        if adaptive is not None:
+            adaptive.start(list(active_agents), len(questions))
+        tracer.current_span().set_attributes({"agents": len(active_agents), "items.total": len(questions)})
+        if progress_callback:
+            progress_callback(0, len(questions))
 
         # 测试每个问题
+        asked = 0
         for idx, item in enumerate(questions, 1):
-            print(f"正在处理第 {idx}/{len(questions)} 个问题...")
-            question = item["question"]
+            if adaptive is not None and adaptive.finished():
+                print(f"全部智能体的名次已确定，跳过剩余 {len(questions) - asked} 个问题")
+                break
+            if wait_if_paused:
+                await wait_if_paused()
+            agents = {name: active_agents[name] for name in adaptive.active()} if adaptive is not None else active_agents
+            with tracer.span("question", {"question.index": idx, "agents": len(agents)}):
+                print(f"正在处理第 {idx}/{len(questions)} 个问题...")
+                question = item["question"]
             
-            # 并发调用所有智能体
-            tasks = []
-            for agent_name, agent_config in active_agents.items():
-                task = self.call_dify(agent_name, agent_config, question, f"{agent_name}_user_{idx}")
-                tasks.append((agent_name, task))
+                # 并发调用所有智能体
+                tasks = []
+                for agent_name, agent_config in agents.items():
+                    task = self._timed_call(agent_name, agent_config, question, f"{agent_name}_user_{idx}")
+                    tasks.append((agent_name, task))
             
-            # 等待所有调用完成
-            for agent_name, task in tasks:
-                answer = await task
-                results[agent_name].append({
-                    "question": question,
-                    "standard_answer": item["answer"],
-                    "agent_answer": answer
-                })
+                # 等待所有调用完成
+                calls = {}
+                for agent_name, task in tasks:
+                    call = calls[agent_name] = await task
+                    results[agent_name].append({
+                        "question": question,
+                        "standard_answer": item["answer"],
+                        "agent_answer": call["answer"],
+                        "latency_ms": call["latency_ms"],
+                        "success": call["success"]
+                    })
+
+                if adaptive is not None:
+                    await adaptive.score(idx - 1, item["answer"], calls)
+                    for agent_name in adaptive.update(idx):
+                        print(f"{agent_name} 的名次已确定（第 {idx} 题），不再继续提问")
+            
+            asked = idx
+            metrics.record_items("testing")
+            token_usage.count_item()
+            if progress_callback:
+                progress_callback(idx, len(questions))
             
             # 控制请求频率
             if delay > 0:
                 await asyncio.sleep(delay)
 
-        self.write_results(results, output_path)
-        return len(questions)
\ No newline at end of file
+        if progress_callback and asked < len(questions):
+            progress_callback(len(questions), len(questions))
+
+        with tracer.span("workbook save", {"file.path": output_path, "rows": sum(len(rows) for rows in results.values())}) as span:
+            await executor.run_cpu(write_results_workbook, results, output_path)
+            span.set_attribute("file.size", os.path.getsize(output_path))
+        metrics.observe_stage("testing", time.perf_counter() - started)
+        return asked
\ No newline at end of file
@@ -0,0 +1,150 @@
+import os
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from .metrics import metrics
+
+class AnalysisCache:
+    """分析结果缓存
+
+    以 (文件路径, 修改时间, 文件大小) 为键缓存 Analyzer.analyze_file 的结果，
+    文件被覆盖或修改后键自然失效；超出内存上限时按LRU淘汰。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._pending: Dict[Tuple, asyncio.Future] = {}
+        self._warm_tasks = set()
+        self._analyzer = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def analyzer(self):
+        """共享的Analyzer实例，复用已解析的文件数据"""
+        if self._analyzer is None:
+            from .analyzer import Analyzer
+            self._analyzer = Analyzer()
+        return self._analyzer
+
+    def _file_key(self, file_path: str) -> Optional[Tuple]:
+        """生成缓存键，文件不存在时返回None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    def _estimate_size(self, data: Dict[str, Any]) -> int:
+        """估算结果占用的内存大小"""
+        try:
+            return len(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        except (TypeError, ValueError):
+            return 0
+
+    def _lookup(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        path = key[0]
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if entry["key"] != key:
+            # 文件已变化，丢弃旧结果
+            self._remove(path)
+            return None
+        self._entries.move_to_end(path)
+        return entry["data"]
+
+    def _store(self, key: Tuple, data: Dict[str, Any]):
+        size = self._estimate_size(data)
+        if size > self.max_bytes:
+            return
+        path = key[0]
+        self._remove(path)
+        self._entries[path] = {"key": key, "data": data, "size": size}
+        self._total_bytes += size
+        while self._entries and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._total_bytes -= entry["size"]
+
+    async def get_analysis(self, file_path: str) -> Dict[str, Any]:
+        """获取文件分析结果，命中缓存时直接返回"""
+        key = self._file_key(file_path)
+        if key is None:
+            return {"error": "文件不存在"}
+
+        cached = self._lookup(key)
+        if cached is not None:
+            self.hits += 1
+            metrics.record_cache("analysis", True)
+            return cached
+
+        # 同一文件的并发请求只解析一次
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            metrics.record_cache("analysis", True)
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        metrics.record_cache("analysis", False)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            data = await self.analyzer.analyze_file(file_path)
+            if "error" not in data:
+                self._store(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            # 标记异常已被获取，避免无人等待时输出警告
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+            if not future.done():
+                future.cancel()
+
+    def warm(self, file_path: str):
+        """在后台预热指定文件的分析结果"""
+        task = asyncio.create_task(self._warm(file_path))
+        self._warm_tasks.add(task)
+        task.add_done_callback(self._warm_tasks.discard)
+
+    async def _warm(self, file_path: str):
+        try:
+            await self.get_analysis(file_path)
+        except Exception as e:
+            print(f"预热分析缓存失败 {file_path}: {e}")
+
+    def invalidate(self, file_path: str):
+        """使指定文件的缓存失效"""
+        self._remove(os.path.abspath(file_path))
+        if self._analyzer is not None:
+            self._analyzer.forget(file_path)
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
@@ -1,145 +1,333 @@
+import os
+import io
+import base64
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from openpyxl import load_workbook
-from typing import Dict, List, Any
+from openpyxl import Workbook, load_workbook
+from typing import Dict, List, Any, Optional, Tuple
 import json
+from .executor import executor
+
+# 长表的列：每一行对应一个智能体对一个问题的回答
+RESULT_COLUMNS = [
+    "agent", "row", "has_question", "question", "standard_answer", "generated_answer",
+    "cosine_similarity", "jaccard_similarity", "weighted_score"
+]
+
+# 问题级查询可排序的字段，row 表示按问题原顺序
+SORTABLE_FIELDS = ["weighted_score", "cosine_similarity", "jaccard_similarity", "row"]
+
+def encode_cursor(values: list) -> str:
+    """将分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(list(values))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[float, int, int]:
+    """解析游标字符串为 (排序值, 智能体顺序, 行号)"""
+    try:
+        value, agent_order, row = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(value), int(agent_order), int(row)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+def _to_float(value) -> float:
+    return float(value) if value is not None else np.nan
+
+def read_results_frame(file_path: str) -> pd.DataFrame:
+    """一次性读取评分文件，转换为 (智能体, 问题, 指标) 长表（可在进程池中执行）"""
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        columns = {name: [] for name in RESULT_COLUMNS}
+        sheet_names = wb.sheetnames
+
+        for sheet_name in sheet_names:
+            ws = wb[sheet_name]
+            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+                if len(row) < 6:
+                    continue
+                columns["agent"].append(sheet_name)
+                columns["row"].append(row_idx)
+                columns["has_question"].append(bool(row[0]))
+                columns["question"].append(str(row[0]) if row[0] else "")
+                columns["standard_answer"].append(str(row[1]) if row[1] else "")
+                columns["generated_answer"].append(str(row[2]) if row[2] else "")
+                columns["cosine_similarity"].append(_to_float(row[3]))
+                columns["jaccard_similarity"].append(_to_float(row[4]))
+                columns["weighted_score"].append(_to_float(row[5]))
+    finally:
+        wb.close()
+
+    df = pd.DataFrame(columns, columns=RESULT_COLUMNS)
+    # 保持工作表原有顺序
+    df["agent"] = pd.Categorical(df["agent"], categories=sheet_names)
+    for col in ("cosine_similarity", "jaccard_similarity", "weighted_score"):
+        df[col] = df[col].astype(float)
+    return df
+
+def write_results_export(rows: List[Dict], output) -> None:
+    """将评分行写成与相似度评分文件相同结构的Excel（每个智能体一个工作表）"""
+    wb = Workbook(write_only=True)
+    sheets = {}
+    for r in rows:
+        ws = sheets.get(r["agent"])
+        if ws is None:
+            ws = wb.create_sheet(title=r["agent"])
+            ws.append(["问题", "标准答案", f"{r['agent']} 生成的答案", "余弦相似度", "Jaccard相似度", "综合相似度评分"])
+            sheets[r["agent"]] = ws
+        ws.append([
+            r["question"], r["standard_answer"], r["generated_answer"],
+            r["cosine_similarity"], r["jaccard_similarity"], r["weighted_score"]
+        ])
+    if not sheets:
+        wb.create_sheet(title="结果")
+    wb.save(output)
+
+def build_results_export(rows: List[Dict]) -> bytes:
+    """生成导出Excel的内容（可在进程池中执行）"""
+    buffer = io.BytesIO()
+    write_results_export(rows, buffer)
+    return buffer.getvalue()
 
 class Analyzer:
-    def __init__(self):
-        pass
+    def __init__(self, max_frames: int = 4):
+        self.max_frames = max_frames
+        self._frames: "OrderedDict[str, Tuple[Tuple, pd.DataFrame]]" = OrderedDict()
+
+    def _cached_frame(self, file_path: str) -> Tuple[Tuple, Optional[pd.DataFrame]]:
+        stat = os.stat(file_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._frames.get(file_path)
+        if cached and cached[0] == key:
+            self._frames.move_to_end(file_path)
+            return key, cached[1]
+        return key, None
+
+    def _remember(self, file_path: str, key: Tuple, df: pd.DataFrame):
+        self._frames[file_path] = (key, df)
+        self._frames.move_to_end(file_path)
+        while len(self._frames) > self.max_frames:
+            self._frames.popitem(last=False)
+
+    def load_results(self, file_path: str) -> pd.DataFrame:
+        """加载评分文件为长表，同一文件未变化时复用已解析结果"""
+        key, df = self._cached_frame(file_path)
+        if df is None:
+            df = read_results_frame(file_path)
+            self._remember(file_path, key, df)
+        return df
+
+    async def load_results_async(self, file_path: str) -> pd.DataFrame:
+        """与 load_results 相同，但在进程池中解析文件，不阻塞事件循环"""
+        key, df = self._cached_frame(file_path)
+        if df is None:
+            df = await executor.run_cpu(read_results_frame, file_path)
+            self._remember(file_path, key, df)
+        return df
+
+    def forget(self, file_path: str):
+        """丢弃已解析的文件数据"""
+        self._frames.pop(file_path, None)
+
+    def _scored(self, df: pd.DataFrame) -> pd.DataFrame:
+        """筛选出有综合相似度评分的行"""
+        return df[df["weighted_score"].notna()]
+
+    def _agent_stats(self, scored: pd.DataFrame) -> pd.DataFrame:
+        """按智能体分组计算评分统计"""
+        scores = scored["weighted_score"]
+        grouped = scored.assign(
+            high=scores >= 0.8,
+            low=scores < 0.5,
+            excellent=scores >= 0.9,
+            good=(scores >= 0.7) & (scores < 0.9),
+            fair=(scores >= 0.5) & (scores < 0.7)
+        ).groupby("agent", observed=True, sort=True)
+
+        stats = grouped["weighted_score"].agg(["count", "mean", "median", "max", "min"])
+        stats["std"] = grouped["weighted_score"].std(ddof=0)
+        counts = grouped[["high", "low", "excellent", "good", "fair"]].sum()
+        stats = stats.join(counts)
+        stats["high_score_ratio"] = stats["high"] / stats["count"]
+        stats["low_score_ratio"] = stats["low"] / stats["count"]
+        stats["consistency"] = 1 / (1 + stats["std"])
+        return stats
+
+    def _ranked(self, stats: pd.DataFrame) -> pd.DataFrame:
+        """按平均分降序排列（同分保持原顺序）"""
+        return stats.sort_values("mean", ascending=False, kind="stable")
+
+    def _question_table(self, df: pd.DataFrame) -> pd.DataFrame:
+        """问题级数据：只保留有问题内容的行，缺失指标视为0"""
+        df = df[df["has_question"]]
+        return df.assign(
+            agent_order=df["agent"].cat.codes,
+            cosine_similarity=df["cosine_similarity"].fillna(0.0),
+            jaccard_similarity=df["jaccard_similarity"].fillna(0.0),
+            weighted_score=df["weighted_score"].fillna(0.0)
+        )
+
+    def _question_records(self, df: pd.DataFrame) -> List[Dict]:
+        details = pd.DataFrame({
+            "id": df["agent"].astype(str) + "_" + df["row"].astype(str),
+            "agent": df["agent"].astype(str),
+            "question": df["question"],
+            "standard_answer": df["standard_answer"],
+            "generated_answer": df["generated_answer"],
+            "cosine_similarity": df["cosine_similarity"],
+            "jaccard_similarity": df["jaccard_similarity"],
+            "weighted_score": df["weighted_score"]
+        })
+        return details.to_dict("records")
 
     async def analyze_file(self, file_path: str) -> Dict[str, Any]:
         """分析相似度评分文件"""
         try:
-            wb = load_workbook(file_path)
+            df = await self.load_results_async(file_path)
             analysis_result = {
                 "agents": {},
                 "comparison": {},
                 "best_agent": None,
                 "overall_stats": {}
             }
-            
-            agent_scores = {}
-            
+
+            scored = self._scored(df)
+            if scored.empty:
+                return analysis_result
+
+            stats = self._agent_stats(scored)
+
             # 分析每个智能体的表现
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                scores = []
-                questions_data = []
-                
-                # 读取数据
-                for row in ws.iter_rows(min_row=2, values_only=True):
-                    if len(row) >= 6 and row[5] is not None:  # 确保有综合相似度评分
-                        score = float(row[5])
-                        scores.append(score)
-                        
-                        questions_data.append({
-                            "question": str(row[0]) if row[0] else "",
-                            "standard_answer": str(row[1]) if row[1] else "",
-                            "generated_answer": str(row[2]) if row[2] else "",
-                            "cosine_similarity": float(row[3]) if row[3] is not None else 0.0,
-                            "jaccard_similarity": float(row[4]) if row[4] is not None else 0.0,
-                            "weighted_score": score
-                        })
-                
-                if scores:
-                    scores_array = np.array(scores)
-                    
-                    # 计算统计信息
-                    agent_analysis = {
-                        "name": sheet_name,
-                        "total_questions": len(scores),
-                        "mean_score": float(np.mean(scores_array)),
-                        "median_score": float(np.median(scores_array)),
-                        "max_score": float(np.max(scores_array)),
-                        "min_score": float(np.min(scores_array)),
-                        "std_score": float(np.std(scores_array)),
-                        "high_score_ratio": float(np.sum(scores_array >= 0.8) / len(scores_array)),
-                        "low_score_ratio": float(np.sum(scores_array < 0.5) / len(scores_array)),
-                        "score_distribution": {
-                            "excellent": int(np.sum(scores_array >= 0.9)),  # 优秀 (>=0.9)
-                            "good": int(np.sum((scores_array >= 0.7) & (scores_array < 0.9))),  # 良好 (0.7-0.9)
-                            "fair": int(np.sum((scores_array >= 0.5) & (scores_array < 0.7))),  # 一般 (0.5-0.7)
-                            "poor": int(np.sum(scores_array < 0.5))  # 较差 (<0.5)
-                        },
-                        "questions": questions_data
-                    }
-                    
-                    analysis_result["agents"][sheet_name] = agent_analysis
-                    agent_scores[sheet_name] = np.mean(scores_array)
-            
-            # 确定最佳智能体
-            if agent_scores:
-                best_agent = max(agent_scores, key=agent_scores.get)
-                analysis_result["best_agent"] = best_agent
-                
-                # 智能体比较
-                sorted_agents = sorted(agent_scores.items(), key=lambda x: x[1], reverse=True)
-                analysis_result["comparison"]["ranking"] = [
-                    {"agent": agent, "score": float(score)} for agent, score in sorted_agents
-                ]
-                
-                # 整体统计
-                all_scores = []
-                for agent_data in analysis_result["agents"].values():
-                    all_scores.extend([q["weighted_score"] for q in agent_data["questions"]])
-                
-                if all_scores:
-                    all_scores_array = np.array(all_scores)
-                    analysis_result["overall_stats"] = {
-                        "total_questions": len(all_scores),
-                        "mean_score": float(np.mean(all_scores_array)),
-                        "median_score": float(np.median(all_scores_array)),
-                        "max_score": float(np.max(all_scores_array)),
-                        "min_score": float(np.min(all_scores_array)),
-                        "std_score": float(np.std(all_scores_array))
+            for agent, s in stats.iterrows():
+                analysis_result["agents"][agent] = {
+                    "name": agent,
+                    "total_questions": int(s["count"]),
+                    "mean_score": float(s["mean"]),
+                    "median_score": float(s["median"]),
+                    "max_score": float(s["max"]),
+                    "min_score": float(s["min"]),
+                    "std_score": float(s["std"]),
+                    "high_score_ratio": float(s["high_score_ratio"]),
+                    "low_score_ratio": float(s["low_score_ratio"]),
+                    "score_distribution": {
+                        "excellent": int(s["excellent"]),  # 优秀 (>=0.9)
+                        "good": int(s["good"]),  # 良好 (0.7-0.9)
+                        "fair": int(s["fair"]),  # 一般 (0.5-0.7)
+                        "poor": int(s["low"])  # 较差 (<0.5)
                     }
-            
+                }
+
+            # 确定最佳智能体与排名
+            ranked = self._ranked(stats)
+            analysis_result["best_agent"] = ranked.index[0]
+            analysis_result["comparison"]["ranking"] = [
+                {"agent": agent, "score": float(score)} for agent, score in ranked["mean"].items()
+            ]
+
+            # 整体统计
+            all_scores = scored["weighted_score"].to_numpy()
+            analysis_result["overall_stats"] = {
+                "total_questions": int(all_scores.size),
+                "mean_score": float(np.mean(all_scores)),
+                "median_score": float(np.median(all_scores)),
+                "max_score": float(np.max(all_scores)),
+                "min_score": float(np.min(all_scores)),
+                "std_score": float(np.std(all_scores))
+            }
+
             return analysis_result
-            
+
         except Exception as e:
             return {"error": f"分析文件失败: {str(e)}"}
 
     def get_question_details(self, file_path: str, agent_name: str = None) -> List[Dict]:
         """获取问题详细信息"""
         try:
-            wb = load_workbook(file_path)
-            
-            if agent_name and agent_name in wb.sheetnames:
-                sheets_to_process = [agent_name]
-            else:
-                sheets_to_process = wb.sheetnames
-            
-            questions = []
-            
-            for sheet_name in sheets_to_process:
-                ws = wb[sheet_name]
-                
-                for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                    if len(row) >= 6 and row[0]:  # 确保有问题内容
-                        question_data = {
-                            "id": f"{sheet_name}_{row_idx}",
-                            "agent": sheet_name,
-                            "question": str(row[0]),
-                            "standard_answer": str(row[1]) if row[1] else "",
-                            "generated_answer": str(row[2]) if row[2] else "",
-                            "cosine_similarity": float(row[3]) if row[3] is not None else 0.0,
-                            "jaccard_similarity": float(row[4]) if row[4] is not None else 0.0,
-                            "weighted_score": float(row[5]) if row[5] is not None else 0.0
-                        }
-                        questions.append(question_data)
-            
+            df = self.load_results(file_path)
+
+            if agent_name and agent_name in df["agent"].cat.categories:
+                df = df[df["agent"] == agent_name]
+
             # 按综合评分排序
-            questions.sort(key=lambda x: x["weighted_score"], reverse=True)
-            return questions
-            
+            df = self._question_table(df).sort_values("weighted_score", ascending=False, kind="stable")
+            return self._question_records(df)
+
         except Exception as e:
             return []
 
+    def query_questions(self, file_path: str, agent_name: str = None, sort_by: str = "weighted_score",
+                        descending: bool = True, min_score: float = None, max_score: float = None,
+                        cursor: str = None, limit: int = 50) -> Dict[str, Any]:
+        """分页查询问题级结果
+
+        支持按智能体和综合评分区间过滤、按任意指标排序。游标记录上一页最后一行的
+        (排序值, 智能体顺序, 行号)，下一页从其之后继续，翻页时结果不会重复或遗漏。
+        """
+        if sort_by not in SORTABLE_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+
+        df = self._question_table(self.load_results(file_path))
+        if agent_name:
+            df = df[df["agent"] == agent_name]
+        if min_score is not None:
+            df = df[df["weighted_score"] >= min_score]
+        if max_score is not None:
+            df = df[df["weighted_score"] <= max_score]
+        total = len(df)
+
+        values = df[sort_by].astype(float)
+        if cursor:
+            value, agent_order, row = decode_cursor(cursor)
+            tie = (values == value) & (
+                (df["agent_order"] > agent_order) |
+                ((df["agent_order"] == agent_order) & (df["row"] > row))
+            )
+            after = values < value if descending else values > value
+            df = df[after | tie]
+
+        # 同值按智能体顺序、行号升序，保证翻页稳定
+        df = df.assign(_value=-values if descending else values)
+        page = df.sort_values(["_value", "agent_order", "row"], kind="stable").head(limit)
+
+        next_cursor = None
+        if len(page) == limit and len(df) > limit:
+            last = page.iloc[-1]
+            next_cursor = encode_cursor([float(last[sort_by]), int(last["agent_order"]), int(last["row"])])
+
+        return {
+            "items": self._question_records(page),
+            "total": total,
+            "next_cursor": next_cursor
+        }
+
+    def top_questions(self, file_path: str, k: int = 10, metric: str = "weighted_score",
+                      bottom: bool = False, agent_name: str = None) -> List[Dict]:
+        """获取指标最高（或最低）的 k 个问题，使用部分选择而非全量排序"""
+        if metric not in SORTABLE_FIELDS:
+            raise ValueError(f"不支持的排序字段: {metric}")
+
+        df = self._question_table(self.load_results(file_path))
+        if agent_name:
+            df = df[df["agent"] == agent_name]
+        if k <= 0 or df.empty:
+            return []
+
+        values = df[metric].to_numpy(dtype=float)
+        if not bottom:
+            values = -values
+        k = min(k, len(values))
+        if k < len(values):
+            candidates = np.argpartition(values, k - 1)[:k]
+        else:
+            candidates = np.arange(len(values))
+        # 只对选出的 k 个候选排序
+        selected = candidates[np.argsort(values[candidates], kind="stable")]
+        return self._question_records(df.iloc[selected])
+
     def compare_agents(self, file_path: str) -> Dict[str, Any]:
         """比较不同智能体的表现"""
         try:
-            wb = load_workbook(file_path)
+            df = self.load_results(file_path)
             comparison = {
                 "agents": [],
                 "metrics": {
@@ -149,37 +337,30 @@ class Analyzer:
                     "consistency": {}  # 标准差，越小越一致
                 }
             }
-            
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                scores = []
-                
-                for row in ws.iter_rows(min_row=2, values_only=True):
-                    if len(row) >= 6 and row[5] is not None:
-                        scores.append(float(row[5]))
-                
-                if scores:
-                    scores_array = np.array(scores)
-                    
-                    agent_metrics = {
-                        "name": sheet_name,
-                        "mean_score": float(np.mean(scores_array)),
-                        "high_score_ratio": float(np.sum(scores_array >= 0.8) / len(scores_array)),
-                        "low_score_ratio": float(np.sum(scores_array < 0.5) / len(scores_array)),
-                        "consistency": float(1 / (1 + np.std(scores_array)))  # 一致性指标
-                    }
-                    
-                    comparison["agents"].append(agent_metrics)
-                    comparison["metrics"]["mean_scores"][sheet_name] = agent_metrics["mean_score"]
-                    comparison["metrics"]["high_score_ratios"][sheet_name] = agent_metrics["high_score_ratio"]
-                    comparison["metrics"]["low_score_ratios"][sheet_name] = agent_metrics["low_score_ratio"]
-                    comparison["metrics"]["consistency"][sheet_name] = agent_metrics["consistency"]
-            
+
+            scored = self._scored(df)
+            if scored.empty:
+                return comparison
+
+            stats = self._agent_stats(scored)
+            for agent, s in stats.iterrows():
+                comparison["metrics"]["mean_scores"][agent] = float(s["mean"])
+                comparison["metrics"]["high_score_ratios"][agent] = float(s["high_score_ratio"])
+                comparison["metrics"]["low_score_ratios"][agent] = float(s["low_score_ratio"])
+                comparison["metrics"]["consistency"][agent] = float(s["consistency"])
+
             # 排序
-            comparison["agents"].sort(key=lambda x: x["mean_score"], reverse=True)
-            
+            for agent, s in self._ranked(stats).iterrows():
+                comparison["agents"].append({
+                    "name": agent,
+                    "mean_score": float(s["mean"]),
+                    "high_score_ratio": float(s["high_score_ratio"]),
+                    "low_score_ratio": float(s["low_score_ratio"]),
+                    "consistency": float(s["consistency"])  # 一致性指标
+                })
+
             return comparison
-            
+
         except Exception as e:
             return {"error": f"比较智能体失败: {str(e)}"}
 
@@ -187,65 +368,69 @@ class Analyzer:
         """获取性能洞察"""
         try:
             analysis = self.compare_agents(file_path)
-            
+
             if "error" in analysis:
                 return analysis
-            
+
             insights = {
                 "summary": {},
                 "recommendations": [],
                 "strengths": {},
                 "weaknesses": {}
             }
-            
-            agents = analysis["agents"]
-            
-            if agents:
-                best_agent = agents[0]
-                worst_agent = agents[-1]
-                
-                insights["summary"] = {
-                    "best_performer": best_agent["name"],
-                    "worst_performer": worst_agent["name"],
-                    "performance_gap": best_agent["mean_score"] - worst_agent["mean_score"],
-                    "total_agents": len(agents)
-                }
-                
-                # 生成建议
-                for agent in agents:
-                    if agent["low_score_ratio"] > 0.3:
-                        insights["recommendations"].append(
-                            f"{agent['name']} 有 {agent['low_score_ratio']:.1%} 的低分回答，建议优化模型或提示词"
-                        )
-                    
-                    if agent["consistency"] < 0.5:
-                        insights["recommendations"].append(
-                            f"{agent['name']} 回答一致性较差，建议调整温度参数或优化训练数据"
-                        )
-                
-                # 识别优势和劣势
-                for agent in agents:
-                    strengths = []
-                    weaknesses = []
-                    
-                    if agent["mean_score"] > 0.8:
-                        strengths.append("整体表现优秀")
-                    if agent["high_score_ratio"] > 0.6:
-                        strengths.append("高质量回答比例高")
-                    if agent["consistency"] > 0.7:
-                        strengths.append("回答一致性好")
-                    
-                    if agent["mean_score"] < 0.6:
-                        weaknesses.append("整体表现需要改进")
-                    if agent["low_score_ratio"] > 0.2:
-                        weaknesses.append("低质量回答比例较高")
-                    if agent["consistency"] < 0.5:
-                        weaknesses.append("回答一致性差")
-                    
-                    insights["strengths"][agent["name"]] = strengths
-                    insights["weaknesses"][agent["name"]] = weaknesses
-            
+
+            agents = pd.DataFrame(analysis["agents"])
+
+            if agents.empty:
+                return insights
+
+            best_agent = agents.iloc[0]
+            worst_agent = agents.iloc[-1]
+
+            insights["summary"] = {
+                "best_performer": best_agent["name"],
+                "worst_performer": worst_agent["name"],
+                "performance_gap": float(best_agent["mean_score"] - worst_agent["mean_score"]),
+                "total_agents": len(agents)
+            }
+
+            low_ratio = agents["low_score_ratio"]
+            consistency = agents["consistency"]
+            mean_score = agents["mean_score"]
+
+            # 生成建议
+            many_low = low_ratio > 0.3
+            inconsistent = consistency < 0.5
+            for idx, agent in agents.iterrows():
+                if many_low[idx]:
+                    insights["recommendations"].append(
+                        f"{agent['name']} 有 {agent['low_score_ratio']:.1%} 的低分回答，建议优化模型或提示词"
+                    )
+                if inconsistent[idx]:
+                    insights["recommendations"].append(
+                        f"{agent['name']} 回答一致性较差，建议调整温度参数或优化训练数据"
+                    )
+
+            # 识别优势和劣势
+            strength_rules = [
+                (mean_score > 0.8, "整体表现优秀"),
+                (agents["high_score_ratio"] > 0.6, "高质量回答比例高"),
+                (consistency > 0.7, "回答一致性好")
+            ]
+            weakness_rules = [
+                (mean_score < 0.6, "整体表现需要改进"),
+                (low_ratio > 0.2, "低质量回答比例较高"),
+                (inconsistent, "回答一致性差")
+            ]
+            for idx, name in agents["name"].items():
+                insights["strengths"][name] = [label for mask, label in strength_rules if mask[idx]]
+                insights["weaknesses"][name] = [label for mask, label in weakness_rules if mask[idx]]
+
             return insights
-            
+
         except Exception as e:
-            return {"error": f"生成性能洞察失败: {str(e)}"}
\ No newline at end of file
+            return {"error": f"生成性能洞察失败: {str(e)}"}
+
+    def export_results(self, rows: List[Dict], output) -> None:
+        """将评分行导出为与相似度评分文件相同结构的Excel（每个智能体一个工作表）"""
+        write_results_export(rows, output)
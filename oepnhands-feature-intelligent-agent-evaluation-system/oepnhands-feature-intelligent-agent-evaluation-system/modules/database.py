@@ -1,17 +1,178 @@
 import sqlite3
 import json
+import math
+import time
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import aiosqlite
+from .metrics import metrics
 
+# 问题级查询可排序的字段及对应的列
+RESULT_SORT_COLUMNS = {
+    "weighted_score": "s.weighted_score",
+    "cosine_similarity": "s.cosine_similarity",
+    "jaccard_similarity": "s.jaccard_similarity",
+    "row": "s.item_index"
+}
+
+# 连接建立时应用的PRAGMA：WAL允许读写并发，NORMAL同步在WAL下仍保证一致性
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000"
+]
+
+@metrics.timed_methods(metrics.db_operation_duration, exclude=("connect", "close"))
 class Database:
-    def __init__(self, db_path: str = "app.db"):
+    """SQLite数据库访问
+
+    在事件循环内持有一个长连接（WAL模式），并开启语句缓存复用预编译语句。
+    写操作在各自的保存点中串行执行，再由后台合并提交：短时间内的多次小写入
+    共用一个事务，调用方在所在批次提交后才返回。事务以 BEGIN IMMEDIATE 开始，
+    多个工作进程共用同一数据库文件时写事务按 busy_timeout 排队，不会在读后写时冲突。
+    """
+
+    def __init__(self, db_path: str = "app.db", commit_interval: float = 0.005, max_batch_size: int = 200):
         self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.max_batch_size = max_batch_size
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._loop = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._in_transaction = False
+        self._commit_future: Optional[asyncio.Future] = None
+        self._commit_task: Optional[asyncio.Task] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._batch_size = 0
+
+    async def connect(self) -> aiosqlite.Connection:
+        """获取长连接，首次调用（或事件循环变化）时建立连接"""
+        loop = asyncio.get_running_loop()
+        if self._conn is not None and self._loop is loop:
+            return self._conn
+        
+        if self._conn is not None:
+            # 原事件循环已不可用，只能直接停止旧连接的线程
+            stop = getattr(self._conn, "stop", None)
+            if stop:
+                stop()
+        
+        conn = await aiosqlite.connect(self.db_path, isolation_level=None, cached_statements=256)
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        
+        self._conn = conn
+        self._loop = loop
+        self._write_lock = asyncio.Lock()
+        self._batch_full = asyncio.Event()
+        self._in_transaction = False
+        self._commit_future = None
+        self._batch_size = 0
+        return conn
+
+    async def close(self):
+        """提交未完成的写入并关闭连接"""
+        if self._conn is None:
+            return
+        if self._commit_task is not None and not self._commit_task.done():
+            self._batch_full.set()
+            await self._commit_task
+        await self._conn.close()
+        self._conn = None
+        self._loop = None
+
+    @asynccontextmanager
+    async def _connection(self):
+        """只读访问：直接使用长连接"""
+        yield await self.connect()
+
+    @asynccontextmanager
+    async def _write(self):
+        """写访问：在保存点内执行，出错时只回滚本次写入，成功后等待合并提交"""
+        started = time.perf_counter()
+        db = await self.connect()
+        async with self._write_lock:
+            if not self._in_transaction:
+                await self._begin(db)
+            await db.execute("SAVEPOINT write_block")
+            try:
+                yield db
+            except BaseException:
+                await db.execute("ROLLBACK TO write_block")
+                await db.execute("RELEASE write_block")
+                # 本次写入可能是开启事务的那一次，仍需安排提交，否则写锁会一直占用到下一次写入
+                self._schedule_commit()
+                raise
+            await db.execute("RELEASE write_block")
+            future = self._schedule_commit()
+        # 批次future由多个写入共享，单个调用方被取消时不能影响其他调用方
+        await asyncio.shield(future)
+        metrics.sqlite_write_duration.observe(time.perf_counter() - started)
+
+    async def _begin(self, db):
+        """开始写事务
+
+        BEGIN IMMEDIATE 可能在等待其他进程释放写锁时被取消，此时语句仍会在连接线程中
+        执行；等待其完成并安排提交，避免事务状态与标记不一致或一直占用写锁。
+        """
+        begin = asyncio.ensure_future(db.execute("BEGIN IMMEDIATE"))
+        try:
+            await asyncio.shield(begin)
+        except asyncio.CancelledError:
+            await begin
+            self._in_transaction = True
+            self._schedule_commit()
+            raise
+        self._in_transaction = True
+
+    def _schedule_commit(self) -> asyncio.Future:
+        """将当前写入加入待提交批次，返回批次提交完成的future"""
+        if self._commit_future is None:
+            self._commit_future = self._loop.create_future()
+            self._batch_size = 0
+            self._batch_full.clear()
+            self._commit_task = self._loop.create_task(self._group_commit())
+        self._batch_size += 1
+        if self._batch_size >= self.max_batch_size:
+            self._batch_full.set()
+        return self._commit_future
+
+    async def _group_commit(self):
+        """等待一个提交窗口后统一提交本批次的全部写入"""
+        try:
+            await asyncio.wait_for(self._batch_full.wait(), self.commit_interval)
+        except asyncio.TimeoutError:
+            pass
+        
+        async with self._write_lock:
+            future = self._commit_future
+            self._commit_future = None
+            metrics.sqlite_commit_batch.observe(self._batch_size)
+            started = time.perf_counter()
+            try:
+                await self._conn.execute("COMMIT")
+                metrics.sqlite_commit_duration.observe(time.perf_counter() - started)
+                if not future.done():
+                    future.set_result(None)
+            except Exception as e:
+                try:
+                    await self._conn.execute("ROLLBACK")
+                except Exception:
+                    pass
+                if not future.done():
+                    future.set_exception(e)
+                    # 标记异常已被获取，避免等待方均已取消时输出警告
+                    future.exception()
+            finally:
+                self._in_transaction = False
 
     async def init_db(self):
         """初始化数据库"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # 创建任务表
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS tasks (
@@ -24,6 +185,218 @@ class Database:
                     result TEXT
                 )
             """)
+            await self._ensure_column(db, "tasks", "priority", "INTEGER NOT NULL DEFAULT 0")
+            await self._ensure_column(db, "tasks", "payload", "TEXT")
+            # 认领任务的工作进程及租约到期时间，control 为其他进程转交的控制请求
+            await self._ensure_column(db, "tasks", "worker_id", "TEXT")
+            await self._ensure_column(db, "tasks", "lease_expires_at", "REAL")
+            await self._ensure_column(db, "tasks", "control", "TEXT")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (status, priority DESC, created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_type ON tasks (type, created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_worker ON tasks (worker_id)")
+            
+            # 各工作进程共享的配置项（JSON）
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # 任务进度事件日志，供其他工作进程转发给各自的订阅者
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS task_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    worker_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_task_events_created ON task_events (created_at)")
+            
+            # 任务计数，由触发器随任务增删和状态变化维护
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS task_counters (
+                    dimension TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (dimension, value)
+                )
+            """)
+            async with db.execute("SELECT COUNT(*) FROM task_counters") as cursor:
+                seeded = (await cursor.fetchone())[0] > 0
+            if not seeded:
+                await db.execute(
+                    "INSERT INTO task_counters (dimension, value, count) SELECT 'total', '', COUNT(*) FROM tasks"
+                )
+                for dimension in ("status", "type"):
+                    await db.execute(
+                        "INSERT INTO task_counters (dimension, value, count) "
+                        f"SELECT '{dimension}', {dimension}, COUNT(*) FROM tasks GROUP BY {dimension}"
+                    )
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counter_insert AFTER INSERT ON tasks
+                BEGIN
+                    INSERT INTO task_counters (dimension, value, count) VALUES ('total', '', 1)
+                        ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;
+                    INSERT INTO task_counters (dimension, value, count) VALUES ('status', NEW.status, 1)
+                        ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;
+                    INSERT INTO task_counters (dimension, value, count) VALUES ('type', NEW.type, 1)
+                        ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counter_delete AFTER DELETE ON tasks
+                BEGIN
+                    UPDATE task_counters SET count = count - 1 WHERE dimension = 'total';
+                    UPDATE task_counters SET count = count - 1 WHERE dimension = 'status' AND value = OLD.status;
+                    UPDATE task_counters SET count = count - 1 WHERE dimension = 'type' AND value = OLD.type;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_tasks_counter_status AFTER UPDATE OF status ON tasks
+                WHEN OLD.status IS NOT NEW.status
+                BEGIN
+                    UPDATE task_counters SET count = count - 1 WHERE dimension = 'status' AND value = OLD.status;
+                    INSERT INTO task_counters (dimension, value, count) VALUES ('status', NEW.status, 1)
+                        ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;
+                END
+            """)
+            
+            # 按内容哈希去重的上传文件
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    hash TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # 任务与上传文件的关联
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS task_uploads (
+                    task_id TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    PRIMARY KEY (task_id, path)
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_task_uploads_hash ON task_uploads (hash)")
+            await self._ensure_column(db, "uploads", "accessed_at", "REAL")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_uploads_accessed ON uploads (accessed_at)")
+            
+            # 输出产物目录，避免每次列表都扫描目录
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    name TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    task_id TEXT,
+                    size INTEGER NOT NULL,
+                    row_count INTEGER,
+                    created_at TEXT,
+                    modified_at TEXT
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_modified ON artifacts (modified_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_kind ON artifacts (kind, modified_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_task ON artifacts (task_id)")
+            await self._ensure_column(db, "artifacts", "accessed_at", "REAL")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_accessed ON artifacts (accessed_at)")
+            
+            # 各目录占用空间，由触发器随文件增删维护
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS storage_usage (
+                    directory TEXT PRIMARY KEY,
+                    total_size INTEGER NOT NULL DEFAULT 0,
+                    file_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            for directory, table in (("outputs", "artifacts"), ("uploads", "uploads")):
+                await db.execute(
+                    "INSERT OR IGNORE INTO storage_usage (directory, total_size, file_count) "
+                    f"SELECT ?, COALESCE(SUM(size), 0), COUNT(*) FROM {table}",
+                    (directory,)
+                )
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_insert AFTER INSERT ON {table}
+                    BEGIN
+                        UPDATE storage_usage SET total_size = total_size + NEW.size, file_count = file_count + 1
+                        WHERE directory = '{directory}';
+                    END
+                """)
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_delete AFTER DELETE ON {table}
+                    BEGIN
+                        UPDATE storage_usage SET total_size = total_size - OLD.size, file_count = file_count - 1
+                        WHERE directory = '{directory}';
+                    END
+                """)
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_update AFTER UPDATE OF size ON {table}
+                    BEGIN
+                        UPDATE storage_usage SET total_size = total_size + NEW.size - OLD.size
+                        WHERE directory = '{directory}';
+                    END
+                """)
+            
+            # 评估结果：问题文本去重后以ID关联，支持跨任务查询
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL UNIQUE
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS golden_items (
+                    task_id TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    answer TEXT,
+                    source_file TEXT,
+                    PRIMARY KEY (task_id, item_index)
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS agent_answers (
+                    task_id TEXT NOT NULL,
+                    agent TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    standard_answer TEXT,
+                    answer TEXT,
+                    latency_ms REAL,
+                    success INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (task_id, agent, item_index)
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS scores (
+                    task_id TEXT NOT NULL,
+                    agent TEXT NOT NULL,
+                    agent_order INTEGER NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    standard_answer TEXT,
+                    generated_answer TEXT,
+                    cosine_similarity REAL,
+                    jaccard_similarity REAL,
+                    weighted_score REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (task_id, agent, item_index)
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_agent_answers_question ON agent_answers (question_id, agent)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_scores_run_score ON scores (task_id, agent, weighted_score)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_scores_question ON scores (question_id, agent, created_at)")
             
             # 创建系统状态表
             await db.execute("""
@@ -35,30 +408,250 @@ class Database:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
-            
-            await db.commit()
 
-    async def create_task(self, task_id: str, task_type: str, status: str, parameters: Dict = None):
-        """创建任务"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def _ensure_column(self, db, table: str, column: str, column_type: str):
+        """为已有数据库补充新增的列"""
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+        if column not in columns:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    async def create_task(self, task_id: str, task_type: str, status: str, parameters: Dict = None,
+                          priority: int = 0, payload: Dict = None):
+        """创建任务
+
+        payload 为任务执行所需的完整参数（可能包含API密钥），仅供任务队列使用，
+        不会通过任务查询接口返回，任务结束后即被清除。
+        """
+        async with self._write() as db:
+            await db.execute(
+                "INSERT INTO tasks (id, type, status, parameters, priority, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, task_type, status, json.dumps(parameters) if parameters else None,
+                 priority, json.dumps(payload) if payload is not None else None)
+            )
+
+    async def record_upload(self, task_id: str, upload: Dict[str, Any]):
+        """记录上传文件及其与任务的关联"""
+        async with self._write() as db:
             await db.execute(
-                "INSERT INTO tasks (id, type, status, parameters) VALUES (?, ?, ?, ?)",
-                (task_id, task_type, status, json.dumps(parameters) if parameters else None)
+                """
+                INSERT INTO uploads (hash, path, size, accessed_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET accessed_at = excluded.accessed_at
+                """,
+                (upload["hash"], upload["blob_path"], upload["size"], time.time())
             )
-            await db.commit()
+            await db.execute(
+                "INSERT OR REPLACE INTO task_uploads (task_id, hash, filename, path) VALUES (?, ?, ?, ?)",
+                (task_id, upload["hash"], upload["filename"], upload["path"])
+            )
+
+    async def get_upload_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """按内容哈希查找上传文件"""
+        async with self._connection() as db:
+            async with db.execute(
+                "SELECT hash, path, size, created_at FROM uploads WHERE hash = ?", (content_hash,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return {"hash": row[0], "path": row[1], "size": row[2], "created_at": row[3]}
+                return None
+
+    async def upsert_artifact(self, artifact: Dict[str, Any]):
+        """新增或更新产物记录"""
+        async with self._write() as db:
+            await self._upsert_artifacts(db, [artifact])
+
+    async def _upsert_artifacts(self, db, artifacts: List[Dict[str, Any]]):
+        await db.executemany(
+            """
+            INSERT INTO artifacts (name, path, type, kind, task_id, size, row_count, created_at, modified_at, accessed_at)
+            VALUES (:name, :path, :type, :kind, :task_id, :size, :row_count, :created_at, :modified_at, :accessed_at)
+            ON CONFLICT(name) DO UPDATE SET
+                path = excluded.path,
+                type = excluded.type,
+                kind = excluded.kind,
+                task_id = COALESCE(excluded.task_id, artifacts.task_id),
+                size = excluded.size,
+                row_count = COALESCE(excluded.row_count, artifacts.row_count),
+                created_at = excluded.created_at,
+                modified_at = excluded.modified_at,
+                accessed_at = MAX(COALESCE(artifacts.accessed_at, 0), excluded.accessed_at)
+            """,
+            artifacts
+        )
+
+    async def delete_artifact(self, name: str):
+        """删除产物记录"""
+        async with self._write() as db:
+            await db.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+
+    async def touch_artifact(self, name: str):
+        """记录产物被访问（下载或分析），用于LRU清理"""
+        async with self._write() as db:
+            await db.execute("UPDATE artifacts SET accessed_at = ? WHERE name = ?", (time.time(), name))
+
+    async def get_live_task_ids(self) -> set:
+        """获取仍在等待、运行中或已暂停的任务ID"""
+        async with self._connection() as db:
+            async with db.execute("SELECT id FROM tasks WHERE status IN ('pending', 'running', 'paused')") as cursor:
+                return {row[0] for row in await cursor.fetchall()}
+
+    async def get_artifacts_by_access(self) -> List[Dict]:
+        """按最近访问时间升序获取全部产物，供清理服务使用"""
+        async with self._connection() as db:
+            async with db.execute(
+                "SELECT name, path, task_id, size, accessed_at FROM artifacts ORDER BY accessed_at ASC"
+            ) as cursor:
+                return [
+                    {"name": row[0], "path": row[1], "task_id": row[2], "size": row[3], "accessed_at": row[4] or 0}
+                    for row in await cursor.fetchall()
+                ]
+
+    async def get_uploads_by_access(self) -> List[Dict]:
+        """按最近访问时间升序获取上传文件及其任务关联"""
+        async with self._connection() as db:
+            async with db.execute(
+                "SELECT hash, path, size, accessed_at FROM uploads ORDER BY accessed_at ASC"
+            ) as cursor:
+                uploads = [
+                    {"hash": row[0], "path": row[1], "size": row[2], "accessed_at": row[3] or 0,
+                     "task_ids": set(), "links": []}
+                    for row in await cursor.fetchall()
+                ]
+            by_hash = {u["hash"]: u for u in uploads}
+            async with db.execute("SELECT hash, task_id, path FROM task_uploads") as cursor:
+                for content_hash, task_id, path in await cursor.fetchall():
+                    if content_hash in by_hash:
+                        by_hash[content_hash]["task_ids"].add(task_id)
+                        by_hash[content_hash]["links"].append(path)
+        return uploads
+
+    async def delete_retained_records(self, artifact_names: List[str], upload_hashes: List[str],
+                                      task_ids: List[str]) -> Dict[str, List[str]]:
+        """删除已清理文件对应的产物、上传记录，以及不再有任何产物的任务
+
+        返回被删除的任务ID，以及这些任务遗留的上传文件链接路径。
+        """
+        async with self._write() as db:
+            await db.executemany("DELETE FROM artifacts WHERE name = ?", [(n,) for n in artifact_names])
+            await db.executemany("DELETE FROM task_uploads WHERE hash = ?", [(h,) for h in upload_hashes])
+            await db.executemany("DELETE FROM uploads WHERE hash = ?", [(h,) for h in upload_hashes])
+            
+            removed_tasks = []
+            orphan_links = []
+            for task_id in task_ids:
+                cursor = await db.execute(
+                    """
+                    DELETE FROM tasks WHERE id = ?
+                    AND status NOT IN ('pending', 'running', 'paused')
+                    AND NOT EXISTS (SELECT 1 FROM artifacts WHERE task_id = ?)
+                    """,
+                    (task_id, task_id)
+                )
+                if cursor.rowcount:
+                    removed_tasks.append(task_id)
+                    async with db.execute("SELECT path FROM task_uploads WHERE task_id = ?", (task_id,)) as links:
+                        orphan_links.extend(row[0] for row in await links.fetchall())
+                    await db.execute("DELETE FROM task_uploads WHERE task_id = ?", (task_id,))
+            return {"tasks": removed_tasks, "links": orphan_links}
+
+    async def get_artifact_stamps(self) -> Dict[str, tuple]:
+        """获取已登记产物的 {文件名: (大小, 修改时间)}"""
+        async with self._connection() as db:
+            async with db.execute("SELECT name, size, modified_at FROM artifacts") as cursor:
+                return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+
+    async def sync_artifacts(self, artifacts: List[Dict[str, Any]]):
+        """用目录扫描结果对账产物目录：更新现有记录并删除已不存在的文件"""
+        async with self._write() as db:
+            await self._upsert_artifacts(db, artifacts)
+            names = {a["name"] for a in artifacts}
+            async with db.execute("SELECT name FROM artifacts") as cursor:
+                stale = [(row[0],) for row in await cursor.fetchall() if row[0] not in names]
+            await db.executemany("DELETE FROM artifacts WHERE name = ?", stale)
+
+    async def list_artifacts(self, kind: str = None, file_type: str = None, task_id: str = None,
+                             search: str = None, limit: int = None, offset: int = 0) -> List[Dict]:
+        """分页查询产物，按修改时间倒序"""
+        conditions = []
+        params = []
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if file_type:
+            conditions.append("type = ?")
+            params.append(file_type)
+        if task_id:
+            conditions.append("task_id = ?")
+            params.append(task_id)
+        if search:
+            conditions.append("name LIKE ?")
+            params.append(f"%{search}%")
+        
+        sql = "SELECT name, size, created_at, modified_at, type, kind, task_id, row_count FROM artifacts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY modified_at DESC LIMIT ? OFFSET ?"
+        params.extend([limit if limit is not None else -1, offset])
+        
+        async with self._connection() as db:
+            async with db.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+                return [
+                    {
+                        "name": row[0],
+                        "size": row[1],
+                        "created_at": row[2],
+                        "modified_at": row[3],
+                        "type": row[4],
+                        "kind": row[5],
+                        "task_id": row[6],
+                        "row_count": row[7]
+                    }
+                    for row in rows
+                ]
+
+    async def get_storage_usage(self) -> Dict[str, Any]:
+        """获取各目录的占用空间和文件数"""
+        async with self._connection() as db:
+            async with db.execute("SELECT directory, total_size, file_count FROM storage_usage") as cursor:
+                usage = {row[0]: {"size": row[1], "file_count": row[2]} for row in await cursor.fetchall()}
+            async with db.execute("SELECT type, COUNT(*) FROM artifacts GROUP BY type") as cursor:
+                type_counts = dict(await cursor.fetchall())
+        
+        return {
+            "upload_dir_size": usage.get("uploads", {}).get("size", 0),
+            "output_dir_size": usage.get("outputs", {}).get("size", 0),
+            "total_size": sum(u["size"] for u in usage.values()),
+            "output_file_count": usage.get("outputs", {}).get("file_count", 0),
+            "upload_file_count": usage.get("uploads", {}).get("file_count", 0),
+            "type_counts": type_counts
+        }
 
     async def update_task_status(self, task_id: str, status: str, result: Dict = None):
         """更新任务状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
-                "UPDATE tasks SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (status, json.dumps(result) if result else None, task_id)
+                """
+                UPDATE tasks SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP,
+                    payload = CASE WHEN ? IN ('completed', 'failed', 'cancelled') THEN NULL ELSE payload END,
+                    worker_id = CASE WHEN ? IN ('completed', 'failed', 'cancelled') THEN NULL ELSE worker_id END
+                WHERE id = ?
+                """,
+                (status, json.dumps(result) if result else None, status, status, task_id)
+            )
+
+    async def merge_task_result(self, task_id: str, fields: Dict[str, Any]):
+        """向任务结果中合并字段，不改变任务状态"""
+        async with self._write() as db:
+            await db.execute(
+                "UPDATE tasks SET result = json_patch(COALESCE(result, '{}'), ?) WHERE id = ?",
+                (json.dumps(fields), task_id)
             )
-            await db.commit()
 
     async def get_task(self, task_id: str) -> Optional[Dict]:
         """获取任务详情"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             async with db.execute(
                 "SELECT * FROM tasks WHERE id = ?", (task_id,)
             ) as cursor:
@@ -77,7 +670,7 @@ class Database:
 
     async def get_tasks(self, limit: int = 50) -> List[Dict]:
         """获取任务列表"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             async with db.execute(
                 "SELECT * FROM tasks ORDER BY created_at DESC LIMIT ?", (limit,)
             ) as cursor:
@@ -96,25 +689,563 @@ class Database:
                 return tasks
 
     async def delete_task(self, task_id: str):
-        """删除任务"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """删除任务及其评估结果"""
+        async with self._write() as db:
             await db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-            await db.commit()
+            for table in ("golden_items", "agent_answers", "scores"):
+                await db.execute(f"DELETE FROM {table} WHERE task_id = ?", (task_id,))
 
-    async def get_dashboard_stats(self) -> Dict[str, Any]:
-        """获取仪表盘统计信息"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # 任务统计
+    # ==================== 任务队列 ====================
+
+    async def claim_next_task(self, exclude_types: List[str] = None, worker_id: str = None,
+                              lease_seconds: float = 30) -> Optional[Dict]:
+        """按优先级和创建顺序取出下一个等待中的任务，标记为运行中并由 worker_id 持有租约
+
+        查询和更新在同一个写事务（BEGIN IMMEDIATE）中完成，多个工作进程同时认领时
+        每个任务只会被一个进程取得。
+        """
+        exclude_types = list(exclude_types or [])
+        condition = ""
+        if exclude_types:
+            condition = f"AND type NOT IN ({', '.join('?' * len(exclude_types))})"
+        async with self._write() as db:
+            async with db.execute(
+                f"""
+                SELECT id, type, payload FROM tasks
+                WHERE status = 'pending' {condition}
+                ORDER BY priority DESC, created_at, rowid LIMIT 1
+                """,
+                exclude_types
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            await db.execute(
+                """
+                UPDATE tasks SET status = 'running', worker_id = ?, lease_expires_at = ?, control = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (worker_id, time.time() + lease_seconds, row[0])
+            )
+            return {
+                "id": row[0],
+                "type": row[1],
+                "payload": json.loads(row[2]) if row[2] else None
+            }
+
+    async def requeue_interrupted_tasks(self) -> int:
+        """回收租约已过期（持有进程已退出或失去响应）的任务
+
+        运行中的任务放回队列，已暂停的任务解除持有进程（恢复时重新排队），
+        已请求取消的任务直接标记为已取消，缺少执行参数的任务标记为失败。
+        """
+        now = time.time()
+        expired = "(worker_id IS NULL OR lease_expires_at IS NULL OR lease_expires_at < ?)"
+        async with self._write() as db:
+            await db.execute(
+                f"""
+                UPDATE tasks SET status = 'failed', result = ?, worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE payload IS NULL AND (status = 'pending' OR (status = 'running' AND {expired}))
+                """,
+                (json.dumps({"error": "服务重启，任务缺少执行参数，无法恢复"}), now)
+            )
+            await db.execute(
+                f"""
+                UPDATE tasks SET status = 'cancelled', payload = NULL, worker_id = NULL, control = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status IN ('running', 'paused') AND control = 'cancel' AND {expired}
+                """,
+                (now,)
+            )
+            await db.execute(
+                f"""
+                UPDATE tasks SET worker_id = NULL, lease_expires_at = NULL, control = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'paused' AND worker_id IS NOT NULL AND {expired}
+                """,
+                (now,)
+            )
+            cursor = await db.execute(
+                f"""
+                UPDATE tasks SET status = 'pending', worker_id = NULL, lease_expires_at = NULL, control = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND {expired}
+                """,
+                (now,)
+            )
+            return cursor.rowcount
+
+    async def heartbeat(self, worker_id: str, lease_seconds: float = 30) -> Dict[str, Any]:
+        """续期工作进程持有的全部任务租约，并取走其他进程转交的控制请求
+
+        返回 {"owned": 仍由该进程持有的任务ID集合, "controls": [(任务ID, 控制操作)]}。
+        """
+        async with self._write() as db:
+            await db.execute(
+                """
+                UPDATE tasks SET lease_expires_at = ?
+                WHERE worker_id = ? AND status IN ('running', 'paused')
+                """,
+                (time.time() + lease_seconds, worker_id)
+            )
+            async with db.execute(
+                "SELECT id, control FROM tasks WHERE worker_id = ? AND status IN ('running', 'paused')",
+                (worker_id,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            controls = [(row[0], row[1]) for row in rows if row[1]]
+            if controls:
+                await db.execute(
+                    "UPDATE tasks SET control = NULL WHERE worker_id = ? AND control IS NOT NULL", (worker_id,)
+                )
+            return {"owned": {row[0] for row in rows}, "controls": controls}
+
+    async def release_tasks(self, worker_id: str) -> int:
+        """工作进程正常退出时释放持有的任务：运行中的放回队列，已暂停的解除持有"""
+        async with self._write() as db:
+            await db.execute(
+                """
+                UPDATE tasks SET worker_id = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE worker_id = ? AND status = 'paused'
+                """,
+                (worker_id,)
+            )
+            cursor = await db.execute(
+                """
+                UPDATE tasks SET status = 'pending', worker_id = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE worker_id = ? AND status = 'running' AND payload IS NOT NULL
+                """,
+                (worker_id,)
+            )
+            return cursor.rowcount
+
+    async def request_task_control(self, task_id: str, action: str, from_statuses: List[str]) -> bool:
+        """为其他工作进程持有的任务登记控制请求（cancel/pause/resume），由持有进程在下次心跳时执行"""
+        async with self._write() as db:
+            cursor = await db.execute(
+                f"""
+                UPDATE tasks SET control = ?
+                WHERE id = ? AND worker_id IS NOT NULL AND status IN ({', '.join('?' * len(from_statuses))})
+                """,
+                [action, task_id] + list(from_statuses)
+            )
+            return cursor.rowcount > 0
+
+    async def set_task_status_if(self, task_id: str, from_statuses: List[str], status: str,
+                                 worker_id: str = None) -> bool:
+        """仅当任务处于指定状态之一且由 worker_id 持有（为空时要求未被持有）时修改状态
+
+        不改动结果，返回是否修改成功。改为运行中和已暂停以外的状态时解除持有。
+        """
+        async with self._write() as db:
+            cursor = await db.execute(
+                f"""
+                UPDATE tasks SET status = ?, updated_at = CURRENT_TIMESTAMP,
+                    payload = CASE WHEN ? IN ('completed', 'failed', 'cancelled') THEN NULL ELSE payload END,
+                    worker_id = CASE WHEN ? IN ('running', 'paused') THEN worker_id ELSE NULL END
+                WHERE id = ? AND worker_id IS ? AND status IN ({', '.join('?' * len(from_statuses))})
+                """,
+                [status, status, status, task_id, worker_id] + list(from_statuses)
+            )
+            return cursor.rowcount > 0
+
+    async def count_tasks_by_status(self, status: str) -> int:
+        """读取指定状态的任务数量（来自计数表）"""
+        async with self._connection() as db:
             async with db.execute(
-                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+                "SELECT count FROM task_counters WHERE dimension = 'status' AND value = ?", (status,)
             ) as cursor:
-                status_counts = dict(await cursor.fetchall())
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+
+    # ==================== 共享配置与进度事件 ====================
+
+    async def get_setting(self, key: str, default: Any = None) -> Any:
+        """读取共享配置项"""
+        async with self._connection() as db:
+            async with db.execute("SELECT value FROM settings WHERE key = ?", (key,)) as cursor:
+                row = await cursor.fetchone()
+                return json.loads(row[0]) if row else default
+
+    async def set_setting(self, key: str, value: Any):
+        """写入共享配置项"""
+        async with self._write() as db:
+            await db.execute(
+                """
+                INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+
+    async def append_task_events(self, worker_id: str, events: List[Dict]):
+        """追加进度事件"""
+        if not events:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "INSERT INTO task_events (task_id, worker_id, event, created_at) VALUES (?, ?, ?, ?)",
+                [
+                    (event["task_id"], worker_id, json.dumps(event, ensure_ascii=False), time.time())
+                    for event in events
+                ]
+            )
+
+    async def get_task_events(self, after_seq: int, exclude_worker: str = None, limit: int = 1000) -> List[Dict]:
+        """读取序号大于 after_seq 的进度事件（可排除指定工作进程发布的事件）"""
+        async with self._connection() as db:
+            async with db.execute(
+                """
+                SELECT seq, event FROM task_events
+                WHERE seq > ? AND worker_id IS NOT ?
+                ORDER BY seq LIMIT ?
+                """,
+                (after_seq, exclude_worker, limit)
+            ) as cursor:
+                return [{"seq": row[0], "event": json.loads(row[1])} for row in await cursor.fetchall()]
+
+    async def get_last_task_event_seq(self) -> int:
+        """当前最大的进度事件序号"""
+        async with self._connection() as db:
+            async with db.execute("SELECT COALESCE(MAX(seq), 0) FROM task_events") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def prune_task_events(self, before: float) -> int:
+        """删除早于指定时间的进度事件"""
+        async with self._write() as db:
+            cursor = await db.execute("DELETE FROM task_events WHERE created_at < ?", (before,))
+            return cursor.rowcount
+
+    # ==================== 评估结果 ====================
+
+    async def _question_ids(self, db, texts: List[str]) -> Dict[str, int]:
+        """获取问题文本对应的ID，不存在时插入"""
+        unique = list(dict.fromkeys(texts))
+        await db.executemany("INSERT OR IGNORE INTO questions (text) VALUES (?)", [(t,) for t in unique])
+        ids = {}
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            async with db.execute(
+                f"SELECT id, text FROM questions WHERE text IN ({','.join('?' * len(chunk))})", chunk
+            ) as cursor:
+                ids.update({row[1]: row[0] for row in await cursor.fetchall()})
+        return ids
+
+    async def save_golden_items(self, task_id: str, qa_pairs: List[Dict]):
+        """保存生成的标准问答对"""
+        if not qa_pairs:
+            return
+        async with self._write() as db:
+            questions = [str(qa.get("question", "")) for qa in qa_pairs]
+            ids = await self._question_ids(db, questions)
+            await db.executemany(
+                "INSERT OR REPLACE INTO golden_items (task_id, item_index, question_id, answer, source_file) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (task_id, idx, ids[question], str(qa.get("answer", "")), qa.get("source_file"))
+                    for idx, (question, qa) in enumerate(zip(questions, qa_pairs))
+                ]
+            )
+
+    async def save_agent_answers(self, task_id: str, results: Dict[str, List[Dict]]):
+        """保存各智能体的回答及调用指标"""
+        rows = [(agent, idx, r) for agent, items in results.items() for idx, r in enumerate(items)]
+        if not rows:
+            return
+        async with self._write() as db:
+            ids = await self._question_ids(db, [r["question"] for _, _, r in rows])
+            await db.executemany(
+                """
+                INSERT OR REPLACE INTO agent_answers
+                (task_id, agent, item_index, question_id, standard_answer, answer, latency_ms, success)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (task_id, agent, idx, ids[r["question"]], r["standard_answer"], r["agent_answer"],
+                     r.get("latency_ms"), int(r["success"]) if "success" in r else None)
+                    for agent, idx, r in rows
+                ]
+            )
+
+    async def save_scores(self, task_id: str, score_rows: List[Dict]):
+        """保存逐行相似度评分"""
+        if not score_rows:
+            return
+        async with self._write() as db:
+            ids = await self._question_ids(db, [r["question"] for r in score_rows])
+            await db.executemany(
+                """
+                INSERT OR REPLACE INTO scores
+                (task_id, agent, agent_order, item_index, question_id, standard_answer, generated_answer,
+                 cosine_similarity, jaccard_similarity, weighted_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (task_id, r["agent"], r["agent_order"], r["item_index"], ids[r["question"]],
+                     r["standard_answer"], r["generated_answer"],
+                     r["cosine_similarity"], r["jaccard_similarity"], r["weighted_score"])
+                    for r in score_rows
+                ]
+            )
+
+    async def get_scored_run(self, filename: str) -> Optional[str]:
+        """查找评分文件对应且已入库的任务ID"""
+        async with self._connection() as db:
+            async with db.execute(
+                """
+                SELECT a.task_id FROM artifacts a
+                WHERE a.name = ? AND EXISTS (SELECT 1 FROM scores s WHERE s.task_id = a.task_id)
+                """,
+                (filename,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def get_run_analysis(self, task_id: str) -> Dict[str, Any]:
+        """用SQL聚合计算任务的评分分析，结构与 Analyzer.analyze_file 一致"""
+        analysis_result = {
+            "agents": {},
+            "comparison": {},
+            "best_agent": None,
+            "overall_stats": {}
+        }
+        async with self._connection() as db:
+            async with db.execute(
+                """
+                SELECT agent, COUNT(*), AVG(weighted_score), MAX(weighted_score), MIN(weighted_score),
+                       SUM(weighted_score >= 0.8), SUM(weighted_score < 0.5), SUM(weighted_score >= 0.9),
+                       SUM(weighted_score >= 0.7 AND weighted_score < 0.9),
+                       SUM(weighted_score >= 0.5 AND weighted_score < 0.7)
+                FROM scores WHERE task_id = ? AND weighted_score IS NOT NULL
+                GROUP BY agent ORDER BY MIN(agent_order)
+                """,
+                (task_id,)
+            ) as cursor:
+                agent_rows = await cursor.fetchall()
+            
+            if not agent_rows:
+                return analysis_result
+            
+            total = 0
+            total_sum = 0.0
+            for agent, count, mean, max_score, min_score, high, low, excellent, good, fair in agent_rows:
+                median = await self._median(db, "task_id = ? AND agent = ?", (task_id, agent), count)
+                analysis_result["agents"][agent] = {
+                    "name": agent,
+                    "total_questions": count,
+                    "mean_score": float(mean),
+                    "median_score": median,
+                    "max_score": float(max_score),
+                    "min_score": float(min_score),
+                    "std_score": await self._std(db, "task_id = ? AND agent = ?", (task_id, agent), mean),
+                    "high_score_ratio": high / count,
+                    "low_score_ratio": low / count,
+                    "score_distribution": {
+                        "excellent": excellent,
+                        "good": good,
+                        "fair": fair,
+                        "poor": low
+                    }
+                }
+                total += count
+                total_sum += mean * count
             
-            # 任务类型统计
+            ranked = sorted(analysis_result["agents"].values(), key=lambda a: a["mean_score"], reverse=True)
+            analysis_result["best_agent"] = ranked[0]["name"]
+            analysis_result["comparison"]["ranking"] = [
+                {"agent": a["name"], "score": a["mean_score"]} for a in ranked
+            ]
+            
+            overall_mean = total_sum / total
+            analysis_result["overall_stats"] = {
+                "total_questions": total,
+                "mean_score": overall_mean,
+                "median_score": await self._median(db, "task_id = ?", (task_id,), total),
+                "max_score": max(a["max_score"] for a in ranked),
+                "min_score": min(a["min_score"] for a in ranked),
+                "std_score": await self._std(db, "task_id = ?", (task_id,), overall_mean)
+            }
+        return analysis_result
+
+    async def _median(self, db, where: str, params: tuple, count: int) -> float:
+        """利用索引有序读取中间一到两个值计算中位数"""
+        async with db.execute(
+            f"""
+            SELECT weighted_score FROM scores WHERE {where} AND weighted_score IS NOT NULL
+            ORDER BY weighted_score LIMIT ? OFFSET ?
+            """,
+            params + (2 - count % 2, (count - 1) // 2)
+        ) as cursor:
+            values = [row[0] for row in await cursor.fetchall()]
+        return float(sum(values) / len(values)) if values else 0.0
+
+    async def _std(self, db, where: str, params: tuple, mean: float) -> float:
+        """总体标准差：按已知均值再扫描一遍求离差平方的均值，避免 E[x²]-E[x]² 相减损失精度"""
+        async with db.execute(
+            f"""
+            SELECT AVG((weighted_score - ?) * (weighted_score - ?)) FROM scores
+            WHERE {where} AND weighted_score IS NOT NULL
+            """,
+            (mean, mean) + params
+        ) as cursor:
+            row = await cursor.fetchone()
+        return math.sqrt(row[0]) if row and row[0] is not None else 0.0
+
+    def _score_item(self, row) -> Dict[str, Any]:
+        return {
+            "id": f"{row[0]}_{row[1] + 2}",
+            "agent": row[0],
+            "question": row[2],
+            "standard_answer": row[3] or "",
+            "generated_answer": row[4] or "",
+            "cosine_similarity": row[5] if row[5] is not None else 0.0,
+            "jaccard_similarity": row[6] if row[6] is not None else 0.0,
+            "weighted_score": row[7] if row[7] is not None else 0.0
+        }
+
+    async def query_run_questions(self, task_id: str, agent: str = None, sort_by: str = "weighted_score",
+                                  descending: bool = True, min_score: float = None, max_score: float = None,
+                                  cursor: Optional[tuple] = None, limit: int = 50) -> Dict[str, Any]:
+        """分页查询任务的问题级评分
+
+        cursor 为上一页最后一行的 (排序值, 智能体顺序, 行序号)，返回结果中的
+        next_cursor 同样为该三元组。
+        """
+        if sort_by not in RESULT_SORT_COLUMNS:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+        column = RESULT_SORT_COLUMNS[sort_by]
+        
+        conditions = ["s.task_id = ?"]
+        params: List[Any] = [task_id]
+        if agent:
+            conditions.append("s.agent = ?")
+            params.append(agent)
+        if min_score is not None:
+            conditions.append("COALESCE(s.weighted_score, 0) >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append("COALESCE(s.weighted_score, 0) <= ?")
+            params.append(max_score)
+        where = " AND ".join(conditions)
+        
+        async with self._connection() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM scores s WHERE {where}", params) as c:
+                total = (await c.fetchone())[0]
+            if limit <= 0:
+                return {"items": [], "total": total, "next_cursor": None}
+            
+            page_conditions = where
+            page_params = list(params)
+            if cursor:
+                value, agent_order, item_index = cursor
+                op = "<" if descending else ">"
+                page_conditions += f"""
+                    AND (COALESCE({column}, 0) {op} ? OR (COALESCE({column}, 0) = ? AND
+                         (s.agent_order > ? OR (s.agent_order = ? AND s.item_index > ?))))
+                """
+                page_params += [value, value, agent_order, agent_order, item_index]
+            
+            direction = "DESC" if descending else "ASC"
+            async with db.execute(
+                f"""
+                SELECT s.agent, s.item_index, q.text, s.standard_answer, s.generated_answer,
+                       s.cosine_similarity, s.jaccard_similarity, s.weighted_score,
+                       s.agent_order, COALESCE({column}, 0)
+                FROM scores s JOIN questions q ON q.id = s.question_id
+                WHERE {page_conditions}
+                ORDER BY COALESCE({column}, 0) {direction}, s.agent_order, s.item_index
+                LIMIT ?
+                """,
+                page_params + [limit + 1]
+            ) as c:
+                rows = await c.fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (float(last[9]), last[8], last[1])
+        
+        return {
+            "items": [self._score_item(row) for row in rows],
+            "total": total,
+            "next_cursor": next_cursor
+        }
+
+    async def top_run_questions(self, task_id: str, k: int = 10, metric: str = "weighted_score",
+                                bottom: bool = False, agent: str = None) -> List[Dict]:
+        """获取任务中指标最高（或最低）的 k 个问题"""
+        if k <= 0:
+            return []
+        page = await self.query_run_questions(task_id, agent, metric, not bottom, limit=k)
+        return page["items"][:k]
+
+    async def get_run_rows(self, task_id: str) -> List[Dict]:
+        """获取任务的全部评分行，按智能体和行序排列，用于导出"""
+        async with self._connection() as db:
             async with db.execute(
-                "SELECT type, COUNT(*) FROM tasks GROUP BY type"
+                """
+                SELECT s.agent, s.item_index, q.text, s.standard_answer, s.generated_answer,
+                       s.cosine_similarity, s.jaccard_similarity, s.weighted_score
+                FROM scores s JOIN questions q ON q.id = s.question_id
+                WHERE s.task_id = ? ORDER BY s.agent_order, s.item_index
+                """,
+                (task_id,)
             ) as cursor:
-                type_counts = dict(await cursor.fetchall())
+                return [self._score_item(row) for row in await cursor.fetchall()]
+
+    async def get_question_history(self, question: str, agent: str = None, limit: int = 20) -> List[Dict]:
+        """查询某个问题在最近多次评估中的得分"""
+        conditions = ["q.text = ?"]
+        params: List[Any] = [question]
+        if agent:
+            conditions.append("s.agent = ?")
+            params.append(agent)
+        async with self._connection() as db:
+            async with db.execute(
+                f"""
+                SELECT s.task_id, s.agent, s.created_at, s.cosine_similarity, s.jaccard_similarity,
+                       s.weighted_score, a.latency_ms
+                FROM scores s
+                JOIN questions q ON q.id = s.question_id
+                LEFT JOIN agent_answers a
+                    ON a.task_id = s.task_id AND a.agent = s.agent AND a.item_index = s.item_index
+                WHERE {' AND '.join(conditions)}
+                ORDER BY s.created_at DESC LIMIT ?
+                """,
+                params + [limit]
+            ) as cursor:
+                return [
+                    {
+                        "task_id": row[0],
+                        "agent": row[1],
+                        "created_at": row[2],
+                        "cosine_similarity": row[3],
+                        "jaccard_similarity": row[4],
+                        "weighted_score": row[5],
+                        "latency_ms": row[6]
+                    }
+                    for row in await cursor.fetchall()
+                ]
+
+    async def get_dashboard_stats(self) -> Dict[str, Any]:
+        """获取仪表盘统计信息"""
+        async with self._connection() as db:
+            # 任务总数、状态和类型统计（触发器维护的计数，读取成本与任务数量无关）
+            status_counts = {}
+            type_counts = {}
+            total_tasks = 0
+            async with db.execute(
+                "SELECT dimension, value, count FROM task_counters WHERE count > 0"
+            ) as cursor:
+                for dimension, value, count in await cursor.fetchall():
+                    if dimension == "total":
+                        total_tasks = count
+                    elif dimension == "status":
+                        status_counts[value] = count
+                    elif dimension == "type":
+                        type_counts[value] = count
             
             # 最近任务
             async with db.execute(
@@ -130,10 +1261,6 @@ class Database:
                         "created_at": row[3]
                     })
             
-            # 总任务数
-            async with db.execute("SELECT COUNT(*) FROM tasks") as cursor:
-                total_tasks = (await cursor.fetchone())[0]
-            
             return {
                 "total_tasks": total_tasks,
                 "status_counts": status_counts,
@@ -143,7 +1270,7 @@ class Database:
 
     async def update_system_status(self, component: str, status: str, message: str = None):
         """更新系统状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # 先删除旧记录
             await db.execute("DELETE FROM system_status WHERE component = ?", (component,))
             # 插入新记录
@@ -151,11 +1278,10 @@ class Database:
                 "INSERT INTO system_status (component, status, message) VALUES (?, ?, ?)",
                 (component, status, message)
             )
-            await db.commit()
 
     async def get_system_status(self) -> List[Dict]:
         """获取系统状态"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             async with db.execute(
                 "SELECT component, status, message, updated_at FROM system_status ORDER BY updated_at DESC"
             ) as cursor:
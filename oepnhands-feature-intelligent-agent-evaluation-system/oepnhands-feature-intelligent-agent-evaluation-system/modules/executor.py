@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+CPU_COUNT = os.cpu_count() or 1
+
+class TaskExecutor:
+    """阻塞步骤的执行层
+
+    CPU 密集的步骤（openpyxl 读写、python-docx 解析、jieba 分词等）交给进程池，
+    避免占用事件循环和 GIL；只需让出事件循环的阻塞调用交给线程池。
+    进程池大小默认等于 CPU 核数，线程池为 CPU 核数 + 4（上限 32）。
+    提交到进程池的函数及参数必须可被 pickle（模块级函数）。
+
+    取消等待中的调用时，尚未开始的作业会从队列中移除，已在子进程中运行的作业无法中断，
+    只能在后台继续执行到结束（结果被丢弃）。耗时随输入增长的作业应通过 run_cpu_chunked()
+    分块提交，取消后最多只再占用一个分块的执行时间。
+    """
+
+    def __init__(self, process_workers: int = None, thread_workers: int = None):
+        self.process_workers = process_workers or CPU_COUNT
+        self.thread_workers = thread_workers or min(32, CPU_COUNT + 4)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self.stats = {
+            "process": {"submitted": 0, "completed": 0, "failed": 0, "active": 0, "busy_seconds": 0.0},
+            "thread": {"submitted": 0, "completed": 0, "failed": 0, "active": 0, "busy_seconds": 0.0}
+        }
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # 使用 spawn 启动子进程，避免 fork 复制事件循环和数据库线程的状态
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.thread_workers, thread_name_prefix="blocking"
+            )
+        return self._thread_pool
+
+    async def _run(self, kind: str, pool, func: Callable, *args, **kwargs) -> Any:
+        stats = self.stats[kind]
+        stats["submitted"] += 1
+        stats["active"] += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+            stats["completed"] += 1
+            return result
+        except BaseException:
+            stats["failed"] += 1
+            raise
+        finally:
+            stats["active"] -= 1
+            stats["busy_seconds"] += time.perf_counter() - started
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """在进程池中执行CPU密集函数"""
+        pool = self._get_process_pool()
+        try:
+            return await self._run("process", pool, func, *args, **kwargs)
+        except BrokenProcessPool:
+            # 子进程异常退出后关闭旧进程池（回收其余子进程和队列中的作业），下次调用时重建，
+            # 本次调用在线程池中重试；并发调用可能已经完成了替换，此时不再重复处理
+            if self._process_pool is pool:
+                self._process_pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+                print("进程池已损坏，已重建")
+            return await self.run_blocking(func, *args, **kwargs)
+
+    async def run_cpu_chunked(self, func: Callable, items: list, chunk_size: int) -> list:
+        """将 items 分块依次交给进程池中的 func(块) 执行并拼接结果
+
+        每个分块之间都会回到事件循环，任务被取消时不再提交后续分块。
+        """
+        results = []
+        for start in range(0, len(items), chunk_size):
+            results.extend(await self.run_cpu(func, items[start:start + chunk_size]))
+        return results
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行阻塞函数"""
+        return await self._run("thread", self._get_thread_pool(), func, *args, **kwargs)
+
+    def shutdown(self):
+        """关闭执行池"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行池状态"""
+        return {
+            "process_workers": self.process_workers,
+            "thread_workers": self.thread_workers,
+            "process": dict(self.stats["process"]),
+            "thread": dict(self.stats["thread"])
+        }
+
+class LoopLagMonitor:
+    """事件循环阻塞监控
+
+    以固定间隔调度一次回调，实际唤醒时间与预期时间之差即为事件循环被阻塞
+    的时长。保留最近的样本用于计算分位数，并累计超过阈值的阻塞次数和时长。
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.05, window: int = 600):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.blocked_count = 0
+        self.blocked_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动监控"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止监控"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+
+    def record(self, lag: float):
+        """记录一次阻塞时长（秒）"""
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        if lag >= self.threshold:
+            self.blocked_count += 1
+            self.blocked_seconds += lag
+
+    def _percentile(self, ordered: list, q: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取事件循环阻塞统计（毫秒）"""
+        ordered = sorted(self.samples)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(ordered),
+            "last_lag_ms": (self.samples[-1] if self.samples else 0.0) * 1000,
+            "p50_lag_ms": self._percentile(ordered, 0.5) * 1000,
+            "p99_lag_ms": self._percentile(ordered, 0.99) * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "blocked_count": self.blocked_count,
+            "blocked_seconds": self.blocked_seconds
+        }
+
+# 进程内共享的执行层和事件循环监控
+executor = TaskExecutor()
+loop_monitor = LoopLagMonitor()
@@ -1,17 +1,127 @@
 import os
+import re
 import shutil
-from typing import List, Dict, Any
+import hashlib
+import uuid
+import zipfile
+import aiofiles
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
+from .metrics import metrics
+
+# 下载和打包时每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 上传文件大小上限
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+# 输出文件名中的任务ID
+TASK_ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# 本身已压缩的格式，打包时直接存储
+STORED_EXTENSIONS = {'.xlsx', '.xls', '.docx', '.zip', '.pdf'}
+
+class _ZipStreamBuffer:
+    """只写缓冲区，供 zipfile 边写边取出已生成的数据"""
 
-class FileManager:
     def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小上限"""
+    pass
+
+class FileManager:
+    def __init__(self, max_upload_size: int = MAX_UPLOAD_SIZE):
         self.upload_dir = "uploads"
         self.output_dir = "outputs"
+        # 按内容哈希存储的上传文件
+        self.blob_dir = os.path.join(self.upload_dir, "blobs")
+        self.tmp_dir = os.path.join(self.upload_dir, "tmp")
+        self.max_upload_size = max_upload_size
         
         # 确保目录存在
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    async def save_upload(self, upload, task_id: str, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+        """分块流式保存上传文件
+
+        边写入边计算SHA-256，超过大小上限时中止。内容相同的文件只在
+        blobs 目录保存一份，任务目录下的 uploads/{task_id}_{filename} 为其硬链接。
+        """
+        filename = os.path.basename(upload.filename or "upload")
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = await upload.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_size:
+                        raise UploadTooLargeError(
+                            f"文件 {filename} 超过大小上限 {self.max_upload_size // (1024 * 1024)}MB"
+                        )
+                    digest.update(chunk)
+                    await f.write(chunk)
+
+            content_hash = digest.hexdigest()
+            blob_path = os.path.join(self.blob_dir, content_hash + Path(filename).suffix.lower())
+            deduplicated = False
+            try:
+                # 原子地放入内容存储，已存在说明是重复上传
+                os.link(tmp_path, blob_path)
+            except FileExistsError:
+                deduplicated = True
+            except OSError:
+                if os.path.exists(blob_path):
+                    deduplicated = True
+                else:
+                    os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        file_path = os.path.join(self.upload_dir, f"{task_id}_{filename}")
+        try:
+            os.link(blob_path, file_path)
+        except OSError:
+            # 文件系统不支持硬链接时直接使用内容存储路径
+            file_path = blob_path
+
+        metrics.record_cache("uploads", deduplicated)
+        return {
+            "path": file_path,
+            "blob_path": blob_path,
+            "filename": filename,
+            "hash": content_hash,
+            "size": size,
+            "deduplicated": deduplicated
+        }
 
     def get_output_files(self) -> List[Dict[str, Any]]:
         """获取输出文件列表"""
@@ -93,11 +203,128 @@ class FileManager:
             '.pdf': 'pdf',
             '.txt': 'text',
             '.json': 'json',
-            '.csv': 'csv'
+            '.csv': 'csv',
+            '.collapsed': 'text',
+            '.jsonl': 'json'
         }
         
         return type_mapping.get(ext, 'unknown')
 
+    def _get_artifact_kind(self, filename: str) -> str:
+        """根据文件名判断产物类别"""
+        name = filename.lower()
+        if name.startswith("qa_pairs"):
+            return "qa_pairs"
+        if name.startswith("dify_test"):
+            return "dify_test"
+        if name.startswith("profile_"):
+            return "profile"
+        if name.startswith("trace_"):
+            return "trace"
+        if "similarity" in name or "score" in name:
+            return "similarity"
+        return "other"
+
+    def _count_rows(self, file_path: str) -> Optional[int]:
+        """统计Excel文件的数据行数（不含表头），只读取工作表尺寸信息"""
+        if Path(file_path).suffix.lower() != ".xlsx":
+            return None
+        try:
+            from openpyxl import load_workbook
+            wb = load_workbook(file_path, read_only=True)
+            try:
+                return sum(max((ws.max_row or 1) - 1, 0) for ws in wb.worksheets)
+            finally:
+                wb.close()
+        except Exception:
+            return None
+
+    def get_artifact_info(self, file_path: str, task_id: str = None, count_rows: bool = True) -> Dict[str, Any]:
+        """生成产物目录所需的文件信息"""
+        filename = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        if task_id is None:
+            match = TASK_ID_PATTERN.search(filename)
+            task_id = match.group(0) if match else None
+        return {
+            "name": filename,
+            "path": os.path.join(self.output_dir, filename),
+            "type": self._get_file_type(filename),
+            "kind": self._get_artifact_kind(filename),
+            "task_id": task_id,
+            "size": stat.st_size,
+            "row_count": self._count_rows(file_path) if count_rows else None,
+            "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+            "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "accessed_at": stat.st_mtime
+        }
+
+    def remove_files(self, file_paths: List[str]) -> Dict[str, Any]:
+        """批量删除文件，返回删除数量与释放的字节数"""
+        removed = 0
+        freed = 0
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+                os.remove(file_path)
+                removed += 1
+                # 硬链接只有最后一个链接删除时才真正释放空间
+                if stat.st_nlink <= 1:
+                    freed += stat.st_size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除文件失败 {file_path}: {e}")
+        return {"removed": removed, "freed_bytes": freed}
+
+    def discard_uploads(self, uploads: List[Dict[str, Any]]):
+        """撤销尚未记录的上传：删除任务目录下的链接，本次新存入且没有其他链接的内容文件一并删除"""
+        self.remove_files([u["path"] for u in uploads if u["path"] != u["blob_path"]])
+        for upload in uploads:
+            if upload["deduplicated"]:
+                continue
+            try:
+                # 并发请求可能已按哈希复用该文件并建立了自己的链接
+                if os.stat(upload["blob_path"]).st_nlink <= 1:
+                    os.remove(upload["blob_path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除文件失败 {upload['blob_path']}: {e}")
+
+    def clean_tmp_uploads(self, max_age_seconds: int = 3600) -> int:
+        """清理中断上传遗留的临时文件"""
+        removed = 0
+        now = datetime.now().timestamp()
+        if os.path.exists(self.tmp_dir):
+            for filename in os.listdir(self.tmp_dir):
+                file_path = os.path.join(self.tmp_dir, filename)
+                try:
+                    if now - os.path.getmtime(file_path) > max_age_seconds:
+                        os.remove(file_path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def scan_output_files(self, known: Dict[str, Tuple[int, str]] = None) -> List[Dict[str, Any]]:
+        """扫描输出目录，用于启动时与产物目录对账
+
+        known 为目录中已有的 {文件名: (大小, 修改时间)}，未变化的文件不再统计行数。
+        """
+        known = known or {}
+        entries = []
+        if os.path.exists(self.output_dir):
+            for filename in os.listdir(self.output_dir):
+                file_path = os.path.join(self.output_dir, filename)
+                if not os.path.isfile(file_path):
+                    continue
+                info = self.get_artifact_info(file_path, count_rows=False)
+                if known.get(filename) != (info["size"], info["modified_at"]):
+                    info["row_count"] = self._count_rows(file_path)
+                entries.append(info)
+        return entries
+
     def clean_old_files(self, days: int = 7):
         """清理旧文件"""
         current_time = datetime.now()
@@ -135,4 +362,81 @@ class FileManager:
                     file_path = os.path.join(dirpath, filename)
                     if os.path.exists(file_path):
                         total_size += os.path.getsize(file_path)
-        return total_size
\ No newline at end of file
+        return total_size
+
+    def get_etag(self, file_path: str) -> str:
+        """根据修改时间和大小生成ETag"""
+        stat = os.stat(file_path)
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def parse_range(self, range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+        """解析单段 Range 请求头，返回闭区间 (start, end)
+
+        请求头格式不支持（如多段范围）时返回None，按完整文件处理；
+        范围无法满足时抛出 ValueError。
+        """
+        if not range_header or not range_header.startswith("bytes="):
+            return None
+        spec = range_header[len("bytes="):].strip()
+        if "," in spec or "-" not in spec:
+            return None
+
+        start_text, end_text = spec.split("-", 1)
+        try:
+            if start_text == "":
+                # 后缀范围：最后 N 个字节
+                length = int(end_text)
+                if length <= 0:
+                    raise ValueError("无效的范围")
+                start = max(file_size - length, 0)
+                end = file_size - 1
+            else:
+                start = int(start_text)
+                end = int(end_text) if end_text else file_size - 1
+                end = min(end, file_size - 1)
+        except ValueError:
+            raise ValueError("无效的范围")
+
+        if start < 0 or start >= file_size or start > end:
+            raise ValueError("请求范围无法满足")
+        return start, end
+
+    def iter_file_range(self, file_path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """按块读取文件的指定区间（闭区间）"""
+        remaining = end - start + 1
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def iter_zip(self, file_paths: List[str], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """将多个文件实时打包为zip并逐块输出，不生成临时文件"""
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, "w", allowZip64=True) as zf:
+            for file_path in file_paths:
+                arcname = os.path.basename(file_path)
+                ext = Path(file_path).suffix.lower()
+                compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+                info = zipfile.ZipInfo.from_file(file_path, arcname)
+                info.compress_type = compress_type
+                with open(file_path, "rb") as src, zf.open(info, "w", force_zip64=True) as dest:
+                    while True:
+                        data = src.read(chunk_size)
+                        if not data:
+                            break
+                        dest.write(data)
+                        chunk = buffer.drain()
+                        if chunk:
+                            yield chunk
+                chunk = buffer.drain()
+                if chunk:
+                    yield chunk
+        # 写出中央目录
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
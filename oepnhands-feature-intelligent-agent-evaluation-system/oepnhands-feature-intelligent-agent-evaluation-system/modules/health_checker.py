@@ -0,0 +1,138 @@
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Dict, List, Any, Callable, Awaitable, Optional
+
+from .agent_tester import AgentTester
+
+class AgentHealthChecker:
+    """智能体后台健康检查
+
+    按 interval 秒（加减 jitter 比例的随机抖动，避免多个进程同时探测）并发探测
+    全部已配置的智能体，每个智能体保留最近 window 次探测结果，计算可用率和
+    延迟统计。状态接口直接返回缓存的快照，不在请求中等待探测。
+    智能体配置通过 config_loader 读取，配置变化后自动重置对应智能体的历史。
+    """
+
+    def __init__(self, config_loader: Callable[[], Awaitable[Dict]], interval: float = 60,
+                 jitter: float = 0.2, timeout: float = 10, window: int = 20):
+        self.config_loader = config_loader
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.window = window
+        self.tester = AgentTester()
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.configured = False
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._triggered: set = set()
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        """启动后台探测循环"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止后台探测循环"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def trigger(self):
+        """在后台立即探测一次（配置变更后调用，正在进行的探测结束后再按新配置探测）"""
+        task = asyncio.create_task(self._probe())
+        self._triggered.add(task)
+        task.add_done_callback(self._triggered.discard)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._probe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"智能体健康检查失败: {e}")
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _configured_agents(self, config: Dict) -> List[Dict[str, Any]]:
+        agents = []
+        for i in range(1, (config or {}).get("count", 0) + 1):
+            agent = config.get(f"agent{i}")
+            if agent:
+                agents.append({"key": f"agent{i}", "name": f"智能体{i}", "url": agent["url"], "api_key": agent["key"]})
+        return agents
+
+    def is_stale(self, config: Dict) -> bool:
+        """快照是否尚未生成或与当前配置不一致（配置可能由其他工作进程修改）"""
+        if self.checked_at is None:
+            return True
+        expected = {(a["key"], a["url"], a["api_key"]) for a in self._configured_agents(config)}
+        cached = {(key, state["url"], state["api_key"]) for key, state in self.agents.items()}
+        return expected != cached or self.configured != bool(config)
+
+    async def refresh(self) -> Dict[str, Any]:
+        """立即并发探测全部智能体并返回最新快照（与正在进行的探测合并）"""
+        if self._lock.locked():
+            async with self._lock:
+                return self.get_snapshot()
+        return await self._probe()
+
+    async def _probe(self) -> Dict[str, Any]:
+        async with self._lock:
+            config = await self.config_loader()
+            agents = self._configured_agents(config)
+            self.configured = bool(config)
+            results = await asyncio.gather(*(
+                self.tester.check_health(agent["url"], agent["api_key"], self.timeout) for agent in agents
+            ))
+
+            checked_at = time.time()
+            current = {}
+            for agent, result in zip(agents, results):
+                state = self.agents.get(agent["key"])
+                if state is None or state["url"] != agent["url"] or state["api_key"] != agent["api_key"]:
+                    state = {
+                        "name": agent["name"], "url": agent["url"], "api_key": agent["api_key"],
+                        "history": deque(maxlen=self.window), "consecutive_failures": 0
+                    }
+                state["history"].append((result["ok"], result["latency_ms"]))
+                state["consecutive_failures"] = 0 if result["ok"] else state["consecutive_failures"] + 1
+                state["last"] = result
+                state["checked_at"] = checked_at
+                current[agent["key"]] = state
+            self.agents = current
+            self.checked_at = checked_at
+            return self.get_snapshot()
+
+    def _summarize(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        history = list(state["history"])
+        latencies = sorted(latency for ok, latency in history if ok)
+        last = state["last"]
+        return {
+            "name": state["name"],
+            "status": "connected" if last["ok"] else "failed",
+            "url": state["url"],
+            "latency_ms": round(last["latency_ms"], 1),
+            "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p95_latency_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1) if latencies else None,
+            "availability": round(sum(1 for ok, _ in history if ok) / len(history), 3),
+            "samples": len(history),
+            "consecutive_failures": state["consecutive_failures"],
+            "last_error": last["error"],
+            "checked_at": state["checked_at"]
+        }
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """获取缓存的健康状态快照"""
+        return {
+            "configured": self.configured,
+            "checked_at": self.checked_at,
+            "agents": [self._summarize(state) for state in self.agents.values()]
+        }
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+GB = 1024 * 1024 * 1024
+
+class MaintenanceService:
+    """后台存储清理服务
+
+    定期按保留天数和目录容量上限清理 uploads/ 与 outputs/：优先删除超过保留期
+    未被访问的文件，仍超出容量时按最近最少使用顺序继续删除。等待或运行中任务
+    引用的文件不会被删除。文件删除在线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, db, file_manager, analysis_cache=None, interval: int = 3600,
+                 max_age_days: int = 7, upload_quota: int = 2 * GB, output_quota: int = 5 * GB):
+        self.db = db
+        self.file_manager = file_manager
+        self.analysis_cache = analysis_cache
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self.upload_quota = upload_quota
+        self.output_quota = output_quota
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        """启动后台清理循环"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止后台清理循环"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"存储清理失败: {e}")
+                await self.db.update_system_status("maintenance", "failed", str(e))
+            await asyncio.sleep(self.interval)
+
+    def _select(self, entries: List[Dict], quota: int, cutoff: float, is_live) -> List[Dict]:
+        """选出需要清理的条目（entries 已按最近访问时间升序排列）"""
+        victims = []
+        kept = []
+        for entry in entries:
+            if entry["accessed_at"] < cutoff and not is_live(entry):
+                victims.append(entry)
+            else:
+                kept.append(entry)
+
+        total = sum(entry["size"] for entry in kept)
+        for entry in kept:
+            if total <= quota:
+                break
+            if not is_live(entry):
+                victims.append(entry)
+                total -= entry["size"]
+        return victims
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一次清理并返回清理报告"""
+        async with self._lock:
+            started = time.time()
+            cutoff = started - self.max_age_days * 86400
+            live_tasks = await self.db.get_live_task_ids()
+
+            artifacts = await self.db.get_artifacts_by_access()
+            artifact_victims = self._select(
+                artifacts, self.output_quota, cutoff,
+                lambda a: a["task_id"] in live_tasks
+            )
+
+            uploads = await self.db.get_uploads_by_access()
+            upload_victims = self._select(
+                uploads, self.upload_quota, cutoff,
+                lambda u: bool(u["task_ids"] & live_tasks)
+            )
+
+            output_paths = [a["path"] for a in artifact_victims]
+            upload_paths = []
+            for upload in upload_victims:
+                upload_paths.extend(upload["links"])
+                upload_paths.append(upload["path"])
+
+            output_result = await asyncio.to_thread(self.file_manager.remove_files, output_paths)
+            upload_result = await asyncio.to_thread(self.file_manager.remove_files, upload_paths)
+
+            affected_tasks = {a["task_id"] for a in artifact_victims if a["task_id"]}
+            for upload in upload_victims:
+                affected_tasks |= upload["task_ids"]
+            removed = await self.db.delete_retained_records(
+                [a["name"] for a in artifact_victims],
+                [u["hash"] for u in upload_victims],
+                sorted(affected_tasks)
+            )
+            link_result = await asyncio.to_thread(self.file_manager.remove_files, removed["links"])
+            tmp_removed = await asyncio.to_thread(self.file_manager.clean_tmp_uploads)
+
+            if self.analysis_cache is not None:
+                for path in output_paths:
+                    self.analysis_cache.invalidate(path)
+
+            report = {
+                "ran_at": datetime.now().isoformat(),
+                "duration": round(time.time() - started, 3),
+                "outputs": {
+                    "files_removed": output_result["removed"],
+                    "bytes_freed": output_result["freed_bytes"]
+                },
+                "uploads": {
+                    "files_removed": upload_result["removed"] + link_result["removed"] + tmp_removed,
+                    "bytes_freed": upload_result["freed_bytes"] + link_result["freed_bytes"]
+                },
+                "tasks_removed": len(removed["tasks"])
+            }
+            self.last_report = report
+            await self.db.update_system_status("maintenance", "ok", json.dumps(report, ensure_ascii=False))
+
+            if output_result["removed"] or upload_result["removed"]:
+                print(
+                    f"存储清理完成：删除输出文件 {output_result['removed']} 个，上传文件 {upload_result['removed']} 个，"
+                    f"释放 {report['outputs']['bytes_freed'] + report['uploads']['bytes_freed']} 字节"
+                )
+            return report
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取清理服务配置和最近一次报告"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "max_age_days": self.max_age_days,
+            "upload_quota": self.upload_quota,
+            "output_quota": self.output_quota,
+            "last_report": self.last_report
+        }
@@ -0,0 +1,272 @@
+import time
+import bisect
+import functools
+import inspect
+from collections import deque
+from typing import Dict, List, Tuple, Sequence, Iterable, Any
+
+# 各类耗时直方图的桶边界（秒）
+OUTBOUND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+SQLITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# 处理速率的统计窗口（秒）
+RATE_WINDOW_SECONDS = 60
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self):
+        self._values.clear()
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """分桶直方图：每次观测只做一次二分查找和几次加法"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = OUTBOUND_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # 各桶计数（不累计，最后一格为 +Inf）、总和、次数
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+class _OutboundTimer:
+    """外部调用计时：进入时计入进行中的请求，退出时按状态记录耗时
+
+    调用方在拿到响应后设置 status（HTTP状态码）；未设置而抛出异常时记为 error。
+    """
+
+    def __init__(self, registry: "Metrics", service: str, target: str):
+        self.registry = registry
+        self.service = service
+        self.target = target
+        self.status = None
+        self._start = 0.0
+
+    def __enter__(self) -> "_OutboundTimer":
+        self.registry.outbound_in_flight.inc(service=self.service, target=self.target)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self.registry.outbound_in_flight.dec(service=self.service, target=self.target)
+        status = self.status if self.status is not None else ("error" if exc_type else "ok")
+        self.registry.outbound_duration.observe(elapsed, service=self.service, target=self.target, status=status)
+        self.registry._count_rate(self.registry.outbound_rate, 1, service=self.service)
+        return False
+
+class Metrics:
+    """进程内的运行指标，按 Prometheus 文本格式输出
+
+    所有记录都在事件循环线程中完成，只是字典查找和加法，不加锁，常开的开销可以忽略。
+    多个工作进程各自统计，由 Prometheus 按实例分别抓取后汇总。
+    """
+
+    def __init__(self, prefix: str = "agent_eval"):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+        # 按秒分桶的速率窗口，键为 (速率指标, 标签值)
+        self._rates: Dict[Tuple[Gauge, Tuple[str, ...]], deque] = {}
+
+        self.outbound_duration = self._add(Histogram(
+            f"{prefix}_outbound_request_duration_seconds", "外部接口调用耗时（Dify按智能体，硅基流动按接口）",
+            ["service", "target", "status"], OUTBOUND_BUCKETS))
+        self.outbound_in_flight = self._add(Gauge(
+            f"{prefix}_outbound_requests_in_flight", "进行中的外部接口调用数", ["service", "target"]))
+        self.outbound_rate = self._add(Gauge(
+            f"{prefix}_outbound_requests_per_second", f"最近 {RATE_WINDOW_SECONDS} 秒的外部接口调用速率", ["service"]))
+        self.tokens = self._add(Counter(
+            f"{prefix}_tokens_total", "外部接口消耗的令牌数（kind 为 prompt/completion）", ["service", "target", "kind"]))
+        self.tokens_rate = self._add(Gauge(
+            f"{prefix}_tokens_per_second", f"最近 {RATE_WINDOW_SECONDS} 秒的令牌消耗速率", ["service"]))
+        self.http_in_flight = self._add(Gauge(
+            f"{prefix}_http_requests_in_flight", "正在处理的HTTP请求数（含SSE长连接，另见 sse_connections）"))
+        self.sse_connections = self._add(Gauge(
+            f"{prefix}_sse_connections", "当前的SSE进度订阅连接数"))
+        self.queue_depth = self._add(Gauge(
+            f"{prefix}_task_queue_depth", "等待执行的任务数（全部工作进程共享的队列）"))
+        self.active_tasks = self._add(Gauge(
+            f"{prefix}_tasks_active", "本进程运行中的任务数", ["type"]))
+        self.task_duration = self._add(Histogram(
+            f"{prefix}_task_duration_seconds", "任务执行耗时", ["type", "outcome"], STAGE_BUCKETS))
+        self.stage_duration = self._add(Histogram(
+            f"{prefix}_stage_duration_seconds", "评估阶段耗时（generation/testing/scoring）", ["stage"], STAGE_BUCKETS))
+        self.items_processed = self._add(Counter(
+            f"{prefix}_items_processed_total", "各阶段处理的工作项数（段落、问题、评分行）", ["stage"]))
+        self.items_rate = self._add(Gauge(
+            f"{prefix}_items_processed_per_second", f"最近 {RATE_WINDOW_SECONDS} 秒各阶段的平均处理速率", ["stage"]))
+        self.cache_requests = self._add(Counter(
+            f"{prefix}_cache_requests_total", "缓存查询次数", ["cache", "result"]))
+        self.cache_hit_ratio = self._add(Gauge(
+            f"{prefix}_cache_hit_ratio", "缓存命中率（进程启动以来）", ["cache"]))
+        self.sqlite_write_duration = self._add(Histogram(
+            f"{prefix}_sqlite_write_duration_seconds", "SQLite写入耗时（含排队和所在批次提交）", [], SQLITE_BUCKETS))
+        self.sqlite_commit_duration = self._add(Histogram(
+            f"{prefix}_sqlite_commit_duration_seconds", "SQLite合并提交耗时", [], SQLITE_BUCKETS))
+        self.sqlite_commit_batch = self._add(Histogram(
+            f"{prefix}_sqlite_commit_batch_size", "每次合并提交包含的写入数", [], BATCH_BUCKETS))
+        self.db_operation_duration = self._add(Histogram(
+            f"{prefix}_db_operation_duration_seconds", "Database 各方法的耗时", ["method", "status"], SQLITE_BUCKETS))
+        self.worker_info = self._add(Gauge(
+            f"{prefix}_worker_info", "工作进程标识", ["worker_id"]))
+
+    def _add(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def outbound(self, service: str, target: str) -> _OutboundTimer:
+        """外部调用计时的上下文管理器：with metrics.outbound("dify", agent_name) as call: ... call.status = 200"""
+        return _OutboundTimer(self, service, target)
+
+    def observe_stage(self, stage: str, seconds: float):
+        self.stage_duration.observe(seconds, stage=stage)
+
+    def record_items(self, stage: str, count: int = 1):
+        """记录处理完成的工作项，同时计入按秒分桶的速率窗口"""
+        self.items_processed.inc(count, stage=stage)
+        self._count_rate(self.items_rate, count, stage=stage)
+
+    def record_tokens(self, service: str, target: str, prompt_tokens: int, completion_tokens: int):
+        """记录一次外部调用的令牌用量"""
+        self.tokens.inc(prompt_tokens, service=service, target=target, kind="prompt")
+        self.tokens.inc(completion_tokens, service=service, target=target, kind="completion")
+        self._count_rate(self.tokens_rate, prompt_tokens + completion_tokens, service=service)
+
+    def _count_rate(self, gauge: Gauge, count: float, **labels):
+        window = self._rates.setdefault((gauge, gauge._key(labels)), deque())
+        second = int(time.monotonic())
+        if window and window[-1][0] == second:
+            window[-1][1] += count
+        else:
+            window.append([second, count])
+        self._prune(window, second)
+
+    def _prune(self, window: deque, now: int):
+        while window and window[0][0] <= now - RATE_WINDOW_SECONDS:
+            window.popleft()
+
+    def record_cache(self, cache: str, hit: bool):
+        self.cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（0.0.4）"""
+        now = int(time.monotonic())
+        for (gauge, key), window in self._rates.items():
+            self._prune(window, now)
+            gauge.set(sum(count for _, count in window) / RATE_WINDOW_SECONDS, **dict(zip(gauge.labelnames, key)))
+        caches = {key[0] for key in self.cache_requests._values}
+        for cache in caches:
+            hits = self.cache_requests.get(cache=cache, result="hit")
+            total = hits + self.cache_requests.get(cache=cache, result="miss")
+            self.cache_hit_ratio.set(hits / total if total else 0.0, cache=cache)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def timed_methods(self, histogram: Histogram, exclude: Sequence[str] = ()):
+        """类装饰器：为类的公开协程方法记录耗时，标签为方法名和结果（ok/error）"""
+        def wrap(method):
+            name = method.__name__
+
+            @functools.wraps(method)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                status = "error"
+                try:
+                    result = await method(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    histogram.observe(time.perf_counter() - start, method=name, status=status)
+            return timed
+
+        def decorate(cls):
+            for name, member in list(vars(cls).items()):
+                if name.startswith("_") or name in exclude or not inspect.iscoroutinefunction(member):
+                    continue
+                setattr(cls, name, wrap(member))
+            return cls
+        return decorate
+
+# 全局指标（每个工作进程一份）
+metrics = Metrics()
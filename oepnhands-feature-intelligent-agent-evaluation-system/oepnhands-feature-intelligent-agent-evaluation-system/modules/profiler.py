@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from .executor import TaskExecutor
+
+# 默认采样间隔（秒）
+PROFILE_INTERVAL = 0.01
+# 报告中各排行保留的条数
+PROFILE_TOP = 30
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EXECUTOR_CODE = TaskExecutor._run.__code__
+
+# 正在运行的分析器（按事件循环），用于把分析任务派生的子任务一并纳入采样
+_active: List["TaskProfiler"] = []
+_previous_factories: Dict[int, Any] = {}
+
+def _short_path(filename: str) -> str:
+    """应用内文件显示相对路径，依赖库只保留包名和文件名"""
+    if filename.startswith(APP_ROOT + os.sep) and "site-packages" not in filename:
+        return os.path.relpath(filename, APP_ROOT)
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+def _is_app_frame(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(APP_ROOT + os.sep) and "site-packages" not in filename
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    label = f"{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})"
+    if code is _EXECUTOR_CODE:
+        # 执行池调用标注实际执行的函数，区分工作簿读写、文档解析和分词
+        func = frame.f_locals.get("func")
+        label += f" [{getattr(func, '__name__', func)}]"
+    # 折叠栈格式以分号分隔栈帧
+    return label.replace(";", ":")
+
+def _awaitable_label(awaitable) -> str:
+    if isinstance(awaitable, asyncio.Task):
+        return f"Task {awaitable.get_name()}"
+    name = type(awaitable).__name__
+    # C 实现的 Future 在 await 时返回 FutureIter
+    return "Future" if name == "FutureIter" else name
+
+def _task_factory(loop, coro, **kwargs):
+    """分析期间的任务工厂：由被分析任务创建的子任务同样纳入采样"""
+    previous = _previous_factories.get(id(loop))
+    task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+    parent = asyncio.current_task(loop)
+    for profiler in _active:
+        if profiler.loop is loop and parent in profiler.tasks:
+            profiler.add_child(task)
+    return task
+
+class TaskProfiler:
+    """单个任务的采样分析
+
+    后台线程按固定间隔采样事件循环线程：任务正在执行时记录当前调用栈（running），
+    挂起时沿协程的 await 链还原挂起位置，并区分仍在等待（waiting）和结果已就绪、
+    等待事件循环调度（ready）。由此统计各 await 位置的等待时长，以及任务执行期间
+    创建的子任务数量和耗时。外部接口、执行池（工作簿读写、分词）和数据库的耗时
+    都以各自的 await 位置出现。只在显式开启的任务上运行，结束后停止采样线程。
+    """
+
+    def __init__(self, task_id: str, task_type: str, interval: float = PROFILE_INTERVAL):
+        self.task_id = task_id
+        self.task_type = task_type
+        self.interval = interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.root: Optional[asyncio.Task] = None
+        self.tasks: Dict[asyncio.Task, str] = {}
+        self.children: List[Dict[str, Any]] = []
+        self.stacks: Counter = Counter()
+        self.state_seconds: Counter = Counter()
+        self.child_state_seconds: Counter = Counter()
+        self.await_seconds: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[str] = None
+        self._started = 0.0
+        self.duration = 0.0
+        self._thread_id = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """在被分析的任务内调用，开始采样"""
+        self.loop = asyncio.get_running_loop()
+        self.root = asyncio.current_task()
+        self.tasks[self.root] = f"task:{self.task_type}"
+        self._thread_id = threading.get_ident()
+        if not any(p.loop is self.loop for p in _active):
+            _previous_factories[id(self.loop)] = self.loop.get_task_factory()
+            self.loop.set_task_factory(_task_factory)
+        _active.append(self)
+        self.started_at = datetime.now().isoformat()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.task_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样并恢复任务工厂"""
+        self.duration = time.perf_counter() - self._started
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        _active.remove(self)
+        if not any(p.loop is self.loop for p in _active):
+            self.loop.set_task_factory(_previous_factories.pop(id(self.loop), None))
+
+    def add_child(self, task: asyncio.Task):
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        record = {"name": name, "started": time.perf_counter(), "seconds": None}
+        self.children.append(record)
+        self.tasks[task] = f"child:{name}"
+
+        def finished(_):
+            record["seconds"] = time.perf_counter() - record["started"]
+            self.tasks.pop(task, None)
+        task.add_done_callback(finished)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            try:
+                self._sample(now - last)
+            except Exception:
+                # 与事件循环线程并发读取栈帧，个别采样可能读到中间状态，直接丢弃
+                pass
+            last = now
+
+    def _sample(self, weight: float):
+        current = asyncio.current_task(self.loop)
+        frames = sys._current_frames()
+        for task, name in list(self.tasks.items()):
+            if task.done():
+                continue
+            if task is current:
+                stack, state, site = self._running_stack(task, frames.get(self._thread_id)), "running", None
+            else:
+                stack, state, site = self._suspended_stack(task)
+            self.samples += 1
+            if task is self.root:
+                self.state_seconds[state] += weight
+            else:
+                self.child_state_seconds[state] += weight
+            if site is not None:
+                self.await_seconds[site] += weight
+            self.stacks[(name,) + tuple(stack)] += 1
+
+    def _running_stack(self, task: asyncio.Task, frame) -> List[str]:
+        """正在执行的任务：从线程当前栈帧向上取到任务的根协程为止"""
+        root = task.get_coro().cr_frame
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            if frame is root:
+                break
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _suspended_stack(self, task: asyncio.Task) -> Tuple[List[str], str, Tuple[str, str]]:
+        """挂起的任务：沿 await 链还原挂起位置，返回 (调用栈, 状态, (应用内await位置, 等待对象))"""
+        stack = []
+        app_frame = None
+        awaitable = task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                break
+            stack.append(_frame_label(frame))
+            if _is_app_frame(frame):
+                app_frame = stack[-1]
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        leaf = _awaitable_label(awaitable) if awaitable is not None else "unknown"
+        state = "ready" if isinstance(awaitable, asyncio.Future) and awaitable.done() else "waiting"
+        stack.append(f"[{state}] {leaf}")
+        innermost = stack[-2] if len(stack) > 1 else leaf
+        awaiting = leaf if innermost == app_frame else f"{innermost} -> {leaf}"
+        return stack, state, (app_frame or stack[0], awaiting)
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总报告：状态分布、等待位置、热点函数和子任务"""
+        running = Counter()
+        inclusive = Counter()
+        total_samples = sum(self.stacks.values()) or 1
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if frames and not frames[-1].startswith("["):
+                running[frames[-1]] += count
+            for label in set(frames):
+                if not label.startswith("["):
+                    inclusive[label] += count
+        seconds_per_sample = (sum(self.state_seconds.values()) + sum(self.child_state_seconds.values())) / total_samples
+        children: Dict[str, Dict[str, Any]] = {}
+        for child in self.children:
+            entry = children.setdefault(child["name"], {"name": child["name"], "count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            seconds = child["seconds"] if child["seconds"] is not None else 0.0
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        total_wait = sum(self.await_seconds.values()) or 1
+        return {
+            "task_id": self.task_id,
+            "task_type": self.task_type,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 3),
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "states": {state: round(seconds, 3) for state, seconds in self.state_seconds.items()},
+            "await_sites": [
+                {"site": site, "awaiting": awaiting, "seconds": round(seconds, 3), "share": round(seconds / total_wait, 4)}
+                for (site, awaiting), seconds in self.await_seconds.most_common(PROFILE_TOP)
+            ],
+            "hot_functions": [
+                {"function": label, "self_seconds": round(count * seconds_per_sample, 3),
+                 "total_seconds": round(inclusive[label] * seconds_per_sample, 3)}
+                for label, count in running.most_common(PROFILE_TOP)
+            ],
+            "child_tasks": {
+                "created": len(self.children),
+                "states": {state: round(seconds, 3) for state, seconds in self.child_state_seconds.items()},
+                "by_name": sorted(children.values(), key=lambda c: c["total_seconds"], reverse=True)[:PROFILE_TOP]
+            }
+        }
+
+    def collapsed(self) -> str:
+        """折叠栈格式（frame;frame;... 次数），可直接用 flamegraph.pl 或 speedscope 生成火焰图"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def write(self, output_dir: str) -> Dict[str, str]:
+        """保存报告和折叠栈文件，返回文件路径（可在线程池中执行）"""
+        summary_path = os.path.join(output_dir, f"profile_{self.task_id}.json")
+        collapsed_path = os.path.join(output_dir, f"profile_{self.task_id}.collapsed")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return {"profile_file": summary_path, "profile_stacks_file": collapsed_path}
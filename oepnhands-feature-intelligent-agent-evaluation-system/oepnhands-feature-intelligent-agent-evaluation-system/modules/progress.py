@@ -0,0 +1,242 @@
+import time
+import asyncio
+from typing import Dict, Any, Optional, Set, Callable
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+class ProgressBroker:
+    """进程内任务进度发布/订阅
+
+    每个任务只保留最新一条进度快照；订阅者各自持有一个有界队列，消费过慢时
+    丢弃最旧的事件（进度事件是完整快照，丢弃中间状态不影响最终显示）。
+    任意数量的订阅者都只读取内存中的事件，不会增加数据库负载。
+    设置 on_publish 后，本进程发布的事件会同时交给它（用于转发给其他工作进程）。
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.on_publish: Optional[Callable[[str, Dict[str, Any]], None]] = None
+        self._subscribers: Dict[Optional[str], Set[asyncio.Queue]] = {}
+
+    def subscribe(self, task_id: str = None) -> asyncio.Queue:
+        """订阅指定任务（task_id 为空时订阅全部任务）的进度事件"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, task_id: str = None):
+        """取消订阅"""
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(task_id, None)
+
+    def publish(self, task_id: str, event: Dict[str, Any], forward: bool = True):
+        """发布进度事件，forward 为 False 时不再转发（事件来自其他工作进程）"""
+        event = dict(event, task_id=task_id)
+        if forward or "timestamp" not in event:
+            event["timestamp"] = time.time()
+        if event.get("status") in TERMINAL_STATUSES:
+            self.latest.pop(task_id, None)
+        else:
+            self.latest[task_id] = event
+
+        for key in (task_id, None):
+            for queue in self._subscribers.get(key, ()):
+                if queue.full():
+                    try:
+                        queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        pass
+                queue.put_nowait(event)
+        
+        if forward and self.on_publish is not None:
+            self.on_publish(task_id, event)
+
+    def get_snapshot(self, task_id: str = None) -> Any:
+        """获取最新进度快照"""
+        if task_id is not None:
+            return self.latest.get(task_id)
+        return list(self.latest.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取订阅统计"""
+        return {
+            "active_tasks": len(self.latest),
+            "subscribers": sum(len(s) for s in self._subscribers.values())
+        }
+
+class ProgressRelay:
+    """通过共享数据库在工作进程之间转发进度事件
+
+    本进程发布的事件按任务合并（每个任务在一个转发周期内只保留最新一条），
+    每 interval 秒批量写入 task_events 表；同时读取其他进程写入的新事件，
+    发布到本进程的 ProgressBroker，使任意进程上的SSE订阅者都能收到全部任务的进度。
+    超过 retention 秒的事件定期清理。
+    """
+
+    def __init__(self, broker: ProgressBroker, db, worker_id: str, interval: float = 1.0,
+                 retention: float = 600.0):
+        self.broker = broker
+        self.db = db
+        self.worker_id = worker_id
+        self.interval = interval
+        self.retention = retention
+        self.last_seq = 0
+        self.forwarded = 0
+        self.received = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = 0.0
+
+    async def start(self):
+        """从当前最新事件之后开始转发"""
+        if self._task is not None and not self._task.done():
+            return
+        self.last_seq = await self.db.get_last_task_event_seq()
+        self.broker.on_publish = self.forward
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止转发，并写出尚未转发的事件"""
+        self.broker.on_publish = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._flush()
+        except Exception as e:
+            print(f"进度事件转发失败: {e}")
+
+    def forward(self, task_id: str, event: Dict[str, Any]):
+        """登记待转发的事件（同一任务只保留最新一条）"""
+        self._pending[task_id] = event
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        events = list(self._pending.values())
+        self._pending.clear()
+        await self.db.append_task_events(self.worker_id, events)
+        self.forwarded += len(events)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._flush()
+                for row in await self.db.get_task_events(self.last_seq, self.worker_id):
+                    self.last_seq = row["seq"]
+                    event = row["event"]
+                    self.broker.publish(event["task_id"], event, forward=False)
+                    self.received += 1
+                if time.time() - self._last_prune > self.retention / 10:
+                    self._last_prune = time.time()
+                    await self.db.prune_task_events(time.time() - self.retention)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"进度事件转发失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取转发统计"""
+        return {
+            "worker_id": self.worker_id,
+            "last_seq": self.last_seq,
+            "forwarded": self.forwarded,
+            "received": self.received,
+            "pending": len(self._pending)
+        }
+
+class TaskProgress:
+    """单个任务的进度跟踪
+
+    按阶段记录已完成数量和总数，计算吞吐量（条/秒）和预计剩余时间，
+    每次更新都发布到 ProgressBroker 并同步给任务管理器。传入任务控制对象时，
+    暂停期间发布的快照状态为 paused；传入 usage 时快照中附带令牌/秒和请求/秒。
+    """
+
+    def __init__(self, broker: ProgressBroker, task_id: str, task_type: str = None,
+                 stage_count: int = 1, on_percent: Callable[[str, int], None] = None, control=None,
+                 usage: Callable[[], Dict[str, Any]] = None):
+        self.broker = broker
+        self.task_id = task_id
+        self.task_type = task_type
+        self.stage_count = stage_count
+        self.on_percent = on_percent
+        self.control = control
+        self.usage = usage
+        self.started_at = time.time()
+        self.stage = None
+        self.stage_index = 0
+        self.stage_started_at = self.started_at
+        self.done = 0
+        self.total = None
+
+    def start_stage(self, stage: str, total: int = None):
+        """进入新阶段"""
+        if self.stage is not None:
+            self.stage_index += 1
+        self.stage = stage
+        self.stage_started_at = time.time()
+        self.done = 0
+        self.total = total
+        self._publish()
+
+    def update(self, done: int, total: int = None):
+        """更新当前阶段的完成数量"""
+        self.done = done
+        if total is not None:
+            self.total = total
+        self._publish()
+
+    def callback(self, stage: str) -> Callable[[int, int], None]:
+        """返回供业务模块调用的进度回调 callback(done, total)，首次调用时进入该阶段"""
+        def report(done: int, total: int):
+            if self.stage != stage:
+                self.start_stage(stage, total)
+            self.update(done, total)
+        return report
+
+    def _percent(self) -> float:
+        stage_fraction = 0.0
+        if self.total:
+            stage_fraction = min(1.0, self.done / self.total)
+        return round(100 * (self.stage_index + stage_fraction) / max(1, self.stage_count), 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进度快照"""
+        now = time.time()
+        stage_elapsed = now - self.stage_started_at
+        throughput = self.done / stage_elapsed if stage_elapsed > 0 and self.done else 0.0
+        eta = None
+        if self.total is not None and throughput > 0:
+            eta = round(max(0, self.total - self.done) / throughput, 1)
+        snapshot = {
+            "type": self.task_type,
+            "status": "paused" if self.control is not None and self.control.paused else "running",
+            "stage": self.stage,
+            "stage_index": self.stage_index,
+            "stage_count": self.stage_count,
+            "done": self.done,
+            "total": self.total,
+            "percent": self._percent(),
+            "throughput": round(throughput, 3),
+            "eta_seconds": eta,
+            "elapsed_seconds": round(now - self.started_at, 1)
+        }
+        if self.usage is not None:
+            snapshot.update(self.usage())
+        return snapshot
+
+    def _publish(self):
+        event = self.snapshot()
+        self.broker.publish(self.task_id, event)
+        if self.on_percent is not None:
+            self.on_percent(self.task_id, int(event["percent"]))
@@ -1,29 +1,119 @@
-import requests
 import json
-from typing import List, Dict
+from typing import List, Dict, Callable, Awaitable
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
+import time
 import random
 import asyncio
 import aiohttp
-from docx import Document
+from collections import OrderedDict
+from .executor import executor
+from .rate_limiter import governor, estimate_tokens, retry_after_seconds
+from .usage import token_usage
+from .metrics import metrics
+from .tracing import tracer, SPAN_KIND_CLIENT
+
+# 按上传内容哈希缓存的文档段落，重复上传的文档无需再次解析
+_paragraph_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+PARAGRAPH_CACHE_SIZE = 32
+
+# 硅基流动接口地址，可通过环境变量指向代理或本地模拟服务（性能基准使用）
+SILICONFLOW_BASE_URL = os.environ.get("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1").rstrip("/")
+
+# 生成问答对时为模型输出预留的令牌数（用于限流估算）
+QA_OUTPUT_TOKENS = 1024
+
+def read_paragraphs(filepath: str) -> List[str]:
+    """解析文档中的非空段落（可在进程池中执行）"""
+    from docx import Document
+    doc = Document(filepath)
+    return [para.text.strip() for para in doc.paragraphs if para.text.strip()]
+
+def write_qa_excel(qa_pairs: List[Dict], output_path: str):
+    """生成规范的问答对Excel文档（可在进程池中执行）"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "问答对"
+    
+    # 设置表头
+    ws.append(["问题", "答案"])
+    for cell in ws[1]:
+        cell.font = Font(bold=True, size=12)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+    
+    # 添加问答内容
+    for qa in qa_pairs:
+        question = qa.get('question', '无问题内容')
+        answer = qa.get('answer', '无答案内容')
+        ws.append([question, answer])
+    
+    # 自动调整列宽
+    for col in ws.columns:
+        max_length = 0
+        column = col[0].column_letter
+        for cell in col:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(cell.value)
+            except:
+                pass
+        adjusted_width = min((max_length + 2), 50)  # 限制最大宽度
+        ws.column_dimensions[column].width = adjusted_width
+    
+    wb.save(output_path)
+    print(f"已生成问答Excel: {os.path.abspath(output_path)}")
+
+def _cache_paragraphs(content_hash: str, paragraphs: List[str]):
+    _paragraph_cache[content_hash] = paragraphs
+    while len(_paragraph_cache) > PARAGRAPH_CACHE_SIZE:
+        _paragraph_cache.popitem(last=False)
 
 class QAGenerator:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.chat_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.chat_url = f"{SILICONFLOW_BASE_URL}/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        self.qa_pairs: List[Dict] = []
     
-    def read_docx(self, filepath: str) -> List[str]:
-        """读取并返回文档中的所有段落"""
-        doc = Document(filepath)
-        paragraphs = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
-        return paragraphs
+    def read_docx(self, filepath: str, content_hash: str = None) -> List[str]:
+        """读取并返回文档中的所有段落，提供内容哈希时复用已解析结果"""
+        if content_hash and content_hash in _paragraph_cache:
+            metrics.record_cache("paragraphs", True)
+            _paragraph_cache.move_to_end(content_hash)
+            return list(_paragraph_cache[content_hash])
+        if content_hash:
+            metrics.record_cache("paragraphs", False)
+        
+        paragraphs = read_paragraphs(filepath)
+        if content_hash:
+            _cache_paragraphs(content_hash, paragraphs)
+        return list(paragraphs)
 
+    @tracer.traced("document read")
+    async def read_docx_async(self, filepath: str, content_hash: str = None) -> List[str]:
+        """与 read_docx 相同，但在进程池中解析文档，不阻塞事件循环"""
+        span = tracer.current_span()
+        span.set_attribute("file.path", filepath)
+        if content_hash and content_hash in _paragraph_cache:
+            metrics.record_cache("paragraphs", True)
+            span.set_attribute("cache.hit", True)
+            _paragraph_cache.move_to_end(content_hash)
+            return list(_paragraph_cache[content_hash])
+        if content_hash:
+            metrics.record_cache("paragraphs", False)
+        span.set_attribute("cache.hit", False)
+        
+        paragraphs = await executor.run_cpu(read_paragraphs, filepath)
+        span.set_attribute("paragraphs", len(paragraphs))
+        if content_hash:
+            _cache_paragraphs(content_hash, paragraphs)
+        return list(paragraphs)
+
+    @tracer.traced("qa generation call", SPAN_KIND_CLIENT)
     async def generate_qa_pairs(self, text: str, temperature: float = 0.3) -> List[Dict]:
         """调用API生成问答对"""
         prompt = f"""请基于以下文本生成专业问答对，要求：
@@ -58,86 +148,106 @@ class QAGenerator:
             "response_format": {"type": "json_object"}
         }
         
+        # 令牌估算包含输入和为输出预留的额度，返回后按实际用量修正
+        estimated = estimate_tokens(prompt) + QA_OUTPUT_TOKENS
+        span = tracer.current_span()
+        span.set_attributes({"text.length": len(text), "http.url": self.chat_url})
+        result = None
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.chat_url, json=payload, headers=self.headers, timeout=30) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    content = result.get('choices', [{}])[0].get('message', {}).get('content', '{}')
-                    qa_data = json.loads(content)
-                    return qa_data.get('questions', [])
-        except json.JSONDecodeError:
+            for attempt in range(3):
+                span.set_attribute("retry.count", attempt)
+                await governor.acquire(self.api_key, "siliconflow/chat", estimated)
+                with metrics.outbound("siliconflow", "chat") as call:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.post(self.chat_url, json=payload, headers=self.headers, timeout=30) as response:
+                            call.status = response.status
+                            span.set_attribute("http.response.status_code", response.status)
+                            if response.status == 429 and attempt < 2:
+                                governor.penalize(self.api_key, "siliconflow/chat", retry_after_seconds(response.headers))
+                                token_usage.record_error("siliconflow", "chat")
+                                continue
+                            response.raise_for_status()
+                            span.set_attribute("http.response.body.size", len(await response.read()))
+                            result = await response.json()
+                prompt_tokens, completion_tokens = token_usage.record("siliconflow", "chat", result.get('usage'),
+                                                                      estimate_tokens(prompt))
+                span.set_attributes({"tokens.prompt": prompt_tokens, "tokens.completion": completion_tokens})
+                governor.settle(self.api_key, "siliconflow/chat", estimated, prompt_tokens + completion_tokens)
+                content = result.get('choices', [{}])[0].get('message', {}).get('content', '{}')
+                qa_data = json.loads(content)
+                span.set_attribute("qa_pairs", len(qa_data.get('questions', [])))
+                return qa_data.get('questions', [])
+        except json.JSONDecodeError as e:
+            span.set_error(e)
             print("API返回的JSON格式不正确")
             return []
         except Exception as e:
+            if result is None:
+                token_usage.record_error("siliconflow", "chat")
+            span.set_error(e)
             print(f"生成问答对失败: {str(e)}")
             return []
 
     def create_qa_excel(self, qa_pairs: List[Dict], output_path: str):
         """生成规范的问答对Excel文档"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "问答对"
-        
-        # 设置表头
-        ws.append(["问题", "答案"])
-        for cell in ws[1]:
-            cell.font = Font(bold=True, size=12)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # 添加问答内容
-        for qa in qa_pairs:
-            question = qa.get('question', '无问题内容')
-            answer = qa.get('answer', '无答案内容')
-            ws.append([question, answer])
-        
-        # 自动调整列宽
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min((max_length + 2), 50)  # 限制最大宽度
-            ws.column_dimensions[column].width = adjusted_width
-        
-        wb.save(output_path)
-        print(f"已生成问答Excel: {os.path.abspath(output_path)}")
+        write_qa_excel(qa_pairs, output_path)
+
+    @tracer.traced("stage generation")
+    @token_usage.stage("generation")
+    async def process_documents(self, input_paths: List[str], output_path: str, max_paragraphs: int = 20, temperature: float = 0.3, content_hashes: Dict[str, str] = None, progress_callback: Callable[[int, int], None] = None, wait_if_paused: Callable[[], Awaitable[None]] = None) -> List[Dict]:
+        """处理多个文档，progress_callback(已完成段落数, 段落总数) 用于报告进度
 
-    async def process_documents(self, input_paths: List[str], output_path: str, max_paragraphs: int = 20, temperature: float = 0.3) -> List[Dict]:
-        """处理多个文档"""
+        wait_if_paused 在每个段落之前调用，任务暂停时在此等待；已生成的问答对
+        实时保存在 self.qa_pairs 中，任务被取消时可据此记录部分结果。
+        """
+        started = time.perf_counter()
         all_qa = []
+        self.qa_pairs = all_qa
+        content_hashes = content_hashes or {}
         
+        # 先读取全部文档并选定段落，以便得到总进度
+        selections = []
         for input_path in input_paths:
             print(f"正在处理文档: {input_path}")
-            paragraphs = self.read_docx(input_path)
+            paragraphs = await self.read_docx_async(input_path, content_hashes.get(input_path))
             
             if not paragraphs:
                 print(f"警告：文档 {input_path} 中没有有效段落")
                 continue
             
             # 随机选择段落
-            selected_paragraphs = random.sample(paragraphs, min(max_paragraphs, len(paragraphs)))
-            
+            selections.append((input_path, random.sample(paragraphs, min(max_paragraphs, len(paragraphs)))))
+        
+        total = sum(len(selected) for _, selected in selections)
+        tracer.current_span().set_attributes({"documents": len(input_paths), "items.total": total})
+        done = 0
+        if progress_callback:
+            progress_callback(done, total)
+        
+        for input_path, selected_paragraphs in selections:
             print(f"正在生成问答对，共 {len(selected_paragraphs)} 个段落...")
             for i, para in enumerate(selected_paragraphs, 1):
+                if wait_if_paused:
+                    await wait_if_paused()
                 qa_pairs = await self.generate_qa_pairs(para, temperature)
                 for qa in qa_pairs:
                     qa['source_file'] = os.path.basename(input_path)
                     all_qa.append(qa)
                 print(f"进度: {i}/{len(selected_paragraphs)} 段落，当前段落生成 {len(qa_pairs)} 个问答对")
-                
-                # 添加延迟避免API限制
-                await asyncio.sleep(0.5)
+                done += 1
+                metrics.record_items("generation")
+                token_usage.count_item()
+                if progress_callback:
+                    progress_callback(done, total)
         
         if not all_qa:
             print("警告：未生成任何问答对，请检查API调用或文档内容")
             return []
         
-        self.create_qa_excel(all_qa, output_path)
+        with tracer.span("workbook save", {"file.path": output_path, "rows": len(all_qa)}) as span:
+            await executor.run_cpu(write_qa_excel, all_qa, output_path)
+            span.set_attribute("file.size", os.path.getsize(output_path))
+        metrics.observe_stage("generation", time.perf_counter() - started)
         return all_qa
 
     async def process_document(self, input_path: str, output_path: str, max_paragraphs: int = 20, temperature: float = 0.3) -> List[Dict]:
@@ -0,0 +1,168 @@
+import time
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional, Tuple
+
+# 各外部接口的默认限额（每分钟请求数 RPM、每分钟令牌数 TPM），未列出的接口只统计不限流
+DEFAULT_LIMITS = {
+    "siliconflow/chat": {"rpm": 1000, "tpm": 50000},
+    "siliconflow/embeddings": {"rpm": 2000, "tpm": 500000}
+}
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的令牌数（中文约每字一个令牌，按字符数估算偏保守）"""
+    return len(text or "")
+
+class TokenBucket:
+    """令牌桶：按每分钟限额匀速补充，最多积累 burst_seconds 秒的额度
+
+    预约时立即扣减（允许为负），返回需要等待的秒数，先到的调用先获得额度；
+    超过桶容量的单次预约按欠额折算等待时间。
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """预约额度，返回等待秒数"""
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float):
+        """归还（正数）或追加扣减（负数）额度"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+class _Limiter:
+    """单个 API Key + 接口的请求桶、令牌桶和统计"""
+
+    def __init__(self, limits: Optional[Dict[str, float]]):
+        limits = limits or {}
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.limits = {"rpm": limits.get("rpm"), "tpm": limits.get("tpm")}
+        self.blocked_until = 0.0
+        self.stats = {
+            "requests": 0, "tokens": 0, "waiting": 0, "waited": 0,
+            "wait_seconds": 0.0, "max_wait_seconds": 0.0, "throttled": 0
+        }
+
+class RateGovernor:
+    """进程内共享的外部接口限流器
+
+    以 (API Key, 接口) 为键，为每分钟请求数和估算令牌数各维护一个令牌桶，
+    同一 Key 的全部并发任务共用额度。每次外部调用前 acquire 等待额度，
+    收到实际用量后 settle 修正令牌桶，收到 429 时 penalize 按 Retry-After
+    暂停该 Key 在该接口上的全部调用，避免并发任务同时重试造成 429 风暴。
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]] = None):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._limiters: Dict[Tuple[str, str], _Limiter] = {}
+
+    def configure(self, endpoint: str, rpm: float = None, tpm: float = None):
+        """设置接口限额（已创建的限流器按新限额重建）"""
+        self.limits[endpoint] = {"rpm": rpm, "tpm": tpm}
+        for key in [k for k in self._limiters if k[1] == endpoint]:
+            del self._limiters[key]
+
+    def _key(self, api_key: str) -> str:
+        # 不在内存统计中保留明文密钥
+        return hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+
+    def _limiter(self, api_key: str, endpoint: str) -> _Limiter:
+        key = (self._key(api_key), endpoint)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = _Limiter(self.limits.get(endpoint))
+        return limiter
+
+    async def acquire(self, api_key: str, endpoint: str, tokens: int = 0) -> float:
+        """等待一次调用的额度（1 个请求 + 估算令牌数），返回等待秒数"""
+        limiter = self._limiter(api_key, endpoint)
+        now = time.monotonic()
+        wait = max(0.0, limiter.blocked_until - now)
+        if limiter.requests is not None:
+            wait = max(wait, limiter.requests.reserve(1, now))
+        if limiter.tokens is not None and tokens:
+            wait = max(wait, limiter.tokens.reserve(tokens, now))
+
+        stats = limiter.stats
+        if wait > 0:
+            stats["waiting"] += 1
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 调用被取消，归还预约的额度
+                if limiter.requests is not None:
+                    limiter.requests.adjust(1)
+                if limiter.tokens is not None and tokens:
+                    limiter.tokens.adjust(tokens)
+                raise
+            finally:
+                stats["waiting"] -= 1
+            stats["waited"] += 1
+            stats["wait_seconds"] += wait
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+        stats["requests"] += 1
+        stats["tokens"] += tokens
+        return wait
+
+    def settle(self, api_key: str, endpoint: str, estimated: int, actual: int):
+        """按接口返回的实际令牌数修正估算值"""
+        if not actual:
+            return
+        limiter = self._limiter(api_key, endpoint)
+        limiter.stats["tokens"] += actual - estimated
+        if limiter.tokens is not None:
+            limiter.tokens.adjust(estimated - actual)
+
+    def penalize(self, api_key: str, endpoint: str, retry_after: float = None):
+        """收到 429 后暂停该 Key 在该接口上的调用（默认 5 秒或按 Retry-After）"""
+        limiter = self._limiter(api_key, endpoint)
+        limiter.stats["throttled"] += 1
+        limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + (retry_after or 5.0))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各 Key/接口的限额、当前可用额度、排队数和等待时间"""
+        now = time.monotonic()
+        items = []
+        for (key, endpoint), limiter in self._limiters.items():
+            stats = limiter.stats
+            items.append({
+                "key": key,
+                "endpoint": endpoint,
+                "limits": limiter.limits,
+                "available_requests": round(limiter.requests.available(now), 2) if limiter.requests else None,
+                "available_tokens": round(limiter.tokens.available(now)) if limiter.tokens else None,
+                "blocked_seconds": round(max(0.0, limiter.blocked_until - now), 2),
+                "requests": stats["requests"],
+                "tokens": stats["tokens"],
+                "waiting": stats["waiting"],
+                "waited": stats["waited"],
+                "avg_wait_ms": round(stats["wait_seconds"] / stats["waited"] * 1000, 1) if stats["waited"] else 0.0,
+                "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 1),
+                "throttled": stats["throttled"]
+            })
+        return {"limits": self.limits, "keys": items}
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """解析 429 响应的 Retry-After 头（秒数）"""
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+# 进程内共享的限流器
+governor = RateGovernor()
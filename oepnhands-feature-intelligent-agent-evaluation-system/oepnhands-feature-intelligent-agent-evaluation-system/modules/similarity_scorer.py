@@ -1,45 +1,151 @@
 import aiohttp
 import json
 import os
-import jieba
-import numpy as np
-from openpyxl import load_workbook
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import Dict, List, Any
+import time
+from typing import Dict, List, Any, Tuple, Callable, Awaitable
 import asyncio
+from .executor import executor
+from .rate_limiter import governor, estimate_tokens, retry_after_seconds
+from .usage import token_usage
+from .metrics import metrics
+from .tracing import tracer, SPAN_KIND_CLIENT
+
+# 硅基流动接口地址，可通过环境变量指向代理或本地模拟服务（性能基准使用）
+SILICONFLOW_BASE_URL = os.environ.get("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1").rstrip("/")
+
+# jieba 前缀词典缓存文件，首次启动时构建，之后各工作进程和进程池子进程直接加载
+JIEBA_CACHE_FILE = os.path.join("cache", "jieba.cache")
+
+# 每次提交到进程池分词的答案行数，任务取消后最多再等待一个分块
+TOKENIZE_CHUNK_SIZE = 200
+
+def _jieba():
+    """首次使用时导入 jieba 并指定词典缓存文件（主进程和进程池子进程各执行一次）"""
+    import jieba
+    if jieba.dt.cache_file is None:
+        jieba.dt.cache_file = os.path.abspath(JIEBA_CACHE_FILE)
+        os.makedirs(os.path.dirname(jieba.dt.cache_file), exist_ok=True)
+    return jieba
+
+def prewarm_scoring() -> Dict[str, float]:
+    """预热评分依赖：加载 jieba 词典（缓存文件不存在时构建并写入）并导入 sklearn，返回各项耗时秒数"""
+    timings = {}
+    started = time.perf_counter()
+    _jieba().initialize()
+    timings["jieba"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    import sklearn.metrics.pairwise  # noqa: F401
+    timings["sklearn"] = round(time.perf_counter() - started, 3)
+    return timings
+
+def tokenize_pairs(pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """对 (标准答案, 生成答案) 分词，返回向量接口输入和Jaccard相似度（可在进程池中执行）"""
+    jieba = _jieba()
+    tokenized = []
+    for standard_text, generated_text in pairs:
+        tokens_std = jieba.lcut(standard_text)
+        tokens_gen = jieba.lcut(generated_text)
+        set_std = set(tokens_std)
+        set_gen = set(tokens_gen)
+        tokenized.append({
+            "standard_input": " ".join(tokens_std),
+            "generated_input": " ".join(tokens_gen),
+            "jaccard_similarity": len(set_std & set_gen) / len(set_std | set_gen) if set_std | set_gen else 0.0
+        })
+    return tokenized
+
+def read_answer_sheets(file_path: str) -> List[Dict[str, Any]]:
+    """读取每个工作表中标准答案和生成答案都存在的行（可在进程池中执行）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path)
+    sheets = []
+    for sheet_name in wb.sheetnames:
+        rows = []
+        # 从第2行开始遍历
+        for item_index, row in enumerate(wb[sheet_name].iter_rows(min_row=2, max_col=6, values_only=True)):
+            if row[1] and row[2]:  # 确保标准答案和生成答案都存在
+                rows.append((item_index, str(row[0]) if row[0] else "", str(row[1]), str(row[2])))
+        sheets.append({"name": sheet_name, "rows": rows})
+    return sheets
+
+def write_score_workbook(input_file_path: str, output_file_path: str, sheet_scores: Dict[str, Dict[int, Dict[str, float]]]):
+    """将评分写入输入文件的 D-F 列并另存（可在进程池中执行）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(input_file_path)
+    for sheet_name, row_scores in sheet_scores.items():
+        ws = wb[sheet_name]
+        
+        # 添加表头（如果不存在）
+        if ws.cell(row=1, column=4).value != "余弦相似度":
+            ws["D1"] = "余弦相似度"
+            ws["E1"] = "Jaccard相似度"
+            ws["F1"] = "综合相似度评分"
+        
+        for item_index, similarity in row_scores.items():
+            row = item_index + 2
+            ws.cell(row=row, column=4).value = similarity["cosine_similarity"]
+            ws.cell(row=row, column=5).value = similarity["jaccard_similarity"]
+            ws.cell(row=row, column=6).value = similarity["weighted_score"]
+    
+    wb.save(output_file_path)
 
 class SimilarityScorer:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, embedding_source: Callable[[str], Awaitable[List[float]]] = None):
+        """embedding_source 为可选的向量来源 (分词后的文本) -> 向量，设置后不调用向量接口（离线评估和基准测试使用）"""
         self.api_key = api_key
-        self.embed_url = "https://api.siliconflow.cn/v1/embeddings"
+        self.embedding_source = embedding_source
+        self.embed_url = f"{SILICONFLOW_BASE_URL}/embeddings"
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        # 最近一次 calculate_scores 的逐行评分，供结果入库使用
+        self.score_rows: List[Dict[str, Any]] = []
 
-    async def get_embedding(self, text: str, retries: int = 3) -> List[float]:
-        """获取文本向量"""
+    @tracer.traced("embedding", SPAN_KIND_CLIENT)
+    async def get_embedding(self, text: str, retries: int = 3, tokenized: str = None) -> List[float]:
+        """获取文本向量，tokenized 为已分词的输入时跳过分词"""
         if not isinstance(text, str) or not text.strip():
             return []
         
         payload = {
             "model": "Qwen/Qwen3-Embedding-0.6B",
-            "input": " ".join(jieba.lcut(text)),
+            "input": tokenized if tokenized is not None else " ".join(_jieba().lcut(text)),
             "encoding_format": "float"
         }
+        span = tracer.current_span()
+        span.set_attributes({"input.length": len(payload["input"]), "embedding.source": "local" if self.embedding_source else "api"})
+        if self.embedding_source is not None:
+            return await self.embedding_source(payload["input"])
         
+        estimated = estimate_tokens(payload["input"])
         for attempt in range(retries):
+            span.set_attribute("retry.count", attempt)
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(self.embed_url, json=payload, headers=self.headers, timeout=30) as response:
-                        response.raise_for_status()
-                        result = await response.json()
-                        embedding = result["data"][0]["embedding"]
-                        return embedding
+                await governor.acquire(self.api_key, "siliconflow/embeddings", estimated)
+                with metrics.outbound("siliconflow", "embeddings") as call:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.post(self.embed_url, json=payload, headers=self.headers, timeout=30) as response:
+                            call.status = response.status
+                            span.set_attribute("http.response.status_code", response.status)
+                            if response.status == 429:
+                                governor.penalize(self.api_key, "siliconflow/embeddings", retry_after_seconds(response.headers))
+                            response.raise_for_status()
+                            span.set_attribute("http.response.body.size", len(await response.read()))
+                            result = await response.json()
+                            embedding = result["data"][0]["embedding"]
+                            prompt_tokens, _ = token_usage.record("siliconflow", "embeddings", result.get("usage"), estimated)
+                            span.set_attribute("tokens.prompt", prompt_tokens)
+                            governor.settle(self.api_key, "siliconflow/embeddings", estimated, prompt_tokens)
+                            return embedding
             except Exception as e:
+                token_usage.record_error("siliconflow", "embeddings")
                 print(f"embedding 失败 (尝试 {attempt + 1}/{retries}): {e}")
                 if attempt < retries - 1:
                     await asyncio.sleep(1)  # 等待1秒后重试
+                else:
+                    span.set_error(e)
         
         return []
 
@@ -48,17 +154,34 @@ class SimilarityScorer:
         # 获取向量
         emb_std = await self.get_embedding(standard_text)
         emb_gen = await self.get_embedding(generated_text)
-        
-        # 余弦相似度
-        cosine_sim = 0.0
-        if emb_std and emb_gen and len(emb_std) == len(emb_gen):
-            cosine_sim = cosine_similarity([emb_std], [emb_gen])[0][0]
 
         # Jaccard相似度
+        jieba = _jieba()
         set_std = set(jieba.lcut(standard_text))
         set_gen = set(jieba.lcut(generated_text))
         jaccard_sim = len(set_std & set_gen) / len(set_std | set_gen) if set_std | set_gen else 0.0
 
+        return self._combine_scores(emb_std, emb_gen, jaccard_sim)
+
+    async def score_answers(self, standard_text: str, generated_texts: List[str]) -> List[Dict[str, float]]:
+        """为同一问题的多个回答评分：分词在进程池中执行，标准答案的向量只取一次，各回答的向量并发获取"""
+        tokenized = await executor.run_cpu(tokenize_pairs, [(standard_text, text) for text in generated_texts])
+        emb_std = await self.get_embedding(standard_text, tokenized=tokenized[0]["standard_input"])
+        embeddings = await asyncio.gather(*(
+            self.get_embedding(text, tokenized=tokens["generated_input"])
+            for text, tokens in zip(generated_texts, tokenized)
+        ))
+        return [self._combine_scores(emb_std, emb_gen, tokens["jaccard_similarity"])
+                for emb_gen, tokens in zip(embeddings, tokenized)]
+
+    def _combine_scores(self, emb_std: List[float], emb_gen: List[float], jaccard_sim: float) -> Dict[str, float]:
+        """由向量和Jaccard相似度得出三项评分"""
+        # 余弦相似度
+        cosine_sim = 0.0
+        if emb_std and emb_gen and len(emb_std) == len(emb_gen):
+            from sklearn.metrics.pairwise import cosine_similarity
+            cosine_sim = cosine_similarity([emb_std], [emb_gen])[0][0]
+
         # 综合相似度评分
         weighted_score = 0.7 * cosine_sim + 0.3 * jaccard_sim
 
@@ -68,64 +191,100 @@ class SimilarityScorer:
             "weighted_score": float(weighted_score)
         }
 
-    async def calculate_scores(self, input_file_path: str, output_file_path: str) -> Dict[str, Any]:
-        """计算Excel文件中所有答案的相似度评分"""
-        wb = load_workbook(input_file_path)
+    @tracer.traced("stage scoring")
+    @token_usage.stage("scoring")
+    async def calculate_scores(self, input_file_path: str, output_file_path: str, progress_callback: Callable[[int, int], None] = None,
+                               wait_if_paused: Callable[[], Awaitable[None]] = None,
+                               known_scores: Dict[str, Dict[int, Dict[str, float]]] = None) -> Dict[str, Any]:
+        """计算Excel文件中所有答案的相似度评分
+
+        工作簿读写和分词在进程池中执行，事件循环只负责向量接口调用。
+        progress_callback(已评分行数, 待评分总行数) 用于报告进度；wait_if_paused 在每行
+        评分之前调用，任务暂停时在此等待。known_scores 为已算好的评分 {工作表: {行号: 评分}}
+        （自适应评估在测试阶段算出），这些行不再调用向量接口。
+        """
+        started = time.perf_counter()
+        with tracer.span("workbook read", {"file.path": input_file_path}) as span:
+            sheets = await executor.run_cpu(read_answer_sheets, input_file_path)
+            total = sum(len(sheet["rows"]) for sheet in sheets)
+            span.set_attributes({"sheets": len(sheets), "rows": total})
+        tracer.current_span().set_attributes({"agents": len(sheets), "items.total": total})
+        done = 0
+        if progress_callback:
+            progress_callback(done, total)
         
         results = {}
+        sheet_scores = {}
+        self.score_rows = []
         
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            
-            # 添加表头（如果不存在）
-            if ws.cell(row=1, column=4).value != "余弦相似度":
-                ws["D1"] = "余弦相似度"
-                ws["E1"] = "Jaccard相似度"
-                ws["F1"] = "综合相似度评分"
+        for agent_order, sheet in enumerate(sheets):
+            sheet_name = sheet["name"]
+            rows = sheet["rows"]
+            with tracer.span("tokenize", {"agent.name": sheet_name, "rows": len(rows)}):
+                tokenized = await executor.run_cpu_chunked(tokenize_pairs, [(r[2], r[3]) for r in rows], TOKENIZE_CHUNK_SIZE)
             
             scores = []
-            row_count = 0
+            row_scores = {}
+            known = (known_scores or {}).get(sheet_name, {})
             
-            # 从第2行开始遍历
-            for row in ws.iter_rows(min_row=2, max_col=6, values_only=False):
-                if row[1].value and row[2].value:  # 确保标准答案和生成答案都存在
-                    standard_answer = str(row[1].value)
-                    generated_answer = str(row[2].value)
-                    
-                    # 计算相似度
-                    similarity = await self.calculate_similarity_scores(standard_answer, generated_answer)
-                    
-                    # 写入Excel
-                    row[3].value = similarity["cosine_similarity"]
-                    row[4].value = similarity["jaccard_similarity"]
-                    row[5].value = similarity["weighted_score"]
-                    
-                    scores.append(similarity["weighted_score"])
-                    row_count += 1
-                    
-                    # 添加延迟避免API限制
-                    await asyncio.sleep(0.1)
+            for (item_index, question, standard_answer, generated_answer), tokens in zip(rows, tokenized):
+                if wait_if_paused:
+                    await wait_if_paused()
+                # 计算相似度
+                with tracer.span("score row", {"agent.name": sheet_name, "row.index": item_index}) as span:
+                    similarity = known.get(item_index)
+                    if similarity is None:
+                        emb_std = await self.get_embedding(standard_answer, tokenized=tokens["standard_input"])
+                        emb_gen = await self.get_embedding(generated_answer, tokenized=tokens["generated_input"])
+                        similarity = self._combine_scores(emb_std, emb_gen, tokens["jaccard_similarity"])
+                    span.set_attributes({"weighted_score": similarity["weighted_score"], "score.reused": item_index in known})
+                
+                row_scores[item_index] = similarity
+                scores.append(similarity["weighted_score"])
+                
+                self.score_rows.append({
+                    "agent": sheet_name,
+                    "agent_order": agent_order,
+                    "item_index": item_index,
+                    "question": question,
+                    "standard_answer": standard_answer,
+                    "generated_answer": generated_answer,
+                    **similarity
+                })
+                done += 1
+                metrics.record_items("scoring")
+                token_usage.count_item()
+                if progress_callback:
+                    progress_callback(done, total)
+            
+            sheet_scores[sheet_name] = row_scores
             
             # 计算统计信息
             if scores:
+                import numpy as np
                 results[sheet_name] = {
-                    "count": row_count,
+                    "count": len(scores),
                     "mean_score": float(np.mean(scores)),
                     "max_score": float(np.max(scores)),
                     "min_score": float(np.min(scores)),
                     "std_score": float(np.std(scores))
                 }
             
-            print(f"已处理 {sheet_name} sheet，共 {row_count} 行数据")
+            print(f"已处理 {sheet_name} sheet，共 {len(scores)} 行数据")
         
         # 保存结果
-        wb.save(output_file_path)
+        with tracer.span("workbook save", {"file.path": output_file_path, "rows": total}) as span:
+            await executor.run_cpu(write_score_workbook, input_file_path, output_file_path, sheet_scores)
+            span.set_attribute("file.size", os.path.getsize(output_file_path))
         print(f"相似度评分结果已保存至 {output_file_path}")
+        metrics.observe_stage("scoring", time.perf_counter() - started)
         
         return results
 
     def analyze_scores(self, file_path: str) -> Dict[str, Any]:
         """分析已计算的相似度评分"""
+        import numpy as np
+        from openpyxl import load_workbook
         wb = load_workbook(file_path)
         analysis = {}
         
@@ -163,6 +322,7 @@ class SimilarityScorer:
 
     def get_detailed_results(self, file_path: str, sheet_name: str = None) -> List[Dict]:
         """获取详细的评分结果"""
+        from openpyxl import load_workbook
         wb = load_workbook(file_path)
         
         if sheet_name and sheet_name in wb.sheetnames:
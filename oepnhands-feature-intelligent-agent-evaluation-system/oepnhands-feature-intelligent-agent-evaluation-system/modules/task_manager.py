@@ -1,70 +1,375 @@
+import os
+import time
+import socket
 import asyncio
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, Optional
 from datetime import datetime
 import uuid
+from .metrics import metrics
+from .progress import TERMINAL_STATUSES
+
+class QueueFullError(Exception):
+    """等待队列已满"""
+
+    def __init__(self, depth: int, limit: int):
+        super().__init__(f"任务队列已满（{depth}/{limit}），请稍后重试")
+        self.depth = depth
+        self.limit = limit
+
+class TaskControl:
+    """运行中任务的协作控制
+
+    业务代码在每个工作项之前调用 wait_if_paused()，暂停时在此处等待，
+    已完成的工作项保留在内存中；取消通过取消 asyncio 任务实现，会中断
+    正在进行的网络请求和尚未开始的执行池作业。已在进程池中运行的作业无法中断，
+    会在后台执行完当前分块（见 TaskExecutor.run_cpu_chunked），任务本身立即结束。
+    """
 
-class TaskManager:
     def __init__(self):
-        self.running_tasks = {}
-        self.task_results = {}
-
-    async def create_task(self, task_type: str, task_func: Callable, *args, **kwargs) -> str:
-        """创建并启动任务"""
-        task_id = str(uuid.uuid4())
-        
-        # 创建任务
-        task = asyncio.create_task(self._run_task(task_id, task_func, *args, **kwargs))
-        
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self.cancel_requested = False
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def wait_if_paused(self):
+        """暂停时等待恢复"""
+        await self._resumed.wait()
+
+class TaskManager:
+    """基于 tasks 表的持久化任务队列
+
+    提交的任务以 pending 状态连同执行参数写入数据库，由固定大小的工作池按
+    优先级（高者优先）和提交顺序取出执行，并可限制每种任务类型的并发数。
+    等待中的任务超过 max_queue_depth 时拒绝新任务。
+
+    多个工作进程（或主机）可共用同一个任务存储：认领任务时写入 worker_id 和
+    租约到期时间，运行期间定期续期；进程退出或失去响应导致租约过期后，任务
+    由其他进程回收并重新排队。对其他进程持有的任务发起的取消、暂停和恢复
+    会登记为控制请求，由持有进程在下次心跳时执行。工作池大小和类型并发上限
+    按进程计算。存储对象需提供 claim_next_task、heartbeat、release_tasks、
+    requeue_interrupted_tasks、request_task_control、set_task_status_if 等
+    方法（见 modules/database.py），可替换为其他共享存储实现。
+    """
+
+    def __init__(self, db, max_workers: int = 4, type_limits: Dict[str, int] = None,
+                 max_queue_depth: int = 100, poll_interval: float = 5.0, broker=None,
+                 worker_id: str = None, lease_seconds: float = 30.0, heartbeat_interval: float = 2.0):
+        self.db = db
+        self.broker = broker
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.max_workers = max_workers
+        self.type_limits = dict(type_limits or {})
+        self.max_queue_depth = max_queue_depth
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, Callable] = {}
+        self.running_tasks: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def register(self, task_type: str, handler: Callable):
+        """注册任务类型的执行函数，执行时以 handler(task_id, **payload) 调用"""
+        self.handlers[task_type] = handler
+
+    async def start(self):
+        """回收租约过期的任务并启动调度循环和租约心跳"""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            return
+        self._wakeup = asyncio.Event()
+        requeued = await self.db.requeue_interrupted_tasks()
+        if requeued:
+            print(f"已恢复 {requeued} 个中断的任务")
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """停止调度，取消运行中的任务并释放租约（运行中的任务重新排队，由其他进程或下次启动时执行）"""
+        for attr in ("_dispatcher", "_heartbeat"):
+            loop_task = getattr(self, attr)
+            if loop_task is not None:
+                loop_task.cancel()
+                try:
+                    await loop_task
+                except asyncio.CancelledError:
+                    pass
+                setattr(self, attr, None)
+        tasks = [info["task"] for info in self.running_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.db.release_tasks(self.worker_id)
+        except Exception as e:
+            print(f"释放任务租约失败: {e}")
+
+    async def create_task(self, task_type: str, parameters: Dict = None, payload: Dict = None,
+                          priority: int = 0, task_id: str = None) -> str:
+        """提交任务到队列，队列已满时抛出 QueueFullError"""
+        if task_type not in self.handlers:
+            raise ValueError(f"未注册的任务类型: {task_type}")
+        depth = await self.db.count_tasks_by_status("pending")
+        if depth >= self.max_queue_depth:
+            raise QueueFullError(depth, self.max_queue_depth)
+
+        task_id = task_id or str(uuid.uuid4())
+        await self.db.create_task(task_id, task_type, "pending", parameters, priority, payload or {})
+        self._notify()
+        return task_id
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _active_tasks(self) -> Dict[str, Dict[str, Any]]:
+        """占用工作槽位的任务（已暂停的任务不占用槽位）"""
+        return {task_id: info for task_id, info in self.running_tasks.items() if not info["control"].paused}
+
+    def _saturated_types(self) -> list:
+        """已达到并发上限的任务类型"""
+        counts: Dict[str, int] = {}
+        for info in self._active_tasks().values():
+            counts[info["type"]] = counts.get(info["type"], 0) + 1
+        return [t for t, limit in self.type_limits.items() if counts.get(t, 0) >= limit]
+
+    async def _resume_waiting(self):
+        """优先为请求恢复的暂停任务分配工作槽位"""
+        for task_id, info in list(self.running_tasks.items()):
+            if not (info["control"].paused and info.get("resume_requested")):
+                continue
+            if len(self._active_tasks()) >= self.max_workers or info["type"] in self._saturated_types():
+                continue
+            info["resume_requested"] = False
+            info["status"] = "running"
+            info["control"].resume()
+            await self.db.set_task_status_if(task_id, ["paused"], "running", self.worker_id)
+            self._publish(task_id, info["type"], "running")
+
+    def _publish(self, task_id: str, task_type: str, status: str):
+        if self.broker is not None:
+            self.broker.publish(task_id, {"type": task_type, "status": status})
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._resume_waiting()
+                while len(self._active_tasks()) < self.max_workers:
+                    claimed = await self.db.claim_next_task(
+                        self._saturated_types(), self.worker_id, self.lease_seconds
+                    )
+                    if claimed is None:
+                        break
+                    self._start(claimed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"任务调度失败: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat_loop(self):
+        """续期租约、执行其他进程转交的控制请求，并回收其他进程遗留的过期任务"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                beat = await self.db.heartbeat(self.worker_id, self.lease_seconds)
+                for task_id, info in list(self.running_tasks.items()):
+                    if task_id not in beat["owned"] and not info["control"].cancel_requested:
+                        # 执行函数已记录最终状态、仍在保存用量/分析/追踪等收尾工作的任务不算失效
+                        task = await self.db.get_task(task_id)
+                        if task is not None and task["status"] in TERMINAL_STATUSES:
+                            continue
+                        # 租约已被其他进程回收（本进程曾长时间无响应），停止本地执行避免重复运行
+                        print(f"任务 {task_id} 的租约已失效，停止本地执行")
+                        info["task"].cancel()
+                for task_id, action in beat["controls"]:
+                    await self._apply_control(task_id, action)
+                await self.db.requeue_interrupted_tasks()
+                if len(self._active_tasks()) < self.max_workers:
+                    # 其他进程提交的任务不会唤醒本进程，有空闲槽位时在心跳中检查一次队列
+                    self._notify()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"任务租约续期失败: {e}")
+
+    async def _apply_control(self, task_id: str, action: str):
+        if action == "cancel":
+            await self.cancel_task(task_id)
+        elif action == "pause":
+            await self.pause_task(task_id)
+        elif action == "resume":
+            await self.resume_task(task_id)
+
+    def _start(self, claimed: Dict[str, Any]):
+        task_id = claimed["id"]
+        task = asyncio.create_task(self._run_task(task_id, claimed["type"], claimed["payload"]))
         self.running_tasks[task_id] = {
             "task": task,
-            "type": task_type,
+            "control": TaskControl(),
+            "type": claimed["type"],
             "status": "running",
             "created_at": datetime.now(),
             "progress": 0
         }
-        
-        return task_id
+        self._publish(task_id, claimed["type"], "running")
 
-    async def _run_task(self, task_id: str, task_func: Callable, *args, **kwargs):
+    async def _run_task(self, task_id: str, task_type: str, payload: Optional[Dict]):
         """运行任务的内部方法"""
+        started = time.perf_counter()
         try:
-            result = await task_func(*args, **kwargs)
-            self.running_tasks[task_id]["status"] = "completed"
-            self.task_results[task_id] = {"status": "success", "result": result}
+            handler = self.handlers.get(task_type)
+            if handler is None or payload is None:
+                await self.db.update_task_status(task_id, "failed", {"error": "任务缺少执行参数或类型未注册"})
+                return
+            await handler(task_id, **payload)
+        except asyncio.CancelledError:
+            info = self.running_tasks.get(task_id)
+            if info is None or not info["control"].cancel_requested:
+                # 服务关闭导致的取消，任务保持运行中状态以便重启后重新排队
+                raise
+            # 用户取消：执行函数未记录部分结果时在此标记为已取消
+            await self.db.set_task_status_if(task_id, ["running", "paused"], "cancelled", self.worker_id)
         except Exception as e:
-            self.running_tasks[task_id]["status"] = "failed"
-            self.task_results[task_id] = {"status": "error", "error": str(e)}
+            await self.db.update_task_status(task_id, "failed", {"error": str(e)})
         finally:
-            # 清理运行中的任务
-            if task_id in self.running_tasks:
-                del self.running_tasks[task_id]
+            # 释放工作槽位并唤醒调度
+            self.running_tasks.pop(task_id, None)
+            self._notify()
+            await self._publish_final(task_id, task_type, time.perf_counter() - started)
+
+    async def _publish_final(self, task_id: str, task_type: str, elapsed: float):
+        """任务结束后按最终状态记录耗时并推送"""
+        try:
+            task = await self.db.get_task(task_id)
+        except Exception:
+            task = None
+        status = task["status"] if task else "failed"
+        if status in ("pending", "running", "paused"):
+            # 服务关闭或租约失效时被中断，任务已重新排队
+            status = "interrupted"
+        metrics.task_duration.observe(elapsed, type=task_type, outcome=status)
+        if self.broker is not None:
+            self.broker.publish(task_id, {"type": task_type, "status": status})
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        """获取任务状态"""
-        if task_id in self.running_tasks:
-            return self.running_tasks[task_id]
-        elif task_id in self.task_results:
-            return self.task_results[task_id]
-        else:
-            return {"status": "not_found"}
-
-    def cancel_task(self, task_id: str) -> bool:
-        """取消任务"""
+        """获取运行中任务的状态"""
         if task_id in self.running_tasks:
-            task = self.running_tasks[task_id]["task"]
-            task.cancel()
-            self.running_tasks[task_id]["status"] = "cancelled"
-            return True
-        return False
+            info = self.running_tasks[task_id]
+            return {k: v for k, v in info.items() if k not in ("task", "control")}
+        return {"status": "not_found"}
+
+    def get_control(self, task_id: str) -> TaskControl:
+        """获取任务的协作控制对象（任务不在本进程运行时返回一个不会暂停的控制对象）"""
+        info = self.running_tasks.get(task_id)
+        return info["control"] if info else TaskControl()
+
+    def is_cancel_requested(self, task_id: str) -> bool:
+        """任务是否被用户取消（区别于服务关闭导致的取消）"""
+        info = self.running_tasks.get(task_id)
+        return bool(info and info["control"].cancel_requested)
+
+    async def cancel_task(self, task_id: str) -> Optional[str]:
+        """取消任务：等待中或已暂停排队的任务直接标记取消，运行中的任务中断执行并释放工作槽位
+
+        返回操作后的状态，由其他进程持有的任务返回 cancel_requested，无法取消时返回 None。
+        """
+        info = self.running_tasks.get(task_id)
+        if info is not None:
+            info["control"].cancel_requested = True
+            info["status"] = "cancelled"
+            info["task"].cancel()
+            return "cancelled"
+        if await self.db.set_task_status_if(task_id, ["pending", "paused"], "cancelled"):
+            self._publish(task_id, None, "cancelled")
+            return "cancelled"
+        if await self.db.request_task_control(task_id, "cancel", ["running", "paused"]):
+            return "cancel_requested"
+        return None
+
+    async def cancel_and_wait(self, task_id: str) -> Optional[str]:
+        """取消任务并等待本进程中的执行函数结束（删除任务前调用）
+
+        执行函数在取消时仍会保存已完成部分的结果，等待其结束后再删除，避免留下不属于任何任务的记录。
+        返回值同 cancel_task()。
+        """
+        info = self.running_tasks.get(task_id)
+        status = await self.cancel_task(task_id)
+        if info is not None:
+            await asyncio.wait({info["task"]})
+        return status
+
+    async def pause_task(self, task_id: str) -> Optional[str]:
+        """暂停任务：运行中的任务在下一个工作项前停下并让出工作槽位，等待中的任务暂不调度"""
+        info = self.running_tasks.get(task_id)
+        if info is not None:
+            if info["control"].paused or info["control"].cancel_requested:
+                return None
+            info["control"].pause()
+            info["status"] = "paused"
+            await self.db.set_task_status_if(task_id, ["running"], "paused", self.worker_id)
+            self._publish(task_id, info["type"], "paused")
+            self._notify()
+            return "paused"
+        if await self.db.set_task_status_if(task_id, ["pending"], "paused"):
+            self._publish(task_id, None, "paused")
+            return "paused"
+        if await self.db.request_task_control(task_id, "pause", ["running"]):
+            return "pause_requested"
+        return None
+
+    async def resume_task(self, task_id: str) -> Optional[str]:
+        """恢复已暂停的任务，运行中暂停的任务在有空闲工作槽位时继续（没有空闲槽位时仍返回 paused）"""
+        info = self.running_tasks.get(task_id)
+        if info is not None:
+            if not info["control"].paused:
+                return None
+            info["resume_requested"] = True
+            await self._resume_waiting()
+            return info["status"]
+        if await self.db.set_task_status_if(task_id, ["paused"], "pending"):
+            self._publish(task_id, None, "pending")
+            self._notify()
+            return "pending"
+        if await self.db.request_task_control(task_id, "resume", ["paused"]):
+            return "resume_requested"
+        return None
 
     def get_all_tasks(self) -> Dict[str, Dict[str, Any]]:
-        """获取所有任务状态"""
-        all_tasks = {}
-        all_tasks.update(self.running_tasks)
-        all_tasks.update(self.task_results)
-        return all_tasks
+        """获取所有运行中任务的状态"""
+        return {task_id: self.get_task_status(task_id) for task_id in self.running_tasks}
 
     def update_task_progress(self, task_id: str, progress: int):
         """更新任务进度"""
         if task_id in self.running_tasks:
-            self.running_tasks[task_id]["progress"] = progress
\ No newline at end of file
+            self.running_tasks[task_id]["progress"] = progress
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取队列和工作池状态"""
+        running_by_type: Dict[str, int] = {}
+        active = self._active_tasks()
+        for info in active.values():
+            running_by_type[info["type"]] = running_by_type.get(info["type"], 0) + 1
+        return {
+            "worker_id": self.worker_id,
+            "queue_depth": await self.db.count_tasks_by_status("pending"),
+            "max_queue_depth": self.max_queue_depth,
+            "running": len(active),
+            "paused": len(self.running_tasks) - len(active),
+            "max_workers": self.max_workers,
+            "running_by_type": running_by_type,
+            "type_limits": self.type_limits
+        }
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import functools
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Any, Optional, Callable
+
+# 与 OpenTelemetry 一致的 span 类型和状态码
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 每累计多少个已结束的 span 追加写入一次文件
+FLUSH_SPANS = 256
+# 单个任务最多记录的 span 数，超出后只计数不再写入
+MAX_SPANS_PER_TRACE = 500000
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# 单线程写入，保证同一文件的追加顺序
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-writer")
+
+def _encode_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _decode_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("boolValue", "doubleValue", "stringValue"):
+        if key in value:
+            return value[key]
+    return None
+
+def _append_batch(path: str, resource: Dict[str, Any], spans: List["Span"]):
+    """在写入线程中转换、序列化并追加一批已结束的 span，不占用事件循环"""
+    line = json.dumps({"resourceSpans": [{
+        "resource": resource,
+        "scopeSpans": [{"scope": {"name": "agent-eval"}, "spans": [span.to_otlp() for span in spans]}]
+    }]}, ensure_ascii=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+class Span:
+    """一段计时的操作，结束时交给所属追踪写入文件"""
+
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_id", "attributes", "status",
+                 "message", "start_ns", "_started", "duration_ns", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any] = None,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else ""
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = None
+        self.message = None
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self.duration_ns = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_error(self, error: Any):
+        self.status = STATUS_ERROR
+        self.message = str(error) or type(error).__name__
+
+    def end(self):
+        if self.duration_ns is None:
+            self.duration_ns = time.perf_counter_ns() - self._started
+            self.trace.record(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.status is None:
+            if issubclass(exc_type, asyncio.CancelledError):
+                self.set_attribute("cancelled", True)
+            else:
+                self.set_error(exc)
+        self.end()
+        _current_span.reset(self._token)
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + self.duration_ns),
+            "attributes": [{"key": k, "value": _encode_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": self.status or STATUS_OK}
+        }
+        if self.message:
+            span["status"]["message"] = self.message
+        return span
+
+class _NoopSpan:
+    """没有进行中的追踪时使用，所有操作都不做任何事"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def set_error(self, error: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """一个任务的追踪：已结束的 span 分批追加到 JSONL 文件
+
+    每行是一个 OTLP/JSON 的 ExportTraceServiceRequest（resourceSpans → scopeSpans → spans），
+    可由 OpenTelemetry Collector 的 otlpjsonfile 接收器直接读取。
+    """
+
+    def __init__(self, trace_id: str, path: str, resource: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.path = path
+        self.resource = {"attributes": [{"key": k, "value": _encode_value(v)} for k, v in resource.items()]}
+        self.span_count = 0
+        self.dropped = 0
+        self._buffer: List[Span] = []
+        self._last_write: Optional[Future] = None
+
+    def record(self, span: Span):
+        if self.span_count >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return
+        self.span_count += 1
+        self._buffer.append(span)
+        if len(self._buffer) >= FLUSH_SPANS:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的 span 交给写入线程"""
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        self._last_write = _writer.submit(_append_batch, self.path, self.resource, spans)
+
+    async def wait_written(self):
+        """写入已缓冲的 span 并等待文件写完"""
+        self.flush()
+        if self._last_write is not None:
+            await asyncio.wrap_future(self._last_write)
+
+class Tracer:
+    """任务级追踪
+
+    任务执行函数在 tracer.trace() 中运行，其中的各层调用用 tracer.span() 或 @traced 记录子 span，
+    父子关系通过 contextvars 传递（含任务内创建的子任务）。不在任务中时 span() 返回空操作对象，
+    只有一次上下文变量读取的开销。
+    """
+
+    def __init__(self, output_dir: str = "outputs", service_name: str = "agent-eval", enabled: bool = None):
+        self.output_dir = output_dir
+        self.service_name = service_name
+        self.enabled = os.environ.get("TASK_TRACING", "1") != "0" if enabled is None else enabled
+        self.active: Dict[str, Trace] = {}
+
+    def trace_path(self, task_id: str) -> str:
+        return os.path.join(self.output_dir, f"trace_{task_id}.jsonl")
+
+    def start_trace(self, task_id: str, name: str, attributes: Dict[str, Any] = None,
+                    resource: Dict[str, Any] = None) -> Optional[Span]:
+        """开始任务的追踪并返回根 span（需用 with 进入），未启用时返回 None"""
+        if not self.enabled:
+            return None
+        trace = Trace(task_id.replace("-", "").ljust(32, "0")[:32], self.trace_path(task_id),
+                      {"service.name": self.service_name, **(resource or {})})
+        self.active[task_id] = trace
+        return Span(trace, name, None, attributes)
+
+    async def finish_trace(self, task_id: str) -> Optional[str]:
+        """任务结束后写完全部 span，返回追踪文件路径"""
+        trace = self.active.pop(task_id, None)
+        if trace is None:
+            return None
+        await trace.wait_written()
+        return trace.path
+
+    async def flush(self, task_id: str):
+        """运行中的任务：把已结束的 span 写入文件，便于查询"""
+        trace = self.active.get(task_id)
+        if trace is not None:
+            await trace.wait_written()
+
+    def span(self, name: str, attributes: Dict[str, Any] = None, kind: int = SPAN_KIND_INTERNAL):
+        """在当前 span 下创建子 span（with 使用）"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(parent.trace, name, parent, attributes, kind)
+
+    def current_span(self):
+        """当前的 span，没有时返回空操作对象"""
+        return _current_span.get() or NOOP_SPAN
+
+    def traced(self, name: str, kind: int = SPAN_KIND_INTERNAL) -> Callable:
+        """协程装饰器：整个调用记录为一个 span，函数内可通过 current_span() 补充属性"""
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with self.span(name, kind=kind):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+def read_slowest_spans(path: str, limit: int = 20, name: str = None) -> Dict[str, Any]:
+    """从追踪文件中找出耗时最长的 span，附带其祖先路径（可在线程池中执行）"""
+    parents: Dict[str, tuple] = {}
+    heap: List[tuple] = []
+    total = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        total += 1
+                        parents[span["spanId"]] = (span.get("parentSpanId", ""), span["name"])
+                        if name and span["name"] != name:
+                            continue
+                        duration = int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+                        item = (duration, total, span)
+                        if len(heap) < limit:
+                            heapq.heappush(heap, item)
+                        elif duration > heap[0][0]:
+                            heapq.heapreplace(heap, item)
+
+    slowest = []
+    for duration, _, span in sorted(heap, key=lambda item: item[0], reverse=True):
+        path_names = []
+        parent_id = span.get("parentSpanId", "")
+        while parent_id and parent_id in parents and len(path_names) < 32:
+            parent_id, parent_name = parents[parent_id]
+            path_names.append(parent_name)
+        slowest.append({
+            "name": span["name"],
+            "span_id": span["spanId"],
+            "parent_span_id": span.get("parentSpanId", ""),
+            "path": list(reversed(path_names)),
+            "start_time": int(span["startTimeUnixNano"]) / 1e9,
+            "duration_ms": round(duration / 1e6, 3),
+            "status": "error" if span.get("status", {}).get("code") == STATUS_ERROR else "ok",
+            "message": span.get("status", {}).get("message"),
+            "attributes": {a["key"]: _decode_value(a["value"]) for a in span.get("attributes", [])}
+        })
+    return {"span_count": total, "spans": slowest}
+
+# 全局追踪器
+tracer = Tracer()
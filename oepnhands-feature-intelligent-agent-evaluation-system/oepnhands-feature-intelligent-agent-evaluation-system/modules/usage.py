@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import functools
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Callable
+
+from .metrics import metrics
+
+# 没有接口返回价格时按此单价计算费用（每百万令牌），格式：
+# {"siliconflow/chat": {"prompt": 2.0, "completion": 8.0, "currency": "CNY"}}
+# 键为 "服务/目标"，也可只写服务名；Dify 响应自带 total_price 时优先使用响应中的价格
+TOKEN_PRICES: Dict[str, Dict[str, Any]] = json.loads(os.environ.get("TOKEN_PRICES", "{}") or "{}")
+
+_current_meter: ContextVar[Optional["UsageMeter"]] = ContextVar("usage_meter", default=None)
+_current_stage: ContextVar[str] = ContextVar("usage_stage", default="other")
+
+def _empty_entry() -> Dict[str, Any]:
+    return {"calls": 0, "errors": 0, "estimated_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "total_tokens": 0, "cost": {}}
+
+def _add(entry: Dict[str, Any], prompt: int, completion: int, cost: Optional[tuple], error: bool, estimated: bool):
+    entry["calls"] += 1
+    entry["errors"] += error
+    entry["estimated_calls"] += estimated
+    entry["prompt_tokens"] += prompt
+    entry["completion_tokens"] += completion
+    entry["total_tokens"] += prompt + completion
+    if cost:
+        currency, amount = cost
+        entry["cost"][currency] = entry["cost"].get(currency, 0.0) + amount
+
+def _rates(entry: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+    return dict(entry,
+                cost={currency: round(amount, 6) for currency, amount in entry["cost"].items()},
+                seconds=round(seconds, 3),
+                tokens_per_second=round(entry["total_tokens"] / seconds, 2) if seconds > 0 else 0.0,
+                requests_per_second=round(entry["calls"] / seconds, 3) if seconds > 0 else 0.0)
+
+def parse_usage(usage: Optional[Dict[str, Any]], estimated_prompt: int) -> tuple:
+    """从响应的 usage 块取出 (prompt, completion, 是否估算)
+
+    SiliconFlow 的对话接口和 Dify 的 metadata.usage 都给出 prompt/completion，
+    向量接口只有 prompt_tokens 和 total_tokens；没有 usage 时按输入估算提示令牌数。
+    """
+    if not usage:
+        return estimated_prompt, 0, True
+    completion = int(usage.get("completion_tokens") or 0)
+    prompt = usage.get("prompt_tokens")
+    if prompt is None:
+        total = usage.get("total_tokens")
+        if total is None:
+            return estimated_prompt, completion, True
+        prompt = int(total) - completion
+    return int(prompt), completion, False
+
+def price_call(service: str, target: str, usage: Optional[Dict[str, Any]], prompt: int, completion: int) -> Optional[tuple]:
+    """单次调用的费用 (币种, 金额)：优先使用响应中的 total_price，否则按 TOKEN_PRICES 计算"""
+    if usage and usage.get("total_price") not in (None, ""):
+        return usage.get("currency") or "USD", float(usage["total_price"])
+    price = TOKEN_PRICES.get(f"{service}/{target}") or TOKEN_PRICES.get(service)
+    if not price:
+        return None
+    amount = (prompt * float(price.get("prompt", 0)) + completion * float(price.get("completion", 0))) / 1_000_000
+    return price.get("currency", "CNY"), amount
+
+class UsageMeter:
+    """单个任务的令牌用量
+
+    按阶段（generation/testing/scoring）、智能体和接口分别汇总调用次数、提示和生成令牌数
+    及费用，并由各阶段耗时计算令牌/秒和请求/秒。设置预算后，累计令牌数达到预算时
+    调用一次 on_exceeded（由任务管理器停止任务，已完成的部分照常保存）。
+    """
+
+    def __init__(self, task_id: str, budget: int = None, on_exceeded: Callable[[], Any] = None):
+        self.task_id = task_id
+        self.budget = budget if budget and budget > 0 else None
+        self.on_exceeded = on_exceeded
+        self.exceeded = False
+        self.totals = _empty_entry()
+        self.by_stage: Dict[str, Dict[str, Any]] = {}
+        self.by_agent: Dict[str, Dict[str, Any]] = {}
+        self.by_endpoint: Dict[str, Dict[str, Any]] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.items: Dict[str, int] = {}
+        self._started = time.perf_counter()
+        self._stopping = None
+        self._token = None
+
+    def record(self, stage: str, service: str, target: str, prompt: int, completion: int,
+               cost: Optional[tuple] = None, error: bool = False, estimated: bool = False):
+        _add(self.totals, prompt, completion, cost, error, estimated)
+        _add(self.by_stage.setdefault(stage, _empty_entry()), prompt, completion, cost, error, estimated)
+        if service == "dify":
+            _add(self.by_agent.setdefault(target, _empty_entry()), prompt, completion, cost, error, estimated)
+        else:
+            _add(self.by_endpoint.setdefault(f"{service}/{target}", _empty_entry()), prompt, completion, cost, error, estimated)
+        if self.budget and not self.exceeded and self.totals["total_tokens"] >= self.budget:
+            self.exceeded = True
+            print(f"任务 {self.task_id} 的令牌用量 {self.totals['total_tokens']} 已达到预算 {self.budget}，停止执行")
+            if self.on_exceeded is not None:
+                self._stopping = self.on_exceeded()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def rates(self) -> Dict[str, float]:
+        """整个任务的令牌/秒和请求/秒（用于进度事件）"""
+        seconds = self.elapsed()
+        return {
+            "total_tokens": self.totals["total_tokens"],
+            "tokens_per_second": round(self.totals["total_tokens"] / seconds, 2) if seconds > 0 else 0.0,
+            "requests_per_second": round(self.totals["calls"] / seconds, 3) if seconds > 0 else 0.0
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """用量报告：总计、按阶段（含每个工作项的平均令牌和费用）、按智能体、按接口"""
+        elapsed = self.elapsed()
+        stages = {}
+        for stage, entry in self.by_stage.items():
+            seconds = self.stage_seconds.get(stage, elapsed)
+            items = self.items.get(stage, 0)
+            stages[stage] = dict(_rates(entry, seconds), items=items,
+                                 tokens_per_item=round(entry["total_tokens"] / items, 2) if items else None,
+                                 cost_per_item={c: round(a / items, 6) for c, a in entry["cost"].items()} if items else {})
+        return {
+            **_rates(self.totals, elapsed),
+            "budget_tokens": self.budget,
+            "budget_exceeded": self.exceeded,
+            "by_stage": stages,
+            "by_agent": {name: _rates(entry, self.stage_seconds.get("testing", elapsed)) for name, entry in self.by_agent.items()},
+            "by_endpoint": {name: _rates(entry, elapsed) for name, entry in self.by_endpoint.items()}
+        }
+
+class UsageTracker:
+    """任务级令牌用量统计
+
+    任务执行函数在 start() 返回的用量表下运行，外部接口调用通过 record() 记录用量，
+    所属任务和阶段由 contextvars 传递，调用方无需传参；不在任务中时只更新进程级指标。
+    """
+
+    def __init__(self):
+        self.active: Dict[str, UsageMeter] = {}
+
+    def start(self, task_id: str, budget: int = None, on_exceeded: Callable[[], Any] = None) -> UsageMeter:
+        """在任务内调用，开始统计；返回的用量表需在任务结束时交给 finish()"""
+        meter = UsageMeter(task_id, budget, on_exceeded)
+        self.active[task_id] = meter
+        meter._token = _current_meter.set(meter)
+        return meter
+
+    def finish(self, meter: UsageMeter) -> Dict[str, Any]:
+        """结束统计并返回用量报告"""
+        self.active.pop(meter.task_id, None)
+        _current_meter.reset(meter._token)
+        return meter.summary()
+
+    def get(self, task_id: str) -> Optional[UsageMeter]:
+        return self.active.get(task_id)
+
+    def record(self, service: str, target: str, usage: Optional[Dict[str, Any]], estimated_prompt: int = 0) -> tuple:
+        """记录一次成功调用的用量，返回 (prompt, completion) 供追踪属性使用"""
+        prompt, completion, estimated = parse_usage(usage, estimated_prompt)
+        metrics.record_tokens(service, target, prompt, completion)
+        meter = _current_meter.get()
+        if meter is not None:
+            cost = price_call(service, target, usage, prompt, completion)
+            meter.record(_current_stage.get(), service, target, prompt, completion, cost, estimated=estimated)
+        return prompt, completion
+
+    def record_error(self, service: str, target: str):
+        """记录一次失败的调用（没有用量信息）"""
+        meter = _current_meter.get()
+        if meter is not None:
+            meter.record(_current_stage.get(), service, target, 0, 0, error=True)
+
+    def count_item(self):
+        """当前阶段完成一个工作项（段落、问题、评分行），用于计算每项的平均用量"""
+        meter = _current_meter.get()
+        if meter is not None:
+            stage = _current_stage.get()
+            meter.items[stage] = meter.items.get(stage, 0) + 1
+
+    def stage(self, name: str) -> Callable:
+        """协程装饰器：函数内的调用计入该阶段，并累计阶段耗时"""
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                meter = _current_meter.get()
+                if meter is None:
+                    return await func(*args, **kwargs)
+                token = _current_stage.set(name)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    meter.stage_seconds[name] = meter.stage_seconds.get(name, 0.0) + time.perf_counter() - started
+                    _current_stage.reset(token)
+            return wrapper
+        return decorate
+
+# 全局用量统计
+token_usage = UsageTracker()
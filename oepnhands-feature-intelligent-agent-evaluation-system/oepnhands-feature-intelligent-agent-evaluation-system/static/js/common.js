@@ -260,7 +260,7 @@ class FileUpload {
     }
 }
 
-// 任务状态轮询
+// 任务状态跟踪：优先订阅服务端推送的进度事件（SSE），不支持或连接断开时回退为轮询
 class TaskPoller {
     constructor(taskId, onUpdate, onComplete, interval = 2000) {
         this.taskId = taskId;
@@ -268,22 +268,66 @@ class TaskPoller {
         this.onComplete = onComplete;
         this.interval = interval;
         this.polling = false;
+        this.source = null;
     }
 
     start() {
         if (this.polling) return;
         
         this.polling = true;
-        this.poll();
+        if (window.EventSource) {
+            this.listen();
+        } else {
+            this.poll();
+        }
     }
 
     stop() {
         this.polling = false;
+        this.closeStream();
         if (this.timeoutId) {
             clearTimeout(this.timeoutId);
         }
     }
 
+    listen() {
+        this.source = new EventSource(`/api/tasks/${this.taskId}/events`);
+        
+        this.source.addEventListener('progress', (e) => {
+            const event = JSON.parse(e.data);
+            
+            if (['completed', 'failed', 'cancelled'].includes(event.status)) {
+                // 任务结束后读取一次完整结果
+                this.closeStream();
+                this.poll();
+                return;
+            }
+            
+            if (this.onUpdate) {
+                this.onUpdate({
+                    id: this.taskId,
+                    status: event.status,
+                    result: event.stage ? { step: event.stage } : {},
+                    progress: event
+                });
+            }
+        });
+        
+        this.source.onerror = () => {
+            this.closeStream();
+            if (this.polling) {
+                this.timeoutId = setTimeout(() => this.poll(), this.interval);
+            }
+        };
+    }
+
+    closeStream() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+
     async poll() {
         if (!this.polling) return;
 
@@ -294,7 +338,7 @@ class TaskPoller {
                 this.onUpdate(task);
             }
 
-            if (task.status === 'completed' || task.status === 'failed') {
+            if (['completed', 'failed', 'cancelled'].includes(task.status)) {
                 this.polling = false;
                 if (this.onComplete) {
                     this.onComplete(task);
@@ -384,6 +428,18 @@ const Utils = {
         return date.toLocaleString('zh-CN');
     },
 
+    // 格式化推送的进度事件，如 "测试智能体 12/40 · 1.5 条/秒 · 剩余约 19 秒"
+    formatProgress(progress) {
+        const parts = [];
+        if (progress.stage) parts.push(progress.stage);
+        if (progress.total) parts.push(`${progress.done}/${progress.total}`);
+        if (progress.throughput) parts.push(`${progress.throughput.toFixed(2)} 条/秒`);
+        if (progress.eta_seconds !== null && progress.eta_seconds !== undefined) {
+            parts.push(`剩余约 ${Math.round(progress.eta_seconds)} 秒`);
+        }
+        return parts.join(' · ');
+    },
+
     // 防抖函数
     debounce(func, wait) {
         let timeout;